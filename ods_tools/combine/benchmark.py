@@ -0,0 +1,195 @@
+"""
+Benchmark harness for combine.
+
+Generates synthetic ORD analyses at a configurable scale, runs `combine()` on them and records the
+wall time, CPU time, peak RSS and throughput of each stage from the combine run report. A benchmark
+report can be compared against a baseline report to catch regressions, e.g.
+
+    python -m ods_tools.combine.benchmark --work-dir /tmp/bench --num-events 100000 --num-periods 10000 \\
+        --report bench.json --baseline baseline.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+from ods_tools.combine.combine import combine
+from ods_tools.combine.common import DEFAULT_CONFIG
+from ods_tools.combine.profiling import RUN_REPORT_FILE
+from ods_tools.combine.synthetic import SyntheticORDConfig, generate_synthetic_ord
+from ods_tools.oed.common import OdsException
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_METRICS = ['wall_time', 'cpu_time', 'peak_rss_delta_mb']
+
+
+def _run_combine(config):
+    combine(**config)
+
+
+def _run_isolated(target, *args):
+    process = multiprocessing.get_context('spawn').Process(target=target, args=args)
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise OdsException(f'Benchmark {target.__name__} failed with exit code {process.exitcode}')
+
+
+def run_benchmark(work_dir, ord_config=None, combine_config=None, isolate=True):
+    '''
+    Generate synthetic ORD analyses in `work_dir` and benchmark a combine run on them.
+
+    Args:
+        work_dir (str | pathlib.Path): directory for the synthetic analyses and combine outputs.
+        ord_config (SyntheticORDConfig): scale of the synthetic analyses.
+        combine_config (dict): combine config overrides, defaults to mean and secondary uncertainty
+            loss sampling with ALT and EPT outputs.
+        isolate (bool): generate the analyses and run combine in fresh processes so the peak RSS of the
+            combine run is not inflated by the data generation. The peak RSS still includes the
+            memory of the benchmark process, which is inherited by the combine process on Linux.
+
+    Returns:
+        report (dict): benchmark report with the ORD and combine configs and the metrics of each stage.
+    '''
+    work_dir = Path(work_dir)
+    ord_config = SyntheticORDConfig() if ord_config is None else ord_config
+
+    logger.info(f'Generating synthetic ORD in {work_dir}')
+    start = time.perf_counter()
+    if isolate:
+        _run_isolated(generate_synthetic_ord, work_dir / 'ord', ord_config)
+    else:
+        generate_synthetic_ord(work_dir / 'ord', ord_config)
+    generation_time = time.perf_counter() - start
+    analysis_dirs = [work_dir / 'ord' / f'analysis_{i + 1}' for i in range(ord_config.num_analyses)]
+
+    config = DEFAULT_CONFIG | {
+        'group_number_of_periods': ord_config.num_periods,
+        'group_mean': all('M' in elt_formats for elt_formats in ord_config.elt_formats),  # mean only needs a MELT for every analysis
+        'group_secondary_uncertainty': True,
+        'group_alt': True,
+        'group_ept': True,
+    } | (combine_config or {})
+    config['analysis_dirs'] = [str(d) for d in analysis_dirs]
+    config['output_dir'] = str(work_dir / 'output')
+
+    logger.info('Running combine')
+    if isolate:
+        _run_isolated(_run_combine, config)
+    else:
+        _run_combine(config)
+
+    with open(work_dir / 'output' / RUN_REPORT_FILE) as f:
+        run_report = json.load(f)
+
+    stages = {}
+    for step in run_report['steps']:
+        if '/' in step['name']:  # inner step
+            continue
+        stages[step['name']] = {metric: step[metric] for metric in BENCHMARK_METRICS}
+        stages[step['name']]['rows'] = step['rows']
+        stages[step['name']]['rows_per_sec'] = step['rows'] / step['wall_time'] if step['rows'] and step['wall_time'] else None
+
+    return {
+        'ord_config': asdict(ord_config),
+        'combine_config': {k: v for k, v in config.items() if k not in ('analysis_dirs', 'output_dir')},
+        'generation_time': generation_time,
+        'total': {metric: run_report[metric] for metric in ['wall_time', 'cpu_time', 'peak_rss_mb']},
+        'stages': stages,
+    }
+
+
+def compare_benchmarks(report, baseline, tolerance=0.25, min_wall_time=0.1):
+    '''
+    Compare the stage metrics of a benchmark report against a baseline report.
+
+    Args:
+        report (dict): benchmark report.
+        baseline (dict): baseline benchmark report, from the same scale of synthetic ORD.
+        tolerance (float): relative increase over the baseline flagged as a regression.
+        min_wall_time (float): stages faster than this in the baseline are not checked for time
+            regressions, as their timings are mostly noise.
+
+    Returns:
+        regressions (List[dict]): the stage, metric, value and baseline value of every regression.
+    '''
+    if report['ord_config'] != baseline['ord_config']:
+        logger.warning('Benchmark and baseline were run on different synthetic ORD configs')
+
+    regressions = []
+    for stage, metrics in report['stages'].items():
+        baseline_metrics = baseline['stages'].get(stage)
+        if baseline_metrics is None:
+            continue
+        for metric in BENCHMARK_METRICS:
+            value, baseline_value = metrics[metric], baseline_metrics[metric]
+            if value is None or not baseline_value:
+                continue
+            if metric != 'peak_rss_delta_mb' and baseline_metrics['wall_time'] < min_wall_time:
+                continue
+            if value > baseline_value * (1 + tolerance):
+                regressions.append({'stage': stage, 'metric': metric, 'value': value, 'baseline': baseline_value})
+    return regressions
+
+
+def main(args=None):
+    default_config = SyntheticORDConfig()
+    parser = argparse.ArgumentParser(description='Benchmark ods_tools combine on synthetic ORD analyses.')
+    parser.add_argument('--work-dir', required=True, help='Directory for the synthetic analyses and combine outputs')
+    parser.add_argument('--num-analyses', type=int, default=default_config.num_analyses)
+    parser.add_argument('--num-events', type=int, default=default_config.num_events)
+    parser.add_argument('--num-periods', type=int, default=default_config.num_periods)
+    parser.add_argument('--occurrences-per-event', type=int, default=default_config.occurrences_per_event)
+    parser.add_argument('--num-summary-ids', type=int, default=default_config.num_summary_ids)
+    parser.add_argument('--event-loss-density', type=float, default=default_config.event_loss_density)
+    parser.add_argument('--number-of-samples', type=int, default=default_config.number_of_samples)
+    parser.add_argument('--num-quantiles', type=int, default=default_config.num_quantiles)
+    parser.add_argument('--elt-formats', nargs='+', default=default_config.elt_formats,
+                        help='ELT formats of each analysis, cycled over the analyses, e.g. `MQS M`')
+    parser.add_argument('--output-format', choices=['csv', 'parquet'], default=default_config.output_format)
+    parser.add_argument('--seed', type=int, default=default_config.seed)
+    parser.add_argument('--combine-config', help='Path to a combine config json to override the benchmark defaults', default=None)
+    parser.add_argument('--report', help='Path to save the benchmark report', default=None)
+    parser.add_argument('--baseline', help='Path to a baseline benchmark report to check for regressions', default=None)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Relative increase over the baseline flagged as a regression')
+    parser.add_argument('-v', '--logging-level', type=int, default=20,
+                        help='logging level (debug:10, info:20, warning:30, error:40, critical:50)')
+    kwargs = vars(parser.parse_args(args))
+
+    logging.basicConfig(level=kwargs.pop('logging_level'), format='%(asctime)s - %(levelname)s - %(message)s')
+
+    combine_config = None
+    if kwargs['combine_config']:
+        with open(kwargs['combine_config']) as f:
+            combine_config = json.load(f)
+
+    ord_config = SyntheticORDConfig(**{k: kwargs[k] for k in asdict(default_config)})
+    report = run_benchmark(kwargs['work_dir'], ord_config, combine_config)
+
+    report_path = kwargs['report'] or Path(kwargs['work_dir']) / 'benchmark_report.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    logger.info(f'Saved benchmark report: {report_path}')
+
+    for stage, metrics in report['stages'].items():
+        logger.info(f"{stage}: wall_time={metrics['wall_time']:.3f}s, cpu_time={metrics['cpu_time']:.3f}s, "
+                    f"peak_rss_delta_mb={metrics['peak_rss_delta_mb']}, rows={metrics['rows']}")
+
+    if kwargs['baseline']:
+        with open(kwargs['baseline']) as f:
+            baseline = json.load(f)
+        regressions = compare_benchmarks(report, baseline, tolerance=kwargs['tolerance'])
+        for regression in regressions:
+            logger.error(f"Regression in {regression['stage']} {regression['metric']}: "
+                         f"{regression['value']:.3f} vs baseline {regression['baseline']:.3f}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Stage checkpoints for combine.
+
+Intermediate tables are persisted as parquet in the output directory, keyed by a hash of the
+config that produced them and of the upstream stage key. A rerun with the same inputs and
+config resumes from the last valid checkpoint instead of re-running period and loss sampling.
+"""
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = 'checkpoints'
+
+
+def analysis_fingerprint(analyses):
+    '''
+    Fingerprint the files of the analysis directories by path, size and modification time.
+
+    Args:
+        analyses (Dict[int, Analysis]): analyses to fingerprint.
+
+    Returns:
+        fingerprint (List[Tuple]): (analysis id, relative path, size, mtime_ns) of each file, after
+            the (analysis id, resolved analysis path) of its analysis.
+    '''
+    fingerprint = []
+    for analysis_id, analysis in sorted(analyses.items()):
+        analysis_path = Path(analysis.path)
+        fingerprint.append((analysis_id, str(analysis_path.resolve())))
+        for file_path in sorted(analysis_path.rglob('*')):
+            if file_path.is_file():
+                stat = file_path.stat()
+                fingerprint.append((analysis_id, file_path.relative_to(analysis_path).as_posix(),
+                                    stat.st_size, stat.st_mtime_ns))
+    return fingerprint
+
+
+class CheckpointStore:
+    '''
+    Parquet store for combine stage outputs. When disabled, nothing is loaded or saved.
+
+    Args:
+        checkpoint_dir (str | pathlib.Path): directory to store checkpoints in.
+        enabled (bool): whether checkpointing is enabled.
+    '''
+
+    def __init__(self, checkpoint_dir, enabled=True):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.enabled = enabled
+
+    @staticmethod
+    def stage_key(stage, parent_key=None, **params):
+        '''
+        Hash the stage name, upstream stage key and the params which affect the stage output.
+        '''
+        payload = json.dumps({'stage': stage, 'parent_key': parent_key, 'params': params},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    def _path(self, stage, key):
+        return self.checkpoint_dir / f'{stage}_{key}.parquet'
+
+    def load(self, stage, key, dtype=None):
+        '''
+        Load the checkpoint of `stage` with `key`.
+
+        Returns:
+            df (pd.DataFrame | None): checkpointed table, None if there is no valid checkpoint.
+        '''
+        if not self.enabled:
+            return None
+
+        path = self._path(stage, key)
+        if not path.is_file():
+            return None
+
+        try:
+            df = pd.read_parquet(path)
+        except Exception as e:
+            logger.warning(f'Could not read {stage} checkpoint {path}, re-running stage: {e}')
+            return None
+
+        logger.info(f'Loaded {stage} checkpoint: {path}')
+        if dtype is not None:
+            df = df.astype(dtype)
+        return df
+
+    def save(self, stage, key, df):
+        '''
+        Save `df` as the checkpoint of `stage` with `key`, removing checkpoints of the stage with other keys.
+        '''
+        if not self.enabled:
+            return
+
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        for stale_path in self.checkpoint_dir.glob(f'{stage}_*.parquet'):
+            stale_path.unlink()
+
+        # write to a temporary file first so an interrupted write never leaves a valid looking checkpoint
+        path = self._path(stage, key)
+        tmp_path = path.with_suffix('.parquet.tmp')
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        logger.info(f'Saved {stage} checkpoint: {path}')
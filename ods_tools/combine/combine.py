@@ -3,12 +3,14 @@ import jsonschema
 import json
 import logging
 
+from ods_tools.combine.checkpoint import CHECKPOINT_DIR, CheckpointStore, analysis_fingerprint
 from ods_tools.combine.grouping import create_combine_group
 from ods_tools.combine.io import get_default_output_dir, save_output, save_summary_info
 from ods_tools.combine.output_generation import generate_alt, generate_ept
+from ods_tools.combine.profiling import RUN_REPORT_FILE, RunReport, profile_step
 from ods_tools.combine.result import load_analysis_dirs
-from ods_tools.combine.sampling import do_loss_sampling, generate_group_periods, generate_gpqt
-from ods_tools.combine.common import DEFAULT_CONFIG, GALT_schema, GEPT_schema, GPLT_headers, GPLT_schema
+from ods_tools.combine.sampling import OutputsetLossTable, do_outputset_loss_sampling, generate_group_periods, generate_gpqt
+from ods_tools.combine.common import DEFAULT_CONFIG, GALT_schema, GEPT_schema, GPLT_schema, GPQT_dtype, OUTPUTSET_GPLT_dtype
 from ods_tools.oed.common import OdsException
 
 logger = logging.getLogger(__name__)
@@ -85,6 +87,7 @@ def combine(analysis_dirs,
             group_ept_aep=True,
             output_dir=None,
             output_type='csv',
+            checkpoint=False,
             **kwargs
             ):
     # prepare output dir
@@ -99,67 +102,134 @@ def combine(analysis_dirs,
                  f'format_priority={group_format_priority}, plt={group_plt}, '
                  f'alt={group_alt}, ept={group_ept}')
 
-    # Group meta data
-    logger.info("Stage 1/5: Loading analysis directories and preparing summary info")
-    analyses = load_analysis_dirs(analysis_dirs)
-    group, groupset_summaryinfo = create_combine_group(analyses,
-                                                       group_fill_perspectives=group_fill_perspectives,
-                                                       groupeventset_fields=group_event_set_fields)
-
-    save_summary_info(groupset_summaryinfo, group.groupset, output_dir)
-
-    # Period sampling
-    logger.info("Stage 2/5: Period Sampling")
-    logger.debug(f'max_group_periods={group_number_of_periods}, occ_dtype={occ_dtype}')
-    group_period = generate_group_periods(group,
-                                          max_group_periods=group_number_of_periods,
-                                          occ_dtype=occ_dtype
-                                          )
-
-    # Loss sampling
-    no_quantile_sampling = group_mean and not group_secondary_uncertainty
-    logger.info("Stage 3/5: Quantile Sampling")
-    logger.debug(f'no_quantile_sampling={no_quantile_sampling}, correlation={group_correlation}')
-    gpqt = generate_gpqt(group_period, group,
-                         no_quantile_sampling=no_quantile_sampling,
-                         correlation=group_correlation
-                         )
-
-    logger.info("Stage 4/5: Loss Sampling")
-    logger.debug(f'mean_only={group_mean}, secondary_uncertainty={group_secondary_uncertainty}, '
-                 f'parametric_distribution={group_parametric_distribution}'
-                 f'format_priority={group_format_priority}')
-    gplt = do_loss_sampling(gpqt, group,
-                            mean_only=group_mean,
-                            secondary_uncertainty=group_secondary_uncertainty,
-                            parametric_distribution=group_parametric_distribution,
-                            format_priority=group_format_priority
-                            )
-
-    # Output generation
-    logger.info("Stage 5/5: Output Generation")
-
-    outputs = []
-
-    if group_plt:
-        outputs.append(('gplt', gplt[GPLT_headers], GPLT_schema))
-
-    if group_alt:
-        logger.debug('Generating ALT')
-        outputs.append(('galt', generate_alt(gplt, group_number_of_periods), GALT_schema))
-
-    if group_ept:
-        logger.debug(f'Generating EPT (oep={group_ept_oep}, aep={group_ept_aep})')
-        outputs.append(('gept', generate_ept(gplt, group_number_of_periods,
-                                             oep=group_ept_oep,
-                                             aep=group_ept_aep), GEPT_schema))
-
-    for output_name, output_df, output_schema in outputs:
-        logger.debug(f'Saving {output_name}.{output_type}')
-        save_output(output_df, output_dir, output_name,
-                    output_type=output_type, schema=output_schema)
-        logger.debug(f'Saved {output_name}.{output_type}')
-    logger.info("Stage 5/5: Output Generation complete")
+    run_metadata = {
+        'analysis_dirs': [str(d) for d in analysis_dirs],
+        'group_number_of_periods': group_number_of_periods,
+        'group_mean': group_mean,
+        'group_secondary_uncertainty': group_secondary_uncertainty,
+        'group_parametric_distribution': group_parametric_distribution,
+        'group_format_priority': group_format_priority,
+        'group_correlation': group_correlation,
+        'output_type': output_type,
+    }
+    with RunReport(output_dir / RUN_REPORT_FILE, metadata=run_metadata):
+        # Group meta data
+        logger.info("Stage 1/5: Loading analysis directories and preparing summary info")
+        with profile_step('stage_1_grouping'):
+            analyses = load_analysis_dirs(analysis_dirs)
+            group, groupset_summaryinfo = create_combine_group(analyses,
+                                                               group_fill_perspectives=group_fill_perspectives,
+                                                               groupeventset_fields=group_event_set_fields)
+
+            save_summary_info(groupset_summaryinfo, group.groupset, output_dir)
+
+        # stage checkpoints are chained, each key includes the key of the stage before it
+        no_quantile_sampling = group_mean and not group_secondary_uncertainty
+        checkpoints = CheckpointStore(output_dir / CHECKPOINT_DIR, enabled=checkpoint)
+        group_key = CheckpointStore.stage_key('group',
+                                              analyses=analysis_fingerprint(analyses) if checkpoint else None,
+                                              group_fill_perspectives=group_fill_perspectives,
+                                              group_event_set_fields=group_event_set_fields)
+        group_period_key = CheckpointStore.stage_key('group_period', group_key,
+                                                     group_number_of_periods=group_number_of_periods,
+                                                     occ_dtype=occ_dtype)
+        gpqt_key = CheckpointStore.stage_key('gpqt', group_period_key,
+                                             no_quantile_sampling=no_quantile_sampling,
+                                             correlation=group_correlation)
+        gplt_key = CheckpointStore.stage_key('gplt', gpqt_key,
+                                             mean_only=group_mean,
+                                             secondary_uncertainty=group_secondary_uncertainty,
+                                             parametric_distribution=group_parametric_distribution,
+                                             format_priority=group_format_priority)
+
+        # resume from the last valid checkpoint
+        with profile_step('load_checkpoints'):
+            outputset_gplt = checkpoints.load('gplt', gplt_key, dtype=OUTPUTSET_GPLT_dtype)
+            gpqt = None if outputset_gplt is not None else checkpoints.load('gpqt', gpqt_key, dtype=GPQT_dtype)
+            group_period = None if outputset_gplt is not None or gpqt is not None else checkpoints.load('group_period', group_period_key)
+
+        # Period sampling
+        logger.info("Stage 2/5: Period Sampling")
+        logger.debug(f'max_group_periods={group_number_of_periods}, occ_dtype={occ_dtype}')
+        if outputset_gplt is None and gpqt is None and group_period is None:
+            with profile_step('stage_2_period_sampling') as step:
+                group_period = generate_group_periods(group,
+                                                      max_group_periods=group_number_of_periods,
+                                                      occ_dtype=occ_dtype
+                                                      )
+                checkpoints.save('group_period', group_period_key, group_period)
+                step.rows = len(group_period)
+
+        # Loss sampling
+        logger.info("Stage 3/5: Quantile Sampling")
+        logger.debug(f'no_quantile_sampling={no_quantile_sampling}, correlation={group_correlation}')
+        if outputset_gplt is None and gpqt is None:
+            with profile_step('stage_3_quantile_sampling') as step:
+                gpqt = generate_gpqt(group_period, group,
+                                     no_quantile_sampling=no_quantile_sampling,
+                                     correlation=group_correlation,
+                                     occ_dtype=occ_dtype
+                                     )
+                checkpoints.save('gpqt', gpqt_key, gpqt)
+                step.rows = len(gpqt)
+
+        logger.info("Stage 4/5: Loss Sampling")
+        logger.debug(f'mean_only={group_mean}, secondary_uncertainty={group_secondary_uncertainty}, '
+                     f'parametric_distribution={group_parametric_distribution}'
+                     f'format_priority={group_format_priority}')
+        if outputset_gplt is None:
+            with profile_step('stage_4_loss_sampling') as step:
+                gplt = do_outputset_loss_sampling(gpqt, group,
+                                                  mean_only=group_mean,
+                                                  secondary_uncertainty=group_secondary_uncertainty,
+                                                  parametric_distribution=group_parametric_distribution,
+                                                  format_priority=group_format_priority
+                                                  )
+                checkpoints.save('gplt', gplt_key, gplt.gplt)
+                step.rows = len(gplt.gplt)
+        else:
+            gplt = OutputsetLossTable(outputset_gplt, group)
+
+        # Output generation
+        logger.info("Stage 5/5: Output Generation")
+
+        # expand the gplt one groupset at a time, the groupsets after the first are appended to the outputs
+        saved_outputs = set()
+        with profile_step('stage_5_output_generation'):
+            for groupset_id in gplt.groupset_ids:
+                with profile_step(f'groupset_{groupset_id}') as step:
+                    groupset_gplt = gplt.get_groupset(groupset_id)
+                    step.rows = len(groupset_gplt)
+                    if groupset_gplt.empty:
+                        logger.warning(f'No losses sampled for groupset {groupset_id}')
+                        continue
+
+                    outputs = []
+
+                    if group_plt:
+                        outputs.append(('gplt', groupset_gplt, GPLT_schema))
+
+                    if group_alt:
+                        logger.debug(f'Generating ALT for groupset {groupset_id}')
+                        with profile_step('generate_alt'):
+                            outputs.append(('galt', generate_alt(groupset_gplt, group_number_of_periods), GALT_schema))
+
+                    if group_ept:
+                        logger.debug(f'Generating EPT for groupset {groupset_id} (oep={group_ept_oep}, aep={group_ept_aep})')
+                        with profile_step('generate_ept'):
+                            outputs.append(('gept', generate_ept(groupset_gplt, group_number_of_periods,
+                                                                 oep=group_ept_oep,
+                                                                 aep=group_ept_aep), GEPT_schema))
+
+                    for output_name, output_df, output_schema in outputs:
+                        logger.debug(f'Saving {output_name}.{output_type}')
+                        with profile_step(f'write_{output_name}', rows=len(output_df)):
+                            save_output(output_df, output_dir, output_name,
+                                        output_type=output_type, schema=output_schema,
+                                        append=output_name in saved_outputs)
+                        saved_outputs.add(output_name)
+                        logger.debug(f'Saved {output_name}.{output_type}')
+        logger.info("Stage 5/5: Output Generation complete")
 
 
 if __name__ == "__main__":
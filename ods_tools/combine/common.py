@@ -111,3 +111,9 @@ GPLT_OUTPUT = [
 GPLT_dtype = {c[0]: c[1] for c in GPLT_OUTPUT}
 GPLT_headers = [c[0] for c in GPLT_OUTPUT]
 GPLT_schema = schema_from_output_list(GPLT_OUTPUT)
+
+# GPLT holding the sampled losses once per outputset, before expansion to groupsets
+OUTPUTSET_GPLT_OUTPUT = [('outputset_id', 'category', '%d')] + [c for c in GPLT_OUTPUT if c[0] != 'groupset_id']
+
+OUTPUTSET_GPLT_dtype = {c[0]: c[1] for c in OUTPUTSET_GPLT_OUTPUT}
+OUTPUTSET_GPLT_headers = [c[0] for c in OUTPUTSET_GPLT_OUTPUT]
@@ -0,0 +1,153 @@
+"""
+Parametric distributions used to sample MELT losses.
+
+Each distribution is a vectorised inverse CDF with the signature
+`func(quantile, mean_loss, sd_loss, max_loss) -> loss`, taking one array element per sampled row.
+Rows where the distribution parameters cannot be calculated default to the `mean_loss`.
+"""
+import numpy as np
+from scipy.special import betaincinv, gammaincinv, ndtr, ndtri
+
+PARAMETRIC_DISTRIBUTIONS = {}
+
+
+def register_parametric_distribution(name):
+    '''
+    Register a parametric distribution sampling function under `name`, making it
+    available to MELT loss sampling.
+    '''
+    def decorator(func):
+        PARAMETRIC_DISTRIBUTIONS[name] = func
+        return func
+    return decorator
+
+
+def get_parametric_distribution(name):
+    if name not in PARAMETRIC_DISTRIBUTIONS:
+        raise NotImplementedError(f'sampling func: {name} not implemented. '
+                                  f'Available: {sorted(PARAMETRIC_DISTRIBUTIONS)}')
+    return PARAMETRIC_DISTRIBUTIONS[name]
+
+
+def _valid_moments(mean_loss, sd_loss):
+    return np.isfinite(mean_loss) & np.isfinite(sd_loss) & (mean_loss > 0) & (sd_loss > 0)
+
+
+def _cap_max_loss(loss, max_loss):
+    '''Cap unbounded distributions at the max loss, where one is set.'''
+    np.minimum(loss, max_loss, out=loss, where=max_loss > 0)
+    return loss
+
+
+@register_parametric_distribution('beta')
+def beta_sampling_loss(quantile, mean_loss, sd_loss, max_loss):
+    '''
+    Sample losses from a beta distribution scaled by `max_loss`, with the mean and standard deviation
+    taken from the MELT.
+
+    Args:
+        quantile (np.ndarray): quantile to sample at for each row.
+        mean_loss (np.ndarray): MELT MeanLoss for each row.
+        sd_loss (np.ndarray): MELT SDLoss for each row.
+        max_loss (np.ndarray): MELT MaxLoss for each row.
+
+    Returns:
+        loss (np.ndarray): sampled loss for each row.
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mu = mean_loss / max_loss  # TODO need to verify form of this - also should we use MaxImpactedExposure as outlined in joh's sheet?
+        sigma_sq = sd_loss / max_loss
+        sigma_sq **= 2
+
+        # alpha = mu * (mu * (1 - mu) / sigma ** 2 - 1), beta = alpha * (1 / mu - 1), calculated in place
+        alpha = 1 - mu
+        alpha *= mu
+        alpha /= sigma_sq
+        alpha -= 1
+        alpha *= mu
+        beta = np.divide(1, mu, out=sigma_sq)
+        beta -= 1
+        beta *= alpha
+
+    valid = np.isfinite(alpha) & np.isfinite(beta) & (alpha > 0) & (beta > 0)
+
+    loss = np.empty(len(quantile), dtype=np.result_type(alpha, beta, quantile))
+    betaincinv(alpha, beta, quantile, out=loss, where=valid)
+    np.multiply(loss, max_loss, out=loss, where=valid)
+    loss[~valid] = mean_loss[~valid]  # default to MeanLoss
+
+    return loss
+
+
+@register_parametric_distribution('gamma')
+def gamma_sampling_loss(quantile, mean_loss, sd_loss, max_loss):
+    '''
+    Sample losses from a gamma distribution with the MELT mean and standard deviation, capped at `max_loss`.
+    '''
+    valid = _valid_moments(mean_loss, sd_loss)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # shape k = mean ** 2 / sd ** 2, scale theta = sd ** 2 / mean
+        scale = sd_loss ** 2
+        scale /= mean_loss
+        shape = mean_loss / scale
+
+    # gammaincinv (and ndtr) write to the wrong elements when called with `where=` in scipy 1.17, so the
+    # scipy.special functions other than betaincinv are called on the valid rows only
+    loss = mean_loss.astype(np.result_type(shape, quantile))  # default to MeanLoss
+    loss[valid] = scale[valid] * gammaincinv(shape[valid], quantile[valid])
+
+    return _cap_max_loss(loss, max_loss)
+
+
+@register_parametric_distribution('lognormal')
+def lognormal_sampling_loss(quantile, mean_loss, sd_loss, max_loss):
+    '''
+    Sample losses from a lognormal distribution with the MELT mean and standard deviation, capped at `max_loss`.
+    The inverse CDF is closed form given the normal quantile function, so is cheaper than beta or gamma.
+    '''
+    valid = _valid_moments(mean_loss, sd_loss)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # sigma_ln ** 2 = log(1 + sd ** 2 / mean ** 2), mu_ln = log(mean) - sigma_ln ** 2 / 2
+        sigma_ln = sd_loss / mean_loss
+        sigma_ln **= 2
+        np.log1p(sigma_ln, out=sigma_ln)
+        mu_ln = np.log(mean_loss)
+        mu_ln -= sigma_ln / 2
+        np.sqrt(sigma_ln, out=sigma_ln)
+
+    z = ndtri(quantile[valid])
+    z *= sigma_ln[valid]
+    z += mu_ln[valid]
+    loss = mean_loss.astype(np.result_type(sigma_ln, quantile))  # default to MeanLoss
+    loss[valid] = np.exp(z, out=z)
+
+    return _cap_max_loss(loss, max_loss)
+
+
+@register_parametric_distribution('truncated_normal')
+def truncated_normal_sampling_loss(quantile, mean_loss, sd_loss, max_loss):
+    '''
+    Sample losses from a normal distribution with the MELT mean and standard deviation, truncated to
+    [0, `max_loss`]. The upper bound is not applied where `max_loss` is not set.
+    '''
+    valid = np.isfinite(mean_loss) & np.isfinite(sd_loss) & (sd_loss > 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # map the quantile onto the [cdf(0), cdf(max_loss)] range of the parent normal
+        cdf_lower = ndtr(-mean_loss / sd_loss)
+        cdf_upper = np.where(max_loss > 0, ndtr((max_loss - mean_loss) / sd_loss), 1)
+        cdf_upper -= cdf_lower
+
+    z = quantile[valid] * cdf_upper[valid]
+    z += cdf_lower[valid]
+    z = ndtri(z)
+    z *= sd_loss[valid]
+    z += mean_loss[valid]
+    loss = mean_loss.astype(np.result_type(cdf_upper, quantile))  # default to MeanLoss
+    loss[valid] = z
+
+    # guard against the tails of the normal quantile function stepping outside the truncation bounds
+    np.maximum(loss, 0, out=loss)
+    return _cap_max_loss(loss, max_loss)
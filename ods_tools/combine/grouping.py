@@ -5,8 +5,10 @@ from dataclasses import dataclass, field
 from typing import List
 from collections import defaultdict, namedtuple
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
+from ods_tools.combine.common import oasis_int
 from ods_tools.combine.utils import SummaryInfoMapKey, hash_summary_level_fields
 
 
@@ -214,6 +216,35 @@ def prepare_outputset_summaryinfo(analyses, outputsets):
     return outputset_summary_info
 
 
+def _encode_summary_rows(summary_info, summary_cols):
+    '''
+    Dictionary encode the rows of `summary_info` over `summary_cols` into a single code per row.
+    Each column is factorized on its own and the column codes are combined into one int64 key, so
+    codes follow the order of the rows sorted by `summary_cols`.
+
+    Returns:
+        codes (np.ndarray): dense code of each row, -1 for rows with a missing value.
+        first_rows (np.ndarray): position of the first row of each code.
+    '''
+    keys = np.zeros(len(summary_info), dtype=np.int64)
+    missing = np.zeros(len(summary_info), dtype=bool)
+    key_cardinality = 1
+    for col in summary_cols:
+        col_codes, col_values = pd.factorize(summary_info[col], sort=True)
+        missing |= col_codes < 0
+        if key_cardinality * max(len(col_values), 1) >= 2**62:
+            # re-rank the key so far to keep the combined key within int64, ranks keep the sort order
+            uniques, keys = np.unique(keys, return_inverse=True)
+            key_cardinality = len(uniques)
+        keys = keys * len(col_values) + np.maximum(col_codes, 0)
+        key_cardinality *= max(len(col_values), 1)
+
+    codes = np.full(len(summary_info), -1, dtype=np.int64)
+    valid_rows = np.flatnonzero(~missing)
+    _, first_rows, codes[valid_rows] = np.unique(keys[valid_rows], return_index=True, return_inverse=True)
+    return codes, valid_rows[first_rows]
+
+
 def prepare_groupset_summaryinfo(groupset, outputset_summaryinfo):
     '''Prepare map of groupset_id to summaryinfo
     '''
@@ -223,9 +254,17 @@ def prepare_groupset_summaryinfo(groupset, outputset_summaryinfo):
 
     for group_set_id, group in groupset.items():
         outputset_ids = group['outputsets']
-        curr_group_summary_info = pd.concat([outputset_summaryinfo[os_id] for os_id in outputset_ids])
+        curr_group_summary_info = pd.concat([outputset_summaryinfo[os_id] for os_id in outputset_ids], ignore_index=True)
         summary_oed_cols = [c for c in curr_group_summary_info.columns.to_list() if c not in ignored_cols]
-        curr_group_summary_info = curr_group_summary_info.groupby(summary_oed_cols, as_index=False).agg({'tiv': 'sum'})
+
+        # group on a single code per row rather than on every summary column
+        codes, first_rows = _encode_summary_rows(curr_group_summary_info, summary_oed_cols)
+        valid = codes >= 0
+        code_groups = pd.Categorical.from_codes(codes[valid], categories=pd.RangeIndex(len(first_rows)))
+        tiv = curr_group_summary_info['tiv'][valid].groupby(code_groups, observed=True).sum()
+
+        curr_group_summary_info = curr_group_summary_info[summary_oed_cols].iloc[first_rows].reset_index(drop=True)
+        curr_group_summary_info['tiv'] = tiv.to_numpy()
         curr_group_summary_info['SummaryId'] = curr_group_summary_info.index + 1
 
         groupset_summaryinfo[group_set_id] = curr_group_summary_info[['SummaryId'] + summary_oed_cols + ['tiv']]
@@ -235,31 +274,51 @@ def prepare_groupset_summaryinfo(groupset, outputset_summaryinfo):
 
 def prepare_summaryinfo_map(outputset_summaryinfo, groupset_summaryinfo, groupset):
     """
-    Prepares summaryinfo map for alignment.
+    Prepares summaryinfo map for alignment. The map only contains (groupset_id, outputset_id) pairs
+    with SummaryIds to realign, each as an array indexed by the outputset summary_id.
+
+    The groupset summaryinfo and the summaryinfo of all its outputsets are encoded together once
+    per groupset, so each outputset summary_id is matched to its groupset SummaryId by a single code.
 
     Args:
-        analyses (dict[Analyses]) : Dict of anlayses in group, indexed by analysis_id.
         outputset_summaryinfo (dict) : Map of outputset_id to summaryinfo
         groupset_summaryinfo (dict): Map of groupset_id to summaryinfo
+        groupset (dict): Map of groupset_id to groupset info
     """
-    ignored_cols = ['SummaryId', 'summary_id']
-
-    groupset_outputset = []
-    for groupset_id, groupset in groupset.items():
-        groupset_outputset += [(groupset_id, outputset_id) for outputset_id in groupset['outputsets']]
+    ignored_cols = ['SummaryId', 'summary_id', 'tiv']
 
     summaryinfo_map = {}
-    for groupset_id, outputset_id in groupset_outputset:
-        curr_group_summary_info = groupset_summaryinfo[groupset_id].drop(columns=['tiv'])
-        curr_os_summary_info = outputset_summaryinfo[outputset_id].drop(columns=['tiv'])
-
+    for groupset_id, curr_groupset in groupset.items():
+        curr_group_summary_info = groupset_summaryinfo[groupset_id]
         summary_oed_cols = [c for c in curr_group_summary_info.columns.to_list() if c not in ignored_cols]
-        output_set_map = pd.merge(curr_os_summary_info, curr_group_summary_info, how="left", on=summary_oed_cols)
-        output_set_map = output_set_map[['summary_id', 'SummaryId']]
-        output_set_map = output_set_map.query('~(summary_id == SummaryId)')
-
-        if not output_set_map.empty:
-            summaryinfo_map[SummaryInfoMapKey(groupset_id, outputset_id)] = output_set_map.set_index('summary_id').to_dict()['SummaryId']
+        outputset_ids = curr_groupset['outputsets']
+
+        codes, first_rows = _encode_summary_rows(
+            pd.concat([curr_group_summary_info[summary_oed_cols]] +
+                      [outputset_summaryinfo[os_id][summary_oed_cols] for os_id in outputset_ids], ignore_index=True),
+            summary_oed_cols)
+
+        # groupset SummaryId of each code, every outputset row has a matching groupset row
+        code_summary_ids = np.zeros(len(first_rows), dtype=oasis_int)
+        group_codes = codes[:len(curr_group_summary_info)]
+        code_summary_ids[group_codes[group_codes >= 0]] = curr_group_summary_info['SummaryId'].to_numpy()[group_codes >= 0]
+
+        offset = len(curr_group_summary_info)
+        for outputset_id in outputset_ids:
+            curr_os_summary_ids = outputset_summaryinfo[outputset_id]['summary_id'].to_numpy()
+            os_codes = codes[offset:offset + len(curr_os_summary_ids)]
+            offset += len(curr_os_summary_ids)
+
+            matched = os_codes >= 0
+            summary_ids = curr_os_summary_ids[matched]
+            group_summary_ids = code_summary_ids[os_codes[matched]]
+            remap = summary_ids != group_summary_ids
+
+            if remap.any():
+                # dense lookup indexed by outputset summary_id, unmapped summary_ids map to themselves
+                lookup = np.arange(curr_os_summary_ids.max() + 1, dtype=oasis_int)
+                lookup[summary_ids[remap]] = group_summary_ids[remap]
+                summaryinfo_map[SummaryInfoMapKey(groupset_id, outputset_id)] = lookup
 
     return summaryinfo_map
 
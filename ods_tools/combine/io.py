@@ -1,7 +1,10 @@
 '''
 Util methods to interact with IO operations for combine.
 '''
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
+import shutil
 import numpy as np
 import numba as nb
 import logging
@@ -9,26 +12,26 @@ from datetime import datetime
 import pandas as pd
 from pyarrow import csv
 import pyarrow as pa
+import pyarrow.parquet as pq
 
 from ods_tools.combine.common import nb_oasis_int, oasis_float, oasis_int
+from ods_tools.combine.utils import expand_csr
 
 logger = logging.getLogger(__name__)
 
 
+# ORD output file formats in order of preference when detecting the format of an analysis
+ORD_OUTPUT_FORMATS = ['parquet', 'csv']
+
+# maximum number of rows per row group in parquet outputs
+PARQUET_ROW_GROUP_SIZE = 2**20
+
 DEFAULT_OCC_DTYPE = [('event_id', 'i4'),
                      ('period_no', 'i4'),
                      ('occ_date_id', 'i4')  # granular dtype 'i8'
                      ]
 
 
-def pyarrow_write_csv(data, output_file, schema=None):
-    """numpy → pandas → pa.Table (cast to schema) → pyarrow.csv.write_csv."""
-    table = pa.Table.from_pandas(data, preserve_index=False)
-    if schema is not None:
-        table = table.cast(schema)
-    csv.write_csv(table, output_file)
-
-
 def get_default_output_dir():
     timestamp = datetime.now().strftime("%d%m%y%H%M%S")
     return f"./combine_runs/{timestamp}"
@@ -50,20 +53,73 @@ def save_summary_info(groupset_summaryinfo, groupset_info, output_dir):
         logger.info(f'Saved {summary_info_fname}: {save_path}')
 
 
+def _partition_table(full_df, factor_col, drop_factor=False):
+    '''
+    Convert `full_df` to an Arrow table once and split it into one zero copy slice per value of
+    `factor_col`. Rows are only reordered when the frame is not already grouped by `factor_col`.
+    With `drop_factor` the `factor_col` column is left out of the table.
+
+    Returns:
+        table (pa.Table): the full table.
+        partitions (List[Tuple]): (factor value, table slice) of each partition.
+    '''
+    codes, values = pd.factorize(full_df[factor_col], sort=True)
+    table = pa.Table.from_pandas(full_df.drop(columns=factor_col) if drop_factor else full_df, preserve_index=False)
+    if len(codes) > 1 and (np.diff(codes) < 0).any():
+        table = table.take(np.argsort(codes, kind='stable'))
+
+    counts = np.bincount(codes, minlength=len(values))
+    starts = np.cumsum(counts) - counts
+    return table, [(value, table.slice(start, count)) for value, start, count in zip(values, starts, counts)]
+
+
 def save_output(full_df, output_dir, output_name, factor_col='groupset_id', float_decimals=6,
-                output_type='csv', schema=None):
+                output_type='csv', schema=None, row_group_size=PARQUET_ROW_GROUP_SIZE, append=False):
+    '''
+    Save an output table partitioned by `factor_col`. CSV outputs are written as one
+    `{factor}_{output_name}.csv` file per partition. Parquet outputs are written as a hive
+    partitioned dataset `{output_name}/{factor_col}={factor}/part-0.parquet`, any dataset
+    already in `output_dir` is removed first unless `append` is set, so partitions of an
+    earlier run are not read back with the new ones.
+
+    Args:
+        full_df (pd.DataFrame): output table.
+        output_dir (str | pathlib.Path): directory to save the output to.
+        output_name (str): name of the output, e.g. `gplt`.
+        factor_col (str): column to partition the output by.
+        output_type (str): either `csv` or `parquet`.
+        schema (pa.Schema): schema to cast csv outputs to.
+        row_group_size (int): maximum number of rows in a parquet row group.
+        append (bool): add the partitions to the parquet dataset already in `output_dir`.
+    '''
     assert output_type in ['csv', 'parquet'], f'Output type {output_type} is not supported.'
-    output_name = f'{output_name}.{output_type}'
-    for i in full_df[factor_col].unique():
-        save_path = output_dir / f'{i}_{output_name}'
-        output_df = full_df[full_df[factor_col] == i]
-        if output_type == 'parquet':
-            output_df.to_parquet(save_path, index=False)
-        else:
-            if len(output_df) > 10**5:
-                logger.info('Large output {output_name} file in csv. Consider using `output_type=parquet`')
-            pyarrow_write_csv(output_df, save_path, schema)
-        logger.info(f'Saved {output_name}: {save_path}')
+    output_dir = Path(output_dir)
+    # the partition value is stored in the hive directory name rather than the parquet files
+    table, partitions = _partition_table(full_df, factor_col, drop_factor=output_type == 'parquet')
+
+    if output_type == 'parquet':
+        if not append and (output_dir / output_name).exists():
+            shutil.rmtree(output_dir / output_name)
+
+        def write_partition(value, partition):
+            save_path = output_dir / output_name / f'{factor_col}={value}' / 'part-0.parquet'
+            save_path.parent.mkdir(parents=True, exist_ok=True)
+            pq.write_table(partition, save_path, row_group_size=row_group_size, use_dictionary=True)
+            return save_path
+    else:
+        if schema is not None:
+            partitions = [(value, partition.cast(schema)) for value, partition in partitions]
+
+        def write_partition(value, partition):
+            save_path = output_dir / f'{value}_{output_name}.csv'
+            if len(partition) > 10**5:
+                logger.info(f'Large output {output_name} file in csv. Consider using `output_type=parquet`')
+            csv.write_csv(partition, save_path)
+            return save_path
+
+    for value, partition in partitions:
+        save_path = write_partition(value, partition)
+        logger.info(f'Saved {output_name}.{output_type}: {save_path}')
 
 # occurrence reading functions from oasislmf -> copied to avoid circular imports
 
@@ -173,9 +229,120 @@ def _read_occ_arr(occ_arr, occ_map_valtype, NB_occ_map_valtype):
     return occ_map
 
 
+@dataclass(frozen=True)
+class OccurrenceIndex:
+    '''Parsed occurrence file stored as CSR style mappings. The periods of `event_ids[i]` are
+    `event_periods[event_offsets[i]:event_offsets[i + 1]]` and the events of `periods[i]` are
+    `period_events[period_offsets[i]:period_offsets[i + 1]]`.'''
+    no_of_periods: int
+    periods: np.ndarray  # unique period_no, sorted
+    period_offsets: np.ndarray
+    period_events: np.ndarray  # unique event_id per period_no, sorted
+    event_ids: np.ndarray  # unique event_id, sorted
+    event_offsets: np.ndarray
+    event_periods: np.ndarray  # unique period_no per event_id, sorted
+
+    def event_period_pairs(self):
+        '''Return the unique (event_id, period_no) pairs as two aligned arrays sorted by event_id.'''
+        return np.repeat(self.event_ids, np.diff(self.event_offsets)), self.event_periods
+
+    def expand_periods(self, periods):
+        '''Look up the events of each period in `periods`.
+
+        Args:
+            periods (np.ndarray): period numbers to expand.
+
+        Returns:
+            row_idx (np.ndarray): index into `periods` of each (period, event) pair.
+            event_ids (np.ndarray): event_id of each (period, event) pair.
+        '''
+        periods = np.asarray(periods)
+        if len(self.periods) == 0 or len(periods) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=self.period_events.dtype)
+
+        idx = np.minimum(np.searchsorted(self.periods, periods), len(self.periods) - 1)
+        starts = self.period_offsets[idx]
+        counts = np.where(self.periods[idx] == periods, self.period_offsets[idx + 1] - starts, 0)
+
+        row_idx, event_idx = expand_csr(starts, counts)
+        return row_idx, self.period_events[event_idx]
+
+
+def _csr_from_keys(keys, id_dtype, value_dtype):
+    '''Build CSR ids, offsets and values from sorted unique keys packed as `id << 32 | value`.'''
+    ids, counts = np.unique((keys >> 32).astype(id_dtype), return_counts=True)
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return ids, offsets, (keys & 0xFFFFFFFF).astype(value_dtype)
+
+
+def load_occurrence_index(occ_path, record_dtype=None):
+    '''Load the `OccurrenceIndex` of an occurrence file. The parsed index is cached on the
+    file path, size and modification time so each occurrence file is only read once.
+
+    Args:
+        occ_path (str | os.PathLike): Path to occurrence bin
+        record_dtype (list(tuple(str))) : definition of dtypes for each record in occurrence.bin
+    Returns:
+        occ_index (OccurrenceIndex): unique periods and event to period mapping of the occurrence file.
+    '''
+    occ_path = Path(occ_path).resolve()
+    record_dtype = DEFAULT_OCC_DTYPE if record_dtype is None else record_dtype
+    stat = occ_path.stat()
+    return _load_occurrence_index(str(occ_path), stat.st_size, stat.st_mtime_ns,
+                                  tuple(tuple(el) for el in record_dtype))
+
+
+@lru_cache(maxsize=16)
+def _load_occurrence_index(occ_path, size, mtime_ns, record_dtype):
+    occ_arr, no_of_periods = read_occurrence_bin(occ_path, list(record_dtype))
+    event_id = occ_arr['event_id']
+    period_no = occ_arr['period_no']
+
+    # pack (event_id, period_no) into one key to sort and deduplicate in a single pass
+    event_ids, event_offsets, event_periods = _csr_from_keys(
+        np.unique((event_id.astype(np.int64) << 32) | period_no.astype(np.uint32)),
+        event_id.dtype, period_no.dtype)
+    periods, period_offsets, period_events = _csr_from_keys(
+        np.unique((period_no.astype(np.int64) << 32) | event_id.astype(np.uint32)),
+        period_no.dtype, event_id.dtype)
+
+    occ_index = OccurrenceIndex(no_of_periods=int(no_of_periods),
+                                periods=periods,
+                                period_offsets=period_offsets,
+                                period_events=period_events,
+                                event_ids=event_ids,
+                                event_offsets=event_offsets,
+                                event_periods=event_periods)
+
+    # arrays are shared between all users of the cache
+    for arr in (periods, period_offsets, period_events, event_ids, event_offsets, event_periods):
+        arr.setflags(write=False)
+
+    return occ_index
+
+
+def detect_ord_output_format(output_dir):
+    '''Detect the file format of the ORD loss tables in an analysis output directory. If
+    loss tables are present in several formats the first in `ORD_OUTPUT_FORMATS` is used.
+
+    Args:
+        output_dir (str | pathlib.Path): analysis output directory.
+
+    Returns:
+        output_format (str): Either `parquet` or `csv`.
+    '''
+    output_dir = Path(output_dir)
+    for output_format in ORD_OUTPUT_FORMATS:
+        if any(output_dir.glob(f'*[mqs]elt.{output_format}')):
+            return output_format
+    return 'csv'
+
+
 def load_loss_table_paths(analysis, summary_level_id, perspective, output_type):
     '''Load loss table paths to of type `output_type` from ord output directory of the selected
-    analysis, summary_id and perspective.
+    analysis, summary_id and perspective. The file format (csv or parquet) is detected from the
+    analysis output directory.
 
     Args
     ----
@@ -187,7 +354,8 @@ def load_loss_table_paths(analysis, summary_level_id, perspective, output_type):
     '''
 
     analysis_dir = Path(analysis.path) / 'output'
-    glob_str = f'*{perspective}*S{summary_level_id}*{output_type}.csv'
+    output_format = detect_ord_output_format(analysis_dir)
+    glob_str = f'*{perspective}*S{summary_level_id}*{output_type}.{output_format}'
     elt_path_dict = list(analysis_dir.glob(glob_str))
     elt_path_dict = {path.stem.split('_')[-1]: path for path in elt_path_dict}
 
@@ -218,9 +386,33 @@ SELT_DTYPE = {k: ELT_DTYPE[k] for k in ["SummaryId", "EventId", "SampleId",
                                         "Loss"]}
 
 
+def _pa_type_from_dtype(dtype):
+    '''Convert numpy or pandas nullable dtype to the equivalent pyarrow type.'''
+    dtype = pd.api.types.pandas_dtype(dtype)
+    return pa.from_numpy_dtype(getattr(dtype, 'numpy_dtype', dtype))
+
+
 def load_elt(path, dtype):
-    df = pd.read_csv(path, dtype=dtype)
-    return df[dtype.keys()]
+    '''Load ELT file, only reading the columns in `dtype`. Parquet files are read directly,
+    csv files are parsed with the multithreaded pyarrow csv reader.
+
+    Args:
+        path (str | pathlib.Path): path to `.csv` or `.parquet` ELT file.
+        dtype (dict): map of column name to dtype of the columns to load.
+
+    Returns:
+        df (pd.DataFrame): ELT with columns in `dtype`.
+    '''
+    columns = list(dtype.keys())
+    if Path(path).suffix == '.parquet':
+        table = pq.read_table(path, columns=columns)
+    else:
+        column_types = {col: _pa_type_from_dtype(col_dtype) for col, col_dtype in dtype.items()}
+        table = csv.read_csv(path,
+                             read_options=csv.ReadOptions(use_threads=True),
+                             convert_options=csv.ConvertOptions(include_columns=columns,
+                                                                column_types=column_types))
+    return table.to_pandas().astype(dtype)[columns]
 
 
 def load_melt(path):
@@ -0,0 +1,124 @@
+"""
+Run profiling for combine.
+
+`profile_step` records the wall time, CPU time, peak RSS increase and row count of a block of code in
+the active `RunReport`. Steps nest, so inner steps (ELT load, merge, sampling, write) are recorded
+under the stage they run in. The report is saved as JSON when the run finishes or fails.
+"""
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+RUN_REPORT_FILE = 'combine_run_report.json'
+
+_active_report = ContextVar('combine_run_report', default=None)
+
+
+def peak_rss_mb():
+    '''Peak resident set size of the process in MB, None if it cannot be measured on this platform.'''
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return max_rss / 2**20 if sys.platform == 'darwin' else max_rss / 2**10
+
+
+@dataclass
+class StepRecord:
+    name: str
+    wall_time: float = None
+    cpu_time: float = None
+    peak_rss_delta_mb: float = None
+    rows: int = None
+
+
+class RunReport:
+    '''
+    Collects the `StepRecord` of every `profile_step` run while the report is active and saves them
+    as JSON on exit.
+
+    Args:
+        report_path (str | pathlib.Path): path to save the JSON report to.
+        metadata (dict): run information to include in the report, e.g. the config.
+    '''
+
+    def __init__(self, report_path, metadata=None):
+        self.report_path = Path(report_path)
+        self.metadata = metadata or {}
+        self.steps = []
+        self._step_names = []
+        self._token = None
+        self._start = None
+
+    def __enter__(self):
+        self._token = _active_report.set(self)
+        self._start = time.perf_counter(), time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active_report.reset(self._token)
+        self.save(status='failed' if exc_type is not None else 'complete')
+        return False
+
+    def to_dict(self, status=None):
+        return {
+            'status': status,
+            'metadata': self.metadata,
+            'wall_time': time.perf_counter() - self._start[0],
+            'cpu_time': time.process_time() - self._start[1],
+            'peak_rss_mb': peak_rss_mb(),
+            'steps': [asdict(step) for step in self.steps],
+        }
+
+    def save(self, status=None):
+        with open(self.report_path, 'w') as f:
+            json.dump(self.to_dict(status), f, indent=4, default=str)
+        logger.info(f'Saved run report: {self.report_path}')
+
+
+@contextmanager
+def profile_step(name, rows=None):
+    '''
+    Profile a step of the combine run. Set `rows` on the yielded record to report the row count
+    of the step output. Nothing is recorded when there is no active `RunReport`.
+
+    The peak RSS of the process only ever increases, so the memory of a step is recorded as
+    `peak_rss_delta_mb`, the increase of the process peak RSS over the step. A step which stays
+    below the peak of an earlier step records 0.
+
+    Args:
+        name (str): step name, prefixed with the names of the enclosing steps.
+        rows (int): row count of the step output, if known up front.
+    '''
+    report = _active_report.get()
+    if report is None:
+        yield StepRecord(name, rows=rows)
+        return
+
+    report._step_names.append(name)
+    record = StepRecord('/'.join(report._step_names), rows=rows)
+    report.steps.append(record)
+
+    start_wall, start_cpu, start_rss = time.perf_counter(), time.process_time(), peak_rss_mb()
+    try:
+        yield record
+    finally:
+        record.wall_time = time.perf_counter() - start_wall
+        record.cpu_time = time.process_time() - start_cpu
+        if start_rss is not None:
+            record.peak_rss_delta_mb = peak_rss_mb() - start_rss
+        report._step_names.pop()
+        logger.debug(f'{record.name}: wall_time={record.wall_time:.3f}s, cpu_time={record.cpu_time:.3f}s, '
+                     f'peak_rss_delta_mb={record.peak_rss_delta_mb}, rows={record.rows}')
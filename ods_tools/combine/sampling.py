@@ -4,12 +4,15 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 from scipy.stats import norm
-from scipy.special import betaincinv
 import logging
 
-from ods_tools.combine.common import DEFAULT_RANDOM_SEED, GPLT_dtype, GPLT_headers, GPQT_dtype, GPQT_headers
+from ods_tools.combine.common import (DEFAULT_RANDOM_SEED, GPLT_dtype, GPLT_headers, GPQT_dtype, GPQT_headers,
+                                      OUTPUTSET_GPLT_dtype, OUTPUTSET_GPLT_headers, oasis_int)
 from ods_tools.combine import io
-from ods_tools.combine.io import DEFAULT_OCC_DTYPE, load_melt, read_occurrence_bin, load_loss_table_paths
+from ods_tools.combine.distributions import get_parametric_distribution
+from ods_tools.combine.io import load_melt, load_occurrence_index, load_loss_table_paths
+from ods_tools.combine.profiling import profile_step
+from ods_tools.combine.utils import SummaryInfoMapKey, expand_csr
 
 logger = logging.getLogger(__name__)
 
@@ -56,13 +59,15 @@ def load_period_info(occ_paths, occ_dtype=None):
 
     Args:
         occ_paths (list[str]) : list of occurrence files to load periods from.
+        occ_dtype ( List[Tuple[str]] ) : dtype of records in occurrence files.
     '''
     periods = []
     max_periods = None
 
     for occ_path in occ_paths:
-        occ_arr, _max_periods = read_occurrence_bin(occ_path, occ_dtype)
-        periods += np.unique(occ_arr['period_no']).tolist()
+        occ_index = load_occurrence_index(occ_path, occ_dtype)
+        _max_periods = occ_index.no_of_periods
+        periods += occ_index.periods.tolist()
 
         if max_periods is None:
             max_periods = _max_periods
@@ -95,7 +100,7 @@ def gen_group_periods_event_set_analysis(periods, max_period, max_group_periods)
 # Quantile Sampling
 
 
-def generate_gpqt(group_period, group, no_quantile_sampling=False, correlation=None):
+def generate_gpqt(group_period, group, no_quantile_sampling=False, correlation=None, occ_dtype=None):
     '''
     Create the group period quantile table.
 
@@ -104,6 +109,7 @@ def generate_gpqt(group_period, group, no_quantile_sampling=False, correlation=N
         group (ResultGroup) : Group object containig ORD info.
         no_quantile_sampling (bool) : If true, no quantiles sampled.
         correlation (float) : Correlation parameter
+        occ_dtype ( List[Tuple[str]] ) : dtype of records in occurrence files.
 
     Returns:
         gpqt (pd.DataFrame) : Group Period Quantile Table
@@ -113,72 +119,154 @@ def generate_gpqt(group_period, group, no_quantile_sampling=False, correlation=N
 
     for groupeventset_id, groupeventset in group.groupeventset.items():
         filtered_group_period = group_period[group_period['groupeventset_id'] == groupeventset_id]
-        filtered_analyses = [group.analyses[a] for a in groupeventset['analysis_ids']]
+        group_periods = filtered_group_period['GroupPeriod'].to_numpy()
+        periods = filtered_group_period['Period'].to_numpy()
+
+        # (group period row, event) pairs per analysis, repeated for each of its outputsets
+        analysis_events = []
+        for analysis_id in groupeventset['analysis_ids']:
+            a = group.analyses[analysis_id]
+            occ_index = load_occurrence_index(Path(a.path) / 'input' / 'occurrence.bin', occ_dtype)
+            row_idx, event_ids = occ_index.expand_periods(periods)
+            analysis_events.append((row_idx, event_ids, group.analysis_outputset[a.id]))
+
+        n_rows = sum(len(row_idx) * len(outputset_ids) for row_idx, _, outputset_ids in analysis_events)
+        group_period_arr = np.empty(n_rows, dtype=oasis_int)
+        event_id_arr = np.empty(n_rows, dtype=oasis_int)
+        outputset_id_arr = np.empty(n_rows, dtype=np.int64)
+
+        start = 0
+        for row_idx, event_ids, outputset_ids in analysis_events:
+            for outputset_id in outputset_ids:
+                end = start + len(row_idx)
+                group_period_arr[start:end] = group_periods[row_idx]
+                event_id_arr[start:end] = event_ids
+                outputset_id_arr[start:end] = outputset_id
+                start = end
+
+        gpqt_fragments.append(pd.DataFrame({
+            'GroupPeriod': group_period_arr,
+            'groupeventset_id': groupeventset_id,
+            'outputset_id': outputset_id_arr,
+            'EventId': event_id_arr,
+            'Quantile': calculate_quantiles(group_period_arr, event_id_arr, no_quantile_sampling, correlation)
+        }))
+
+    gpqt = pd.concat(gpqt_fragments, ignore_index=True)
+    return gpqt[GPQT_headers].astype(GPQT_dtype)
 
-        analysis_outputsets = []
-        for a in filtered_analyses:
-            for os_id in group.analysis_outputset[a.id]:
-                os = group.outputsets[os_id]
-                analysis_outputsets.append((a, os))
 
-        for a, os in analysis_outputsets:
-            # print(f'Currently processing groupeventset_id: {groupeventset_id},  outputset: {os.id}')
+def calculate_quantiles(group_periods, event_ids, no_quantile_sampling=False, correlation=None):
+    '''
+    Calculate gpqt Quantiles, handling partial / full correlations. Rows of a groupeventset with the
+    same (GroupPeriod, EventId) share the correlated part of their quantile.
 
-            eventid_period, _ = read_occurrence_bin(Path(a.path) / 'input' / 'occurrence.bin', DEFAULT_OCC_DTYPE)
+    Args:
+        group_periods (np.ndarray) : GroupPeriod of each gpqt row.
+        event_ids (np.ndarray) : EventId of each gpqt row.
+        no_quantile_sampling (bool) : If true, no quantiles sampled.
+        correlation (float) : Correlation parameter
 
-            eventid_period = (pd.DataFrame(eventid_period)[['event_id', 'period_no']]
-                              .drop_duplicates(ignore_index=True)
-                              .rename(columns={'period_no': 'Period',
-                                               'event_id': 'EventId'})
-                              )
+    Returns:
+        quantiles (np.ndarray) : Quantile of each gpqt row.
+    '''
+    n_rows = len(group_periods)
+    if no_quantile_sampling:
+        return np.full(n_rows, np.nan)
 
-            _gpqt_fragment = filtered_group_period.merge(eventid_period, on='Period',
-                                                         how='inner')
+    if correlation is None or correlation == 0.0:  # uncorrelated
+        return rng.random(size=n_rows)
 
-            _gpqt_fragment['outputset_id'] = os.id
+    keys = (group_periods.astype(np.int64) << 32) | event_ids.astype(np.uint32)
+    unique_keys, key_idx = np.unique(keys, return_inverse=True)
 
-            gpqt_fragments.append(_gpqt_fragment)
+    if correlation == 1.:  # fully correlated
+        return rng.random(size=len(unique_keys))[key_idx]
 
-    gpqt = pd.concat(gpqt_fragments).reset_index(drop=True)
+    # partial correlations
+    correlated = rng.normal(size=len(unique_keys))[key_idx]
+    uncorrelated = rng.normal(size=n_rows)
+    return norm.cdf(correlated * np.sqrt(correlation) + uncorrelated * np.sqrt(1 - correlation))
 
-    gpqt = calculate_quantiles(gpqt, no_quantile_sampling, correlation)
-    return gpqt[GPQT_headers].astype(GPQT_dtype)
+# Loss Sampling
 
 
-def calculate_quantiles(gpqt, no_quantile_sampling=False, correlation=None):
+class OutputsetLossTable:
     '''
-    Calculat gpqt Quantiles, handling partial / full correlations.
+    Group period loss table with the sampled losses stored once per outputset. The rows of a
+    groupset, with the `groupset_id` column and SummaryIds aligned to the groupset summary info,
+    are only expanded on request so an outputset in several groupsets is not duplicated in memory.
+
+    Args:
+        gplt (pd.DataFrame) : sampled losses with `outputset_id` and the outputset `SummaryId`.
+        group (ResultGroup) : ORD results group
     '''
-    if no_quantile_sampling:
-        gpqt['Quantile'] = None
-        return gpqt
 
-    if correlation is None or correlation == 0.0:  # uncorrelated
-        gpqt['Quantile'] = rng.random(size=len(gpqt))
-        return gpqt
+    def __init__(self, gplt, group):
+        self.gplt = gplt
+        self.outputsets = group.outputsets
+        self.groupset = group.groupset
+        self.summaryinfo_map = group.summaryinfo_map
 
-    output_cols = list(gpqt.columns) + ['Quantile']
+    @property
+    def groupset_ids(self):
+        return sorted(self.groupset.keys())
 
-    correlated = gpqt.drop(columns=['outputset_id']).drop_duplicates()
-    merge_cols = list(correlated.columns)
+    def get_groupset(self, groupset_id):
+        '''
+        Expand the gplt of a single groupset.
 
-    if correlation == 1.:  # fully correlated
-        correlated['Quantile'] = rng.random(size=len(correlated))
-        return gpqt.merge(correlated, on=merge_cols)
+        Args:
+            groupset_id (int) : groupset to expand.
 
-    # partial correlations
-    correlated['correlated'] = rng.normal(size=len(correlated))
-    gpqt = gpqt.merge(correlated, on=merge_cols)
+        Returns:
+            gplt (pd.DataFrame) : group period loss table of the groupset.
+        '''
+        outputset_ids = self.groupset[groupset_id]['outputsets']
+        gplt = self.gplt[self.gplt['outputset_id'].isin(outputset_ids)].reset_index(drop=True)
+        gplt['groupset_id'] = pd.Categorical(np.full(len(gplt), groupset_id), categories=self.groupset_ids)
+        gplt['SummaryId'] = self._align_summary_ids(gplt)
 
-    gpqt['uncorrelated'] = rng.normal(size=len(gpqt))
-    gpqt['partial'] = (gpqt['correlated'] * np.sqrt(correlation)
-                       + gpqt['uncorrelated'] * np.sqrt((1 - correlation))
-                       )
+        return gplt[GPLT_headers].astype({k: v for k, v in GPLT_dtype.items() if k != 'groupset_id'})
 
-    gpqt['Quantile'] = norm.cdf(gpqt['partial'])
-    return gpqt[output_cols]
+    def to_frame(self):
+        '''
+        Expand the gplt of all groupsets. Each row is repeated once per groupset of its outputset.
 
-# Loss Sampling
+        Returns:
+            gplt (pd.DataFrame) : group period loss table of all groupsets.
+        '''
+        outputset_groupsets = [self.outputsets[os_id].groupset_id for os_id in self.outputsets]
+        groupset_counts = pd.Series([len(gs_ids) for gs_ids in outputset_groupsets], index=list(self.outputsets))
+        groupset_starts = groupset_counts.cumsum() - groupset_counts
+        flat_groupset_ids = np.array([gs_id for gs_ids in outputset_groupsets for gs_id in gs_ids], dtype=np.int64)
+
+        outputset_ids = self.gplt['outputset_id'].to_numpy()
+        row_idx, groupset_pos = expand_csr(groupset_starts.loc[outputset_ids].to_numpy(),
+                                           groupset_counts.loc[outputset_ids].to_numpy())
+
+        gplt = self.gplt.iloc[row_idx].reset_index(drop=True)
+        gplt['groupset_id'] = flat_groupset_ids[groupset_pos]
+        gplt['SummaryId'] = self._align_summary_ids(gplt)
+
+        return gplt[GPLT_headers].astype(GPLT_dtype)
+
+    def _align_summary_ids(self, gplt):
+        '''Map outputset SummaryIds to the groupset SummaryIds with the summaryinfo lookups.'''
+        summary_ids = gplt['SummaryId'].to_numpy(copy=True)
+        groupset_ids = gplt['groupset_id'].to_numpy()
+        outputset_ids = gplt['outputset_id'].to_numpy()
+
+        for groupset_id in np.unique(groupset_ids):
+            for outputset_id in self.groupset[groupset_id]['outputsets']:
+                lookup = self.summaryinfo_map.get(SummaryInfoMapKey(groupset_id, outputset_id), None)
+                if lookup is None:
+                    continue
+
+                mask = (groupset_ids == groupset_id) & (outputset_ids == outputset_id) & (summary_ids < len(lookup))
+                summary_ids[mask] = lookup[summary_ids[mask]]
+
+        return summary_ids
 
 
 def do_loss_sampling(gpqt,
@@ -196,11 +284,32 @@ def do_loss_sampling(gpqt,
         group (ResultGroup) : ORD results group
         mean_only (bool) : Do mean only loss sampling.
         secondary_uncertainry (bool) : Perform secondary uncertainty loss sampling.
-        parametric_distribution (str) : The parameteric distribution used for sampling MELT files.
+        parametric_distribution (str) : The parameteric distribution used for sampling MELT files, see `distributions.PARAMETRIC_DISTRIBUTIONS`.
         format_priority (List[str]) : ELT file format priority order to load loss information. `M` = MELT, `Q` = QELT, `S` = SELT
 
     Returns:
-        gplt (pd.DataFrame) : group period loss table
+        gplt (pd.DataFrame) : group period loss table expanded for all groupsets
+    '''
+    return do_outputset_loss_sampling(gpqt, group,
+                                      mean_only=mean_only,
+                                      secondary_uncertainty=secondary_uncertainty,
+                                      parametric_distribution=parametric_distribution,
+                                      format_priority=format_priority).to_frame()
+
+
+def do_outputset_loss_sampling(gpqt,
+                               group,
+                               mean_only=False,
+                               secondary_uncertainty=False,
+                               parametric_distribution='beta',
+                               format_priority=['M', 'Q', 'S']
+                               ):
+    '''
+    Sample losses for grouped ORD, keeping a single copy of the losses per outputset. See
+    `do_loss_sampling` for args.
+
+    Returns:
+        gplt (OutputsetLossTable) : group period loss table
     '''
     if not mean_only and not secondary_uncertainty:
         logger.error("No loss sampling. Please set `group_mean` or `secondary_uncertainty`.")
@@ -209,16 +318,20 @@ def do_loss_sampling(gpqt,
     gplts = []
     if mean_only:
         logger.info("Loss sampling: mean only")
-        gplts.append(do_loss_sampling_mean_only(gpqt, group))
+        with profile_step('mean_only') as step:
+            gplts.append(do_loss_sampling_mean_only(gpqt, group))
+            step.rows = len(gplts[-1])
 
     if secondary_uncertainty:
-        gplts.append(do_loss_sampling_secondary_uncertainty(gpqt, group,
-                                                            format_priority=format_priority,
-                                                            parametric_distribution=parametric_distribution))
+        with profile_step('secondary_uncertainty') as step:
+            gplts.append(do_loss_sampling_secondary_uncertainty(gpqt, group,
+                                                                format_priority=format_priority,
+                                                                parametric_distribution=parametric_distribution))
+            step.rows = len(gplts[-1])
 
     gplt = pd.concat(gplts, ignore_index=True)
 
-    return gplt[GPLT_headers].astype(GPLT_dtype)
+    return OutputsetLossTable(gplt[OUTPUTSET_GPLT_headers].astype(OUTPUTSET_GPLT_dtype), group)
 
 
 def do_loss_sampling_mean_only(gpqt, group):
@@ -232,32 +345,27 @@ def do_loss_sampling_mean_only(gpqt, group):
     gplt_fragments = []
 
     for outputset_id in gpqt['outputset_id'].unique():
-        os = group.outputsets[outputset_id]
-        analysis = group.analyses[os.analysis_id]
+        with profile_step(f'outputset_{outputset_id}'):
+            os = group.outputsets[outputset_id]
+            analysis = group.analyses[os.analysis_id]
 
-        elt_paths = load_loss_table_paths(analysis,
-                                          summary_level_id=os.exposure_summary_level_id,
-                                          perspective=os.perspective_code,
-                                          output_type='elt')
+            elt_paths = load_loss_table_paths(analysis,
+                                              summary_level_id=os.exposure_summary_level_id,
+                                              perspective=os.perspective_code,
+                                              output_type='elt')
 
-        filtered_gpqt = gpqt[gpqt['outputset_id'] == outputset_id]
-        gplt_fragment = loss_sample_mean_only(filtered_gpqt, elt_paths)
+            filtered_gpqt = gpqt[gpqt['outputset_id'] == outputset_id]
+            gplt_fragment = loss_sample_mean_only(filtered_gpqt, elt_paths)
 
-        # filter na summaryids (no eventid in elt file)
-        gplt_fragment = _filter_missing_summaryids(gplt_fragment, outputset_id)
-        gplt_fragment = _fix_col_types(gplt_fragment)
-        gplt_fragment = _duplicate_gplt_per_groupset(gplt_fragment, os)
+            # filter na summaryids (no eventid in elt file)
+            gplt_fragment = _filter_missing_summaryids(gplt_fragment, outputset_id)
+            gplt_fragment = _fix_col_types(gplt_fragment)
 
-        # Apply summaryid map
-        groups = gplt_fragment.groupby(["groupset_id", "outputset_id"], group_keys=False)
-        gplt_fragment['SummaryId'] = groups.apply(apply_summaryid_replace,
-                                                  group_summaryinfo_map=group.summaryinfo_map)['SummaryId']
-
-        gplt_fragments.append(gplt_fragment)
+            gplt_fragments.append(gplt_fragment)
 
     gplt = pd.concat(gplt_fragments, ignore_index=True)
 
-    return gplt[GPLT_headers].astype(GPLT_dtype)
+    return gplt[OUTPUTSET_GPLT_headers].astype(OUTPUTSET_GPLT_dtype)
 
 
 def _filter_missing_summaryids(df, outputset_id=None):
@@ -275,34 +383,12 @@ def _fix_col_types(df):
     return df
 
 
-def _duplicate_gplt_per_groupset(gplt, outputset):
-    '''
-    Duplicates the gplt fragment based on the number of groupsets in the outputset.
-    '''
-    original_len = len(gplt)
-    index_repeats = np.repeat(np.arange(original_len), len(outputset.groupset_id))
-    gplt = gplt.iloc[index_repeats].reset_index(drop=True)
-    gplt['groupset_id'] = np.tile(outputset.groupset_id, original_len)
-
-    return gplt
-
-
-def apply_summaryid_replace(chunk, group_summaryinfo_map):
-    '''
-    Used in `group.apply` to map summaryid.
-    '''
-    _map = group_summaryinfo_map.get(chunk.name, None)
-    if _map is None:
-        return chunk
-
-    chunk['SummaryId'] = chunk['SummaryId'].map(lambda x: _map.get(x, x))
-    return chunk
-
-
 def loss_sample_mean_only(gpqt, elt_paths):
     assert 'melt' in elt_paths, 'Mean only can only be performed if melt files present.'
 
-    melt_df = load_melt(elt_paths['melt'])
+    with profile_step('load_melt') as step:
+        melt_df = load_melt(elt_paths['melt'])
+        step.rows = len(melt_df)
 
     grouped_df = melt_df.groupby(["SummaryId", "SampleType", "EventId"], as_index=False)
     melt_df = grouped_df.agg({'MeanLoss': 'sum'})
@@ -311,7 +397,9 @@ def loss_sample_mean_only(gpqt, elt_paths):
     melt_df = melt_df[["SummaryId", "EventId", "MeanLoss", "LossType"]]
 
     # GroupPeriod unique in gpqt
-    gplt = gpqt.merge(melt_df, on='EventId', how='left').rename(columns={"MeanLoss": "Loss"})
+    with profile_step('merge') as step:
+        gplt = gpqt.merge(melt_df, on='EventId', how='left').rename(columns={"MeanLoss": "Loss"})
+        step.rows = len(gplt)
     return gplt
 
 
@@ -326,7 +414,7 @@ def do_loss_sampling_secondary_uncertainty(gpqt, group,
         gpqt (pd.DataFrame) : group period quantile table
         group (ResultGroup) : ORD results group
         format_priority (List[str]) : ELT file format priority order to load loss information. `M` = MELT, `Q` = QELT, `S` = SELT
-        parametric_distribution (str) : The parameteric distribution used for sampling MELT files.
+        parametric_distribution (str) : The parameteric distribution used for sampling MELT files, see `distributions.PARAMETRIC_DISTRIBUTIONS`.
     """
     gplt_fragments = []
     loss_sampling_func_map = {
@@ -345,81 +433,76 @@ def do_loss_sampling_secondary_uncertainty(gpqt, group,
         logger.info(f'Running secondary unc loss sampling output_set_id: {outputset_id} - {count}/{n_outputsets}')
         count += 1
 
-        os = group.outputsets[outputset_id]
-        analysis = group.analyses[os.analysis_id]
-        sampling_args['S'] = {'number_of_samples': analysis.settings.get('number_of_samples', None)}
+        with profile_step(f'outputset_{outputset_id}'):
+            os = group.outputsets[outputset_id]
+            analysis = group.analyses[os.analysis_id]
+            sampling_args['S'] = {'number_of_samples': analysis.settings.get('number_of_samples', None)}
 
-        if sampling_args['S']['number_of_samples'] is None:
-            logger.warning(f'No `number_of_samples` in analysis {analysis.run_id} settings')
+            if sampling_args['S']['number_of_samples'] is None:
+                logger.warning(f'No `number_of_samples` in analysis {analysis.run_id} settings')
 
-        elt_paths = load_loss_table_paths(analysis,
-                                          summary_level_id=os.exposure_summary_level_id,
-                                          perspective=os.perspective_code,
-                                          output_type='elt')
+            elt_paths = load_loss_table_paths(analysis,
+                                              summary_level_id=os.exposure_summary_level_id,
+                                              perspective=os.perspective_code,
+                                              output_type='elt')
 
-        elt_dfs = {key: getattr(io, f'load_{key}')(value) for key, value in elt_paths.items()}  # todo handle this better (lazy load)
+            with profile_step('load_elt') as step:
+                elt_dfs = {key: getattr(io, f'load_{key}')(value) for key, value in elt_paths.items()}  # todo handle this better (lazy load)
+                step.rows = sum(len(elt_df) for elt_df in elt_dfs.values())
 
-        curr_gpqt = gpqt[gpqt['outputset_id'] == outputset_id].reset_index(drop=True)
+            curr_gpqt = gpqt[gpqt['outputset_id'] == outputset_id].reset_index(drop=True)
 
-        skip_records = None
-        for p in format_priority:
-            elt_df = elt_dfs.get(f'{p.lower()}elt', None)
+            skip_records = None
+            for p in format_priority:
+                elt_df = elt_dfs.get(f'{p.lower()}elt', None)
 
-            if elt_df is None:
-                logger.warning(f"{p.lower()}elt not found for outputset_id {outputset_id}.")
-                continue
+                if elt_df is None:
+                    logger.warning(f"{p.lower()}elt not found for outputset_id {outputset_id}.")
+                    continue
 
-            if p not in loss_sampling_func_map:
-                raise NotImplementedError(f"loss sampling function for format {p}elt not implemented")
+                if p not in loss_sampling_func_map:
+                    raise NotImplementedError(f"loss sampling function for format {p}elt not implemented")
 
-            _gplt_fragment, skip_records = loss_sampling_func_map[p.upper()](curr_gpqt, elt_df,
-                                                                             skip_records,
-                                                                             **sampling_args[p.upper()])
+                with profile_step(f'{p.lower()}elt_sampling') as step:
+                    _gplt_fragment, skip_records = loss_sampling_func_map[p.upper()](curr_gpqt, elt_df,
+                                                                                     skip_records,
+                                                                                     **sampling_args[p.upper()])
+                    step.rows = 0 if _gplt_fragment is None else len(_gplt_fragment)
 
-            if _gplt_fragment is None:  # no fragment
-                continue
+                if _gplt_fragment is None:  # no fragment
+                    continue
 
-            _gplt_fragment = _filter_missing_summaryids(_gplt_fragment, outputset_id)
-            _gplt_fragment = _fix_col_types(_gplt_fragment)
-            _gplt_fragment = _duplicate_gplt_per_groupset(_gplt_fragment, os)
-
-            # Apply summaryid map
-            groups = _gplt_fragment.groupby(["groupset_id", "outputset_id"], group_keys=False)
-            _gplt_fragment['SummaryId'] = groups.apply(apply_summaryid_replace,
-                                                       group_summaryinfo_map=group.summaryinfo_map)['SummaryId']
-            gplt_fragments.append(_gplt_fragment)
+                _gplt_fragment = _filter_missing_summaryids(_gplt_fragment, outputset_id)
+                _gplt_fragment = _fix_col_types(_gplt_fragment)
+                gplt_fragments.append(_gplt_fragment)
 
     gplt = pd.concat(gplt_fragments, ignore_index=True)
 
-    return gplt[GPLT_headers].astype(GPLT_dtype)
-
-
-def beta_sampling_group_loss(df):
-    df = df.copy()  # intermediate table for calc
-    df['mu'] = df['MeanLoss'] / df['MaxLoss']  # TODO need to verify form of this - also should we use MaxImpactedExposure as outlined in joh's sheet?
-    df['sigma'] = df['SDLoss'] / df['MaxLoss']
-
-    df['alpha'] = df['mu'] * (df['mu'] * (1 - df['mu']) / (df['sigma'] ** 2) - 1)
-    df['beta'] = df['alpha'] * (1 / df['mu'] - 1)
-
-    df_filter = df[['alpha', 'beta']].notna().all(axis='columns')
+    return gplt[OUTPUTSET_GPLT_headers].astype(OUTPUTSET_GPLT_dtype)
 
-    df.loc[df_filter, 'Loss'] = df.loc[df_filter, 'MaxLoss'] * \
-        betaincinv(df.loc[df_filter, 'alpha'], df.loc[df_filter, 'beta'], df.loc[df_filter, 'Quantile'])
 
-    df.loc[~df_filter, 'Loss'] = df.loc[~df_filter, 'MeanLoss']  # default to MeanLoss
+def _pack_summary_event(summary_ids, event_ids):
+    '''Pack (SummaryId, EventId) pairs into a single int64 key which sorts by SummaryId then EventId.'''
+    return (summary_ids.astype(np.int64) << 32) | event_ids.astype(np.uint32)
 
-    df = df.drop(columns=['alpha', 'beta', 'mu', 'sigma'])
 
-    df['LossType'] = 2  # set loss type
-
-    return df
+def _update_skip_records(skip_records, loss_sampled_df):
+    '''
+    Add the (SummaryId, EventId) pairs sampled in `loss_sampled_df` to the skip records. Skip records
+    are kept as a sorted array of unique packed (SummaryId, EventId) keys.
+    '''
+    additional_skip = np.unique(_pack_summary_event(loss_sampled_df['SummaryId'].to_numpy(),
+                                                    loss_sampled_df['EventId'].to_numpy()))
+    if skip_records is None:
+        return additional_skip
+    return np.union1d(skip_records, additional_skip)
 
 
 def _filter_elt_skipped(elt, skip_records, prefix=''):
-    if skip_records is not None:
-        elt_records = elt[['SummaryId', 'EventId']].to_records(index=False)
-        elt_mask = np.isin(elt_records, skip_records)
+    if skip_records is not None and len(skip_records):
+        elt_keys = _pack_summary_event(elt['SummaryId'].to_numpy(), elt['EventId'].to_numpy())
+        idx = np.minimum(np.searchsorted(skip_records, elt_keys), len(skip_records) - 1)
+        elt_mask = skip_records[idx] == elt_keys
         if elt_mask.all():
             logger.info(f'No additional events found in {prefix}elt file.')
             return None
@@ -428,41 +511,39 @@ def _filter_elt_skipped(elt, skip_records, prefix=''):
 
 
 def mean_loss_sampling(gpqt, melt, skip_records=None, sampling_func='beta'):
-    if sampling_func == 'beta':
-        sampling_func = beta_sampling_group_loss
-    else:
-        raise NotImplementedError(f'sampling func: {sampling_func} not implemented.')
+    sampling_func = get_parametric_distribution(sampling_func)
     original_cols = list(gpqt.columns)
 
     # sampling only works on SampleType 2
-    _melt = melt.query('SampleType==2')[['SummaryId', 'EventId', 'MeanLoss', 'SDLoss', 'MaxLoss']]
+    _melt = melt[melt['SampleType'] == 2][['SummaryId', 'EventId', 'MeanLoss', 'SDLoss', 'MaxLoss']]
 
     _melt = _filter_elt_skipped(_melt, skip_records, prefix='m')
     if _melt is None:
         return None, skip_records
 
-    merged = gpqt['EventId'].isin(_melt["EventId"])
+    # sort MELT by (SummaryId, EventId) and match every row with the gpqt rows of its EventId
+    summary_ids = _melt['SummaryId'].to_numpy()
+    event_ids = _melt['EventId'].to_numpy()
+    order = np.lexsort((event_ids, summary_ids))
+    melt_idx, gpqt_rows = _match_event_rows(event_ids[order], gpqt['EventId'].to_numpy())
 
-    if not merged.any():
+    if len(gpqt_rows) == 0:
         logger.info('Mean Loss Sampling: No additional matching EventIds found.')
         return None, skip_records
 
-    loss_sampled_df = gpqt[merged].merge(_melt, on='EventId', how='left')
-    loss_sampled_df = sampling_func(loss_sampled_df)
-
-    if loss_sampled_df.empty:
-        return None, skip_records
+    melt_rows = order[melt_idx]
+    loss = sampling_func(gpqt['Quantile'].to_numpy()[gpqt_rows],
+                         _melt['MeanLoss'].to_numpy()[melt_rows],
+                         _melt['SDLoss'].to_numpy()[melt_rows],
+                         _melt['MaxLoss'].to_numpy()[melt_rows])
 
+    loss_sampled_df = gpqt.iloc[gpqt_rows].reset_index(drop=True)
+    loss_sampled_df['SummaryId'] = summary_ids[melt_rows]
     loss_sampled_df["LossType"] = 2
+    loss_sampled_df['Loss'] = loss
     loss_sampled_df = loss_sampled_df[original_cols + ['SummaryId', 'LossType', 'Loss']]
 
-    additional_skip = loss_sampled_df[['SummaryId', 'EventId']].drop_duplicates().to_records(index=False)
-    if skip_records is not None:
-        skip_records = np.concatenate((skip_records, additional_skip))
-    else:
-        skip_records = additional_skip
-
-    return loss_sampled_df, skip_records
+    return loss_sampled_df, _update_skip_records(skip_records, loss_sampled_df)
 
 
 def quantile_loss_sampling(gpqt, qelt, skip_records=None):
@@ -472,116 +553,112 @@ def quantile_loss_sampling(gpqt, qelt, skip_records=None):
 
     original_cols = list(gpqt.columns)
 
-    summary_ids = qelt["SummaryId"].unique()
-    loss_sample_frags = []
-    for summary_id in summary_ids:
-        qelt_summary_id = qelt.query(f"SummaryId == {summary_id}").reset_index(drop=True)
-        curr_gpqt = gpqt[gpqt['EventId'].isin(qelt_summary_id['EventId'])].reset_index(drop=True)
-        curr_loss_frag = quantile_loss_sampling__summary_id(curr_gpqt, qelt_summary_id)
-        curr_loss_frag["SummaryId"] = summary_id
-        loss_sample_frags.append(curr_loss_frag)
-
-    loss_sampled_df = pd.concat(loss_sample_frags)
-
-    if loss_sampled_df.empty:
+    # sort QELT by (SummaryId, EventId, LTQuantile), each (SummaryId, EventId) pair is a block of quantiles
+    summary_ids = qelt['SummaryId'].to_numpy()
+    event_ids = qelt['EventId'].to_numpy()
+    order = np.lexsort((qelt['LTQuantile'].to_numpy(), event_ids, summary_ids))
+    lt_quantiles = qelt['LTQuantile'].to_numpy(dtype=np.float32)[order]
+    quantile_losses = qelt['QuantileLoss'].to_numpy()[order]
+
+    block_keys, block_starts, block_counts = np.unique(_pack_summary_event(summary_ids[order], event_ids[order]),
+                                                       return_index=True, return_counts=True)
+    block_summary_ids = (block_keys >> 32).astype(summary_ids.dtype)
+    block_event_ids = (block_keys & 0xFFFFFFFF).astype(event_ids.dtype)
+
+    # every event of a summary id must have the same number of quantiles
+    summary_starts = np.flatnonzero(np.r_[True, block_summary_ids[1:] != block_summary_ids[:-1]])
+    summary_counts = np.maximum.reduceat(block_counts, summary_starts)
+    expected_counts = np.repeat(summary_counts, np.diff(np.r_[summary_starts, len(block_counts)]))
+    assert (block_counts == expected_counts).all() and (block_counts > 1).all(), 'QELT file does not match expected size, is it complete?'
+
+    # match every block with the gpqt rows of its EventId
+    block_idx, gpqt_rows = _match_event_rows(block_event_ids, gpqt['EventId'].to_numpy())
+    if len(gpqt_rows) == 0:
         return None, skip_records
 
+    # non-negative float32 bits sort in the same order as the floats, so (block, quantile) packs into one sortable key
+    block_quantile_key = ((np.repeat(np.arange(len(block_keys), dtype=np.int64), block_counts) << 32)
+                          | lt_quantiles.view(np.uint32))
+    gpqt_quantile = gpqt['Quantile'].to_numpy()[gpqt_rows]
+    query_key = (block_idx.astype(np.int64) << 32) | gpqt_quantile.astype(np.float32).view(np.uint32)
+
+    q_l = np.searchsorted(block_quantile_key, query_key) - 1
+    q_l = np.clip(q_l, block_starts[block_idx], block_starts[block_idx] + block_counts[block_idx] - 2)
+    q_r = q_l + 1
+
+    loss_sampled_df = gpqt.iloc[gpqt_rows].reset_index(drop=True)
+    loss_sampled_df['SummaryId'] = block_summary_ids[block_idx]
+    loss_sampled_df['Loss'] = quantile_losses[q_l] + ((gpqt_quantile - lt_quantiles[q_l]) *
+                                                      (quantile_losses[q_r] - quantile_losses[q_l]) /
+                                                      (lt_quantiles[q_r] - lt_quantiles[q_l]))
     loss_sampled_df["LossType"] = 2
     loss_sampled_df = loss_sampled_df[original_cols + ["SummaryId", "LossType", "Loss"]]
 
-    additional_skip = loss_sampled_df[['SummaryId', 'EventId']].drop_duplicates().to_records(index=False)
-    if skip_records is not None:
-        skip_records = np.concatenate((skip_records, additional_skip))
-    else:
-        skip_records = additional_skip
+    return loss_sampled_df, _update_skip_records(skip_records, loss_sampled_df)
 
-    return loss_sampled_df, skip_records
 
+def _match_event_rows(block_event_ids, gpqt_event_ids):
+    '''
+    Match each block to all gpqt rows with the same EventId.
 
-def quantile_loss_sampling__summary_id(gpqt, qelt):
-    q_arr = qelt[['EventId', 'LTQuantile', 'QuantileLoss']].to_records(index=False)
-    quantiles = np.sort(np.unique(q_arr['LTQuantile']))
-    no_quantiles = len(quantiles)
-    no_eventids = len(np.unique(q_arr['EventId']))
+    Returns:
+        block_idx (np.ndarray): block index of each match, in block order.
+        gpqt_rows (np.ndarray): gpqt row position of each match.
+    '''
+    gpqt_order = np.argsort(gpqt_event_ids, kind='stable')
+    gpqt_events, gpqt_starts, gpqt_counts = np.unique(gpqt_event_ids[gpqt_order], return_index=True, return_counts=True)
+    if len(gpqt_events) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
 
-    assert len(q_arr) == no_quantiles * no_eventids, 'QELT file does not match expected size, is it complete?'
-    first_eventid_map = np.zeros((no_eventids, 2), dtype=int)
-    first_eventid_map[:, 1] = np.arange(no_eventids) * no_quantiles
-    first_eventid_map[:, 0] = q_arr[first_eventid_map[:, 1]]['EventId']
-    first_eventid_map = pd.Series(data=first_eventid_map[:, 1], index=first_eventid_map[:, 0])
+    idx = np.minimum(np.searchsorted(gpqt_events, block_event_ids), len(gpqt_events) - 1)
+    counts = np.where(gpqt_events[idx] == block_event_ids, gpqt_counts[idx], 0)
+    block_idx, positions = expand_csr(gpqt_starts[idx], counts)
+    return block_idx, gpqt_order[positions]
 
-    gpqt_quantile = gpqt['Quantile'].to_numpy()
-    q_ind = np.digitize(gpqt_quantile, quantiles, right=True) - 1
-    q_ind = q_ind + gpqt['EventId'].map(first_eventid_map).to_numpy()
 
-    q_l_arr = q_arr[q_ind]
-    q_r_arr = q_arr[q_ind + 1]
-    loss_df = gpqt.copy().reset_index(drop=True)
-    loss_df['Loss'] = q_l_arr['QuantileLoss'] + ((gpqt_quantile - q_l_arr['LTQuantile']) *
-                                                 (q_r_arr['QuantileLoss'] - q_l_arr['QuantileLoss']) /
-                                                 (q_r_arr['LTQuantile'] - q_l_arr['LTQuantile']))
-    return loss_df
+def sample_loss_sampling(gpqt, selt, skip_records=None, number_of_samples=10):
+    original_cols = list(gpqt.columns)
 
+    selt = _filter_elt_skipped(selt, skip_records, prefix='s')
+    if selt is None:
+        return None, skip_records
 
-def sample_loss_sampling__summary_id(gpqt, selt, number_of_samples):
     if number_of_samples is None:
         raise OdsException('Number of samples not provided.')
-    loss_df = gpqt.copy()
-    selt_loss = selt.copy()
 
-    selt_by_eventid = selt_loss.groupby('EventId')
+    # sort SELT by (SummaryId, EventId, SampleLoss), each (SummaryId, EventId) pair is a block of ranked samples
+    summary_ids = selt['SummaryId'].to_numpy()
+    event_ids = selt['EventId'].to_numpy()
+    sample_losses = selt['SampleLoss'].to_numpy()
+    order = np.lexsort((sample_losses, event_ids, summary_ids))
+    sample_losses = sample_losses[order]
 
-    missing_sampleids = selt_by_eventid.agg({'SampleId': 'count'}).rename(columns={'SampleId': 'count'})
-    missing_sampleids['missing'] = number_of_samples - missing_sampleids['count']
+    block_keys, block_starts, block_counts = np.unique(_pack_summary_event(summary_ids[order], event_ids[order]),
+                                                       return_index=True, return_counts=True)
+    block_summary_ids = (block_keys >> 32).astype(summary_ids.dtype)
+    block_event_ids = (block_keys & 0xFFFFFFFF).astype(event_ids.dtype)
 
-    if missing_sampleids['count'].max() > number_of_samples:
+    if block_counts.max(initial=0) > number_of_samples:
         logger.error('sample id count greater than number of samples')
 
-    loss_df = loss_df.merge(missing_sampleids[['missing']], how='left', left_on='EventId', right_index=True)
-    loss_df['sample_idx'] = (loss_df['Quantile'] * number_of_samples).astype(int) - loss_df['missing']
-
-    selt_loss['SampleLossRank'] = selt_by_eventid['SampleLoss'].rank(method='first').astype(int) - 1
-
-    selt_loss = selt_loss[['EventId', 'SampleLossRank', 'SampleLoss']]
-    loss_df = loss_df.merge(selt_loss, left_on=['EventId', 'sample_idx'],
-                            right_on=['EventId', 'SampleLossRank'],
-                            how='left')
-    loss_df['Loss'] = loss_df['SampleLoss'].fillna(0.0)
-    return loss_df
-
-
-def sample_loss_sampling(gpqt, selt, skip_records=None, number_of_samples=10):
-    original_cols = list(gpqt.columns)
-
-    selt = _filter_elt_skipped(selt, skip_records, prefix='s')
-    if selt is None:
+    # match every block with the gpqt rows of its EventId
+    block_idx, gpqt_rows = _match_event_rows(block_event_ids, gpqt['EventId'].to_numpy())
+    if len(gpqt_rows) == 0:
         return None, skip_records
 
-    # selt = selt.sort_values(by=['EventId', 'SampleLoss'], ascending=True)
-    summary_ids = selt["SummaryId"].unique()
-
-    loss_sample_frags = []
-    for summary_id in summary_ids:
-        selt_summary_id = selt.query(f"SummaryId == {summary_id}").reset_index(drop=True)
-        curr_gpqt = gpqt[gpqt['EventId'].isin(selt_summary_id['EventId'])]
-        curr_loss_frag = sample_loss_sampling__summary_id(curr_gpqt,
-                                                          selt_summary_id,
-                                                          number_of_samples)
-        curr_loss_frag["SummaryId"] = summary_id
-        loss_sample_frags.append(curr_loss_frag)
+    # missing samples are zero losses ranked below the samples present in the SELT
+    gpqt_quantile = gpqt['Quantile'].to_numpy()[gpqt_rows]
+    counts = block_counts[block_idx]
+    sample_idx = (gpqt_quantile * number_of_samples).astype(np.int64) - (number_of_samples - counts)
+    has_sample = (sample_idx >= 0) & (sample_idx < counts)
 
-    loss_sampled_df = pd.concat(loss_sample_frags)
-
-    if loss_sampled_df.empty:
-        return None, skip_records
+    loss = np.zeros(len(gpqt_rows), dtype=sample_losses.dtype)
+    loss[has_sample] = sample_losses[block_starts[block_idx[has_sample]] + sample_idx[has_sample]]
 
+    loss_sampled_df = gpqt.iloc[gpqt_rows].reset_index(drop=True)
+    loss_sampled_df['SummaryId'] = block_summary_ids[block_idx]
+    loss_sampled_df['Loss'] = loss
     loss_sampled_df["LossType"] = 2
     loss_sampled_df = loss_sampled_df[original_cols + ["SummaryId", "LossType", "Loss"]]
 
-    additional_skip = loss_sampled_df[['SummaryId', 'EventId']].drop_duplicates().to_records(index=False)
-    if skip_records is not None:
-        skip_records = np.concatenate((skip_records, additional_skip))
-    else:
-        skip_records = additional_skip
-
-    return loss_sampled_df, skip_records
+    return loss_sampled_df, _update_skip_records(skip_records, loss_sampled_df)
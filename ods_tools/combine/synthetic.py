@@ -0,0 +1,223 @@
+"""
+Synthetic ORD analysis directories for benchmarking combine.
+
+Each generated analysis directory contains the analysis settings, an `occurrence.bin` and the
+gul summary info and ELT files (any mix of MELT, QELT and SELT) of a single summary level. All
+analyses share the same event set so they are combined into a single groupeventset.
+"""
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from ods_tools.combine.io import DEFAULT_OCC_DTYPE
+
+ELT_FORMAT_NAMES = {'M': 'melt', 'Q': 'qelt', 'S': 'selt'}
+
+
+@dataclass
+class SyntheticORDConfig:
+    '''
+    Scale of the synthetic ORD analyses.
+
+    Attributes:
+        num_analyses (int): number of analysis directories.
+        num_events (int): number of events in the event set.
+        num_periods (int): number of periods in the occurrence file.
+        occurrences_per_event (int): number of periods each event occurs in.
+        num_summary_ids (int): number of SummaryIds in each analysis.
+        event_loss_density (float): fraction of (SummaryId, EventId) pairs with a loss.
+        number_of_samples (int): number of samples in the SELT.
+        num_quantiles (int): number of quantiles per (SummaryId, EventId) in the QELT.
+        elt_formats (List[str]): ELT formats of each analysis, cycled over the analyses, e.g. `['MQS', 'M']`
+            gives the first analysis MELT, QELT and SELT files and the second only a MELT.
+        output_format (str): ELT file format, `csv` or `parquet`.
+        seed (int): random seed.
+    '''
+    num_analyses: int = 2
+    num_events: int = 1000
+    num_periods: int = 1000
+    occurrences_per_event: int = 1
+    num_summary_ids: int = 10
+    event_loss_density: float = 0.5
+    number_of_samples: int = 10
+    num_quantiles: int = 5
+    elt_formats: List[str] = field(default_factory=lambda: ['MQS'])
+    output_format: str = 'csv'
+    seed: int = 2479
+
+
+def write_occurrence_bin(path, event_ids, period_nos, no_of_periods, date_opts=1):
+    '''
+    Write an `occurrence.bin` with the default occurrence record dtype.
+    '''
+    records = np.zeros(len(event_ids), dtype=np.dtype(DEFAULT_OCC_DTYPE))
+    records['event_id'] = event_ids
+    records['period_no'] = period_nos
+    records['occ_date_id'] = np.arange(1, len(event_ids) + 1)
+
+    with open(path, 'wb') as f:
+        np.array([date_opts, no_of_periods], dtype=np.int32).tofile(f)
+        records.tofile(f)
+
+
+def _analysis_settings(analysis_id, config, elt_formats):
+    ord_output = {
+        'elt_moment': 'M' in elt_formats,
+        'elt_quantile': 'Q' in elt_formats,
+        'elt_sample': 'S' in elt_formats,
+    }
+    return {
+        'version': '3',
+        'analysis_tag': f'synthetic-{analysis_id}',
+        'source_tag': 'synthetic',
+        'model_name_id': 'synthetic',
+        'model_supplier_id': 'ods_tools',
+        'number_of_samples': config.number_of_samples,
+        'model_settings': {
+            'event_set': 'p',
+            'event_occurrence_id': 'lt'
+        },
+        'gul_output': True,
+        'gul_summaries': [{'id': 1, 'ord_output': ord_output, 'oed_fields': ['LocNumber']}],
+        'il_output': False,
+        'ri_output': False,
+    }
+
+
+def _write_elt(df, path, output_format):
+    if output_format == 'parquet':
+        df.to_parquet(path.with_suffix('.parquet'), index=False)
+    else:
+        df.to_csv(path.with_suffix('.csv'), index=False, float_format='%.6f')
+
+
+def _event_losses(rng, config, tiv):
+    '''Sample the (SummaryId, EventId) pairs with a loss and their mean, standard deviation and max loss.'''
+    num_pairs = int(config.num_events * config.num_summary_ids * config.event_loss_density)
+    pair_keys = np.sort(rng.choice(config.num_events * config.num_summary_ids, size=num_pairs, replace=False))
+    summary_ids = (pair_keys // config.num_events + 1).astype(np.int32)
+    event_ids = (pair_keys % config.num_events + 1).astype(np.int32)
+
+    max_loss = tiv[summary_ids - 1]
+    mean_loss = max_loss * rng.uniform(0.01, 0.3, num_pairs)
+    sd_loss = mean_loss * rng.uniform(0.1, 1.0, num_pairs)
+    return summary_ids, event_ids, mean_loss, sd_loss, max_loss
+
+
+def _melt(summary_ids, event_ids, mean_loss, sd_loss, max_loss, config):
+    # SampleType 1 is the analytical mean without uncertainty, SampleType 2 the sample mean
+    num_pairs = len(summary_ids)
+    melt = pd.DataFrame({
+        'EventId': np.repeat(event_ids, 2),
+        'SummaryId': np.repeat(summary_ids, 2),
+        'SampleType': np.tile([1, 2], num_pairs),
+        'EventRate': 1 / config.num_periods,
+        'ChanceOfLoss': np.tile([0., 1.], num_pairs),
+        'MeanLoss': np.repeat(mean_loss, 2),
+        'SDLoss': np.column_stack([np.zeros(num_pairs), sd_loss]).ravel(),
+        'MaxLoss': np.repeat(max_loss, 2),
+        'FootprintExposure': np.repeat(max_loss, 2),
+        'MeanImpactedExposure': np.repeat(max_loss, 2),
+        'MaxImpactedExposure': np.repeat(max_loss, 2),
+    })
+    return melt
+
+
+def _qelt(rng, summary_ids, event_ids, mean_loss, max_loss, config):
+    num_pairs, num_quantiles = len(summary_ids), config.num_quantiles
+    # increasing losses from 0 up to at most the max loss for each (SummaryId, EventId)
+    steps = rng.exponential(size=(num_pairs, num_quantiles))
+    steps[:, 0] = 0
+    losses = np.cumsum(steps, axis=1)
+    losses *= (np.minimum(2 * mean_loss, max_loss) / losses[:, -1])[:, None]
+    qelt = pd.DataFrame({
+        'EventId': np.repeat(event_ids, num_quantiles),
+        'SummaryId': np.repeat(summary_ids, num_quantiles),
+        'Quantile': np.tile(np.linspace(0, 1, num_quantiles), num_pairs),
+        'Loss': losses.ravel(),
+    })
+    return qelt
+
+
+def _selt(rng, summary_ids, event_ids, mean_loss, max_loss, config):
+    num_pairs, num_samples = len(summary_ids), config.number_of_samples
+    # zero losses are not written, so only some samples of each (SummaryId, EventId) are present
+    sample_losses = np.minimum(rng.exponential(size=(num_pairs, num_samples)) * mean_loss[:, None], max_loss[:, None])
+    sample_losses[rng.random((num_pairs, num_samples)) < 0.2] = 0
+    pair_idx, sample_idx = np.nonzero(sample_losses)
+
+    # SampleId -1 is the analytical mean
+    selt = pd.DataFrame({
+        'EventId': np.r_[event_ids, event_ids[pair_idx]],
+        'SummaryId': np.r_[summary_ids, summary_ids[pair_idx]],
+        'SampleId': np.r_[np.full(num_pairs, -1), sample_idx + 1].astype(np.int32),
+        'Loss': np.r_[mean_loss, sample_losses[pair_idx, sample_idx]],
+        'ImpactedExposure': np.r_[max_loss, max_loss[pair_idx]],
+    })
+    return selt.sort_values(['EventId', 'SummaryId', 'SampleId'], ignore_index=True)
+
+
+def generate_synthetic_ord(output_dir, config=None):
+    '''
+    Generate synthetic ORD analysis directories.
+
+    Args:
+        output_dir (str | pathlib.Path): directory to create the analysis directories in.
+        config (SyntheticORDConfig): scale of the analyses, defaults to `SyntheticORDConfig()`.
+
+    Returns:
+        analysis_dirs (List[pathlib.Path]): paths to the generated analysis directories.
+    '''
+    config = SyntheticORDConfig() if config is None else config
+    output_dir = Path(output_dir)
+    rng = np.random.default_rng(config.seed)
+
+    # all analyses share the event set and occurrences
+    event_ids = np.repeat(np.arange(1, config.num_events + 1, dtype=np.int32), config.occurrences_per_event)
+    period_nos = rng.integers(1, config.num_periods + 1, size=len(event_ids), dtype=np.int32)
+    occ_order = np.lexsort((event_ids, period_nos))
+
+    analysis_dirs = []
+    for i in range(config.num_analyses):
+        analysis_dir = output_dir / f'analysis_{i + 1}'
+        (analysis_dir / 'input').mkdir(parents=True, exist_ok=True)
+        (analysis_dir / 'output').mkdir(parents=True, exist_ok=True)
+
+        elt_formats = config.elt_formats[i % len(config.elt_formats)]
+        with open(analysis_dir / 'analysis_settings.json', 'w') as f:
+            json.dump(_analysis_settings(i + 1, config, elt_formats), f, indent=4)
+
+        write_occurrence_bin(analysis_dir / 'input' / 'occurrence.bin',
+                             event_ids[occ_order], period_nos[occ_order], config.num_periods)
+
+        # half of the locations of each analysis overlap with the next analysis
+        tiv = rng.uniform(1e5, 1e7, config.num_summary_ids)
+        summary_info = pd.DataFrame({
+            'summary_id': np.arange(1, config.num_summary_ids + 1),
+            'LocNumber': np.arange(1, config.num_summary_ids + 1) + i * (config.num_summary_ids // 2),
+            'tiv': tiv,
+        })
+        summary_info.to_csv(analysis_dir / 'output' / 'gul_S1_summary-info.csv', index=False)
+
+        summary_ids, elt_event_ids, mean_loss, sd_loss, max_loss = _event_losses(rng, config, tiv)
+        for elt_format in elt_formats:
+            if elt_format == 'M':
+                elt = _melt(summary_ids, elt_event_ids, mean_loss, sd_loss, max_loss, config)
+            elif elt_format == 'Q':
+                elt = _qelt(rng, summary_ids, elt_event_ids, mean_loss, max_loss, config)
+            elif elt_format == 'S':
+                elt = _selt(rng, summary_ids, elt_event_ids, mean_loss, max_loss, config)
+            else:
+                raise ValueError(f'Unknown ELT format {elt_format}, expected one of {list(ELT_FORMAT_NAMES)}')
+            _write_elt(elt, analysis_dir / 'output' / f'gul_S1_{ELT_FORMAT_NAMES[elt_format]}', config.output_format)
+
+        analysis_dirs.append(analysis_dir)
+
+    with open(output_dir / 'synthetic_ord_config.json', 'w') as f:
+        json.dump(asdict(config), f, indent=4)
+
+    return analysis_dirs
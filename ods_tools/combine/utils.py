@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from dataclasses import asdict
 from collections import namedtuple
@@ -15,4 +16,22 @@ def hash_summary_level_fields(summary_level_fields):
     return str(summary_level_fields)
 
 
+def expand_csr(starts, counts):
+    """
+    Expand CSR style (start, count) ranges into flat positions.
+
+    Args:
+        starts (np.ndarray): start position of each range.
+        counts (np.ndarray): length of each range.
+
+    Returns:
+        range_idx (np.ndarray): index of the range each position belongs to.
+        positions (np.ndarray): positions covered by the ranges, in range order.
+    """
+    range_idx = np.repeat(np.arange(len(counts)), counts)
+    range_offsets = np.cumsum(counts) - counts
+    positions = np.asarray(starts)[range_idx] + np.arange(len(range_idx)) - range_offsets[range_idx]
+    return range_idx, positions
+
+
 SummaryInfoMapKey = namedtuple("SummaryInfoMapKey", "groupset_id outputset_id")
@@ -9,6 +9,7 @@ __all__ = [
 ]
 
 import argparse
+import cProfile
 import json
 import logging
 import os
@@ -133,9 +134,16 @@ def combine(**kwargs):
     """
     try:
         config = read_combine_config(kwargs.get('config_file'))
-        combine_result = combine_ord(analysis_dirs=kwargs.get('analysis_dirs'),
-                                     output_dir=kwargs.get('output_dir'),
-                                     **config)
+        combine_kwargs = dict(analysis_dirs=kwargs.get('analysis_dirs'), output_dir=kwargs.get('output_dir'), **config)
+        if kwargs.get('profile'):
+            profiler = cProfile.Profile()
+            try:
+                combine_result = profiler.runcall(combine_ord, **combine_kwargs)
+            finally:
+                profiler.dump_stats(kwargs['profile'])
+                logger.info(f"Saved cProfile stats: {kwargs['profile']}")
+        else:
+            combine_result = combine_ord(**combine_kwargs)
     except OdsException as e:
         logger.error('Combine failed')
         logger.error(e)
@@ -296,6 +304,7 @@ combine_command = command_parser.add_parser('combine', description=combine_descr
 combine_command.add_argument('--analysis-dirs', '-a', required=True, nargs='+', help='List of paths to analysis results directories')
 combine_command.add_argument('--output-dir', help='Path to output directory', default=None)
 combine_command.add_argument('--config-file', required=True, help='Path to the config file')
+combine_command.add_argument('--profile', help='Run under cProfile and dump the stats to this path', default=None)
 combine_command.add_argument('-v', '--logging-level', help='logging level (debug:10, info:20, warning:30, error:40, critical:50)',
                              default=30, type=int)
 
@@ -1,11 +1,17 @@
 from typing import Any, AsyncIterable, Dict, Iterable
 
+import pandas as pd
+
 
 class BaseConnector:
     """
     Connects to the the data source
 
     :param config: The global config for the system
+    :param isExtractor: Whether the connector extracts the input data or
+        loads the output data
+    :param mapper: The mapper of the transformation, used by extractors to
+        read the input data into the types of the mapping
     :param options_schema: A dictionary representing the
         schema of field connectors options json schema property
         types (https://python-jsonschema.readthedocs.io/en/stable/)
@@ -16,9 +22,10 @@ class BaseConnector:
     name = "Base Connector"
     options_schema = {"type": "object", "properties": {}}
 
-    def __init__(self, config, isExtractor):
+    def __init__(self, config, isExtractor, mapper=None):
         self.config = config
         self.isExtractor = isExtractor
+        self.mapper = mapper
 
     def extract(self) -> Iterable[Dict[str, Any]]:
         """
@@ -39,21 +46,22 @@ class BaseConnector:
         raise NotImplementedError()
         yield {}  # pragma: no cover
 
-    def load(self, data: Iterable[Dict[str, Any]]):
+    def load(self, data: Iterable[pd.DataFrame]):
         """
         Loads the data into the connected data object.
 
-        :param data: An iterable of dictionaries representing
-            the data to push to the connected source.
+        :param data: An iterable of dataframes, one per transformed batch,
+            representing the data to push to the connected source.
         """
         raise NotImplementedError()
 
-    async def aload(self, data: AsyncIterable[Dict[str, Any]]):
+    async def aload(self, data: AsyncIterable[pd.DataFrame]):
         """
         Loads the data into the connected data object.
 
-        :param data: An iterable of dictionaries representing
-            the data to push to the connected source.
+        :param data: An asynchronous iterable of dataframes, one per
+            transformed batch, representing the data to push to the
+            connected source.
         """
         raise NotImplementedError()
 
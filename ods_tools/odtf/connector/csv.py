@@ -1,10 +1,33 @@
-from typing import Any, Dict, Iterable
+import csv
+import re
+from typing import Iterable
 
-import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
+from ..errors import ConverterError
 from .base import BaseConnector
-from ..notset import NotSetType
+
+QUOTING = {
+    "all": csv.QUOTE_ALL,
+    "minimal": csv.QUOTE_MINIMAL,
+    "none": csv.QUOTE_NONE,
+    "nonnumeric": csv.QUOTE_NONNUMERIC,
+}
+
+#: Arrow types the mapping types are read as, ints are read as floats as the
+#: type coercion converts them through floats
+ARROW_COLUMN_TYPES = {
+    "int": pa.float64(),
+    "float": pa.float64(),
+    "string": pa.string(),
+}
+
+#: Null values pandas reads by default which arrow doesn't
+PANDAS_NULL_VALUES = ["None", "<NA>"]
+
+ARROW_COLUMN_ERROR = re.compile(r"CSV column #(\d+)")
 
 
 class CsvConnector(BaseConnector):
@@ -21,7 +44,16 @@ class CsvConnector(BaseConnector):
       Descriptions of these values are given in the
       `python csv module documentation
       <https://docs.python.org/3/library/csv.html#csv.QUOTE_ALL>`__.
-      (default: `nonnumeric`).
+      (default: `minimal`).
+    * `engine` - The parser used to read the input file, `pandas` or
+      `pyarrow`. The `pyarrow` engine streams the file and reads the columns
+      straight into the types of the mapping, columns without a type in the
+      mapping are read as strings. A value which can't be read as the type
+      of its column stops the extraction with an error naming the column,
+      rather than being reported per row. (default: `pandas`).
+
+    When extracting with a mapping only the columns the mapping reads are
+    parsed from the input file.
     """
 
     name = "CSV Connector"
@@ -51,47 +83,50 @@ class CsvConnector(BaseConnector):
                     "for a description of the values)"
                 ),
                 "enum": ["all", "minimal", "none", "nonnumeric"],
-                "default": "nonnumeric",
+                "default": "minimal",
                 "title": "Quoting",
             },
+            "engine": {
+                "type": "string",
+                "description": "The parser used to read the input file",
+                "enum": ["pandas", "pyarrow"],
+                "default": "pandas",
+                "title": "Engine",
+            },
         },
         "required": ["path"],
     }
 
-    def __init__(self, config, isExtractor):
-        super().__init__(config, isExtractor)
+    def __init__(self, config, isExtractor, mapper=None):
+        super().__init__(config, isExtractor, mapper)
         if isExtractor:
             self.file_path = config['input']['path']
+            self.engine = config['input'].get('engine', 'pandas')
         else:
             self.file_path = config['output']['path']
+            self.quoting = QUOTING[config['output'].get('quoting', 'minimal')]
         self.write_header = config.get("write_header", True)
 
-    def _data_serializer(self, row):
-        def process_value(v):
-            if v is None or isinstance(v, NotSetType):
-                return ""
-            # add quotes to values that contain special characters
-            if isinstance(v, str) and any(d in v for d in [',', ';', '\t', '\n', '"']):
-                return f'"{v}"'
-            return str(v)
-
-        return [process_value(v) for v in row.values()]
+    def load(self, data: Iterable[pd.DataFrame]):
+        """
+        Write the transformed batches to the csv file, each batch is written
+        in a single `to_csv` call.
 
-    def load(self, data: Iterable[Dict[str, Any]]):
-        first_batch = True
+        :param data: Iterable of transformed batches
+        """
+        write_header = self.write_header
 
         with open(self.file_path, "w", newline="") as f:
             for batch in data:
-                fieldnames = list(batch.keys())
-
-                rows = np.array([self._data_serializer(batch)])
-
-                if first_batch and self.write_header:
-                    header = ','.join(fieldnames)
-                    np.savetxt(f, [], fmt='%s', delimiter=',', header=header, comments='')
-                    first_batch = False
-
-                np.savetxt(f, rows, fmt='%s', delimiter=',', comments='')
+                batch.to_csv(
+                    f,
+                    index=False,
+                    header=write_header,
+                    quoting=self.quoting,
+                    escapechar="\\" if self.quoting == csv.QUOTE_NONE else None,
+                    lineterminator="\n",
+                )
+                write_header = False
 
     def fetch_data(self, chunksize: int) -> Iterable[pd.DataFrame]:
         """
@@ -100,5 +135,108 @@ class CsvConnector(BaseConnector):
         :param chunksize: Number of rows per batch
         :return: Iterable of data batches as pandas DataFrames
         """
-        for batch in pd.read_csv(self.file_path, chunksize=chunksize, low_memory=False):
+        if self.engine == "pyarrow":
+            yield from self._fetch_arrow_data(chunksize)
+            return
+
+        usecols = None if self.mapper is None else self._selected_columns(self._read_header())
+        for batch in pd.read_csv(self.file_path, chunksize=chunksize, low_memory=False, usecols=usecols):
             yield batch
+
+    def _read_header(self):
+        with open(self.file_path, newline="", encoding="utf-8-sig", errors="replace") as f:
+            return next(csv.reader(f), [])
+
+    def _selected_columns(self, header):
+        """
+        Columns of the csv file read by the mapping, `None` if all the columns
+        are read.
+
+        :param header: The columns of the csv file
+        :return: List of the columns to read
+        """
+        input_columns = self.mapper.get_input_columns()
+        selected = [column for column in header if column in input_columns]
+        # the rows are still read when the mapping doesn't read any column
+        if not selected or len(selected) == len(header):
+            return None
+        return selected
+
+    def _arrow_convert_options(self):
+        """
+        Options converting the csv columns read by the mapping to the types of
+        the mapping with the null values of the mapping.
+        """
+        if self.mapper is None:
+            return pacsv.ConvertOptions()
+
+        header = self._read_header()
+        types = self.mapper.types
+        null_values = (
+            pacsv.ConvertOptions().null_values
+            + PANDAS_NULL_VALUES
+            + [v for v in self.mapper.null_values if isinstance(v, str)]
+        )
+        return pacsv.ConvertOptions(
+            column_types={
+                column: ARROW_COLUMN_TYPES[types[column].type] if column in types else pa.string()
+                for column in header
+            },
+            include_columns=self._selected_columns(header) or [],
+            null_values=null_values,
+            strings_can_be_null=True,
+        )
+
+    def _open_arrow_reader(self):
+        try:
+            return pacsv.open_csv(self.file_path, convert_options=self._arrow_convert_options())
+        except pa.ArrowInvalid as e:
+            raise self._arrow_conversion_error(e) from e
+
+    def _read_arrow_batches(self, reader):
+        try:
+            yield from reader
+        except pa.ArrowInvalid as e:
+            raise self._arrow_conversion_error(e) from e
+
+    def _arrow_conversion_error(self, error):
+        """
+        Error for a csv value arrow failed to read, naming the column and the
+        file it was read from.
+        """
+        column = None
+        match = ARROW_COLUMN_ERROR.search(str(error))
+        if match:
+            header = self._read_header()
+            index = int(match.group(1))
+            column = header[index] if index < len(header) else None
+        return ConverterError(f"Cannot read column {column} of {self.file_path}: {error}")
+
+    def _fetch_arrow_data(self, chunksize):
+        """
+        Stream the csv file with the arrow csv reader, the record batches
+        read are regrouped into batches of `chunksize` rows.
+        """
+        reader = self._open_arrow_reader()
+        pending, pending_rows, start = [], 0, 0
+
+        def to_frame(table):
+            df = table.to_pandas()
+            df.index = pd.RangeIndex(start, start + len(df))
+            return df
+
+        for record_batch in self._read_arrow_batches(reader):
+            pending.append(record_batch)
+            pending_rows += record_batch.num_rows
+            if pending_rows < chunksize:
+                continue
+
+            table = pa.Table.from_batches(pending)
+            while len(table) >= chunksize:
+                yield to_frame(table.slice(0, chunksize))
+                table = table.slice(chunksize)
+                start += chunksize
+            pending, pending_rows = table.to_batches(), len(table)
+
+        if pending_rows or start == 0:
+            yield to_frame(pa.Table.from_batches(pending, schema=reader.schema))
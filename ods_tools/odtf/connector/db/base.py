@@ -1,5 +1,9 @@
+from contextlib import closing
 from typing import Any, Dict, Iterable
 
+import numpy as np
+import pandas as pd
+
 from ods_tools.odtf.connector import BaseConnector
 
 from .errors import DBQueryError
@@ -18,6 +22,9 @@ class BaseDBConnector(BaseConnector):
     * `password` - The password to use when connecting to the database
     * `select_statement` - sql query to read the data from
     * `insert_statement` - sql query to insert the data from
+    * `output_table` - The table the data is loaded into (default: `output`)
+    * `commit_interval` - Number of batches loaded between commits, by
+      default the whole load is committed once at the end
     """
 
     name = "BaseDB Connector"
@@ -80,13 +87,19 @@ class BaseDBConnector(BaseConnector):
     }
     sql_params_output = "qmark"
 
+    #: SQL column types of the output table by pandas dtype kind, other
+    #: dtypes are stored as `sql_text_type`
+    sql_column_types = {"i": "INTEGER", "u": "INTEGER", "b": "INTEGER", "f": "REAL"}
+    sql_text_type = "TEXT"
+
     def __init__(self, config, **options):
         super().__init__(config, **options)
 
         self.database = config['database']
-        if self.database['output_table'] is None:
+        if self.database.get('output_table') is None:
             self.database['output_table'] = 'output'
         self.sql_statement_path = config["database"]["sql_statement_path"]
+        self.commit_interval = self.database.get('commit_interval')
 
     def _create_connection(self, database: Dict[str, str]):
         raise NotImplementedError()
@@ -95,6 +108,61 @@ class BaseDBConnector(BaseConnector):
         cur = conn.cursor()
         return cur
 
+    def _get_server_side_cursor(self, conn, batch_size: int):
+        """
+        Cursor streaming the selected rows from the database as they are
+        fetched. DB API cursors of sqlite3 and pyodbc already stream the
+        results, drivers which buffer the whole result set on the client
+        override this.
+
+        :param conn: The database connection
+        :param batch_size: Number of rows fetched at a time
+
+        :return: Cursor
+        """
+        return self._get_cursor(conn)
+
+    def _fetch_batches(self, batch_size: int):
+        """
+        Run the select statement and fetch the rows `batch_size` at a time
+        from a server side cursor so the result set is never held in memory
+        at once.
+
+        :param batch_size: Number of rows per batch
+
+        :yield: Column names and rows of each batch
+        """
+        select_sql = self._get_select_statement()
+
+        with closing(self._create_connection(self.database)) as conn:
+            select_sql = self._get_projected_select_statement(conn, select_sql)
+            cur = self._get_server_side_cursor(conn, batch_size)
+            try:
+                cur.execute(select_sql)
+                rows = cur.fetchmany(batch_size)
+            except Exception as e:
+                raise DBQueryError(select_sql, e)
+
+            # named cursors only describe the columns once rows are fetched
+            columns = [col[0] for col in cur.description]
+            yield columns, rows
+            while rows:
+                rows = cur.fetchmany(batch_size)
+                if rows:
+                    yield columns, rows
+            cur.close()
+
+    def fetch_data(self, batch_size: int) -> Iterable[pd.DataFrame]:
+        """
+        Fetch data from the database in batches.
+
+        :param batch_size: Number of rows per batch
+
+        :yield: Data batches as pandas DataFrames
+        """
+        for columns, rows in self._fetch_batches(batch_size):
+            yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
     def _get_select_statement(self) -> str:
         """
         SQL string to select the data from the DB
@@ -106,6 +174,44 @@ class BaseDBConnector(BaseConnector):
 
         return select_statement
 
+    @staticmethod
+    def _quote_identifier(name):
+        return '"{}"'.format(name.replace('"', '""'))
+
+    def _get_projected_select_statement(self, conn, select_sql):
+        """
+        SQL string selecting only the columns the mapping reads from the
+        result of the select statement. The columns of the result are found
+        with a query returning no rows, the select statement is used as it is
+        if it can't be queried as a subquery.
+
+        :param conn: The database connection
+        :param select_sql: The select statement
+        :return: Sql statement
+        """
+        if self.mapper is None:
+            return select_sql
+
+        source_sql = select_sql.strip().rstrip(';')
+        cur = self._get_cursor(conn)
+        try:
+            cur.execute(f"SELECT * FROM ({source_sql}) AS odtf_source WHERE 1 = 0")
+            source_columns = [col[0] for col in cur.description]
+        except Exception:
+            conn.rollback()
+            return select_sql
+        finally:
+            cur.close()
+
+        input_columns = self.mapper.get_input_columns()
+        selected = [column for column in source_columns if column in input_columns]
+        # the rows are still read when the mapping doesn't read any column
+        if not selected or len(selected) == len(source_columns):
+            return select_sql
+
+        columns_sql = ", ".join(self._quote_identifier(column) for column in selected)
+        return f"SELECT {columns_sql} FROM ({source_sql}) AS odtf_source"
+
     def _get_insert_statements(self, columns):
         """
         SQL string(s) to insert the data into the DB
@@ -113,39 +219,99 @@ class BaseDBConnector(BaseConnector):
         :return: Sql statements
         """
         columns_sql = ', '.join(columns)
-        placeholders = ', '.join(f':{col}' for col in columns)
-        return f"INSERT INTO output ({columns_sql}) VALUES ({placeholders});"
-
-    def _create_table(self, row):
-        def infer_sql_type(value):
-            if isinstance(value, int):
-                return "INTEGER"
-            elif isinstance(value, float):
-                return "REAL"
-            else:
-                return "TEXT"
+        placeholder = "?" if self.sql_params_output == "qmark" else "%s"
+        placeholders = ', '.join(placeholder for _ in columns)
+        return f"INSERT INTO {self.database['output_table']} ({columns_sql}) VALUES ({placeholders});"
+
+    def _create_table(self, batch):
+        """
+        SQL string to create the output table with the column types of the
+        batch dtypes
 
-        types = {col: infer_sql_type(value) for col, value in row.items()}
-        columns = ", ".join(f"{col} {types[col]}" for col in row)
+        :param batch: The first batch loaded
+        :return: Sql statement
+        """
+        columns = ", ".join(
+            f"{col} {self.sql_column_types.get(dtype.kind, self.sql_text_type)}"
+            for col, dtype in batch.dtypes.items()
+        )
         return f"CREATE TABLE IF NOT EXISTS {self.database['output_table']} ({columns});"
 
-    def load(self, generator):
-        first_row = next(generator)
+    @staticmethod
+    def _cast_to_table(batch, column_kinds):
+        """
+        Cast a batch to the column types of the output table. The runner
+        fills nulls with empty strings, so a numeric column with nulls in a
+        later batch than the one the table was created from comes as object
+        dtype, and an int column with nulls as floats. Empty strings and nans
+        in the numeric and boolean columns are turned into nulls and the
+        columns cast back to the type of the table, ints are cast to nullable
+        ints so they aren't written as floats.
+
+        :param batch: The batch to insert
+        :param column_kinds: Dtype kind of each column the table was created with
+        :return: The cast batch
+        """
+        cast_columns = {}
+        for col, values in batch.items():
+            kind = column_kinds.get(col)
+            if kind not in ("i", "u", "f", "b") or values.dtype.kind == kind:
+                cast_columns[col] = values
+                continue
+
+            values = values.replace("", np.nan)
+            if kind == "b":
+                cast_columns[col] = values.astype("boolean")
+            else:
+                values = pd.to_numeric(values)
+                cast_columns[col] = values.astype("float64") if kind == "f" else values.astype("Int64")
+        return pd.DataFrame(cast_columns, index=batch.index)
+
+    def _bulk_insert(self, cur, batch):
+        """
+        Insert a batch into the output table. The default inserts the rows
+        with a single `executemany` call, connectors override this with the
+        fastest native bulk path of the database.
+
+        :param cur: Cursor of the load connection
+        :param batch: The batch to insert
+        """
+        columns = [col.astype(object).where(col.notna(), None).tolist() for _, col in batch.items()]
+        cur.executemany(self._get_insert_statements(batch.columns), list(zip(*columns)))
 
-        create_sql = self._create_table(first_row)
-        insert_sql = self._get_insert_statements(first_row.keys())
+    def load(self, batches):
+        """
+        Load the transformed batches into the output table with the bulk
+        insert of the connector. The table is created from the dtypes of the
+        first non empty batch and the later batches are cast to the types of
+        the table. The load is committed every
+        `commit_interval` batches, or once at the end if it isn't set.
 
+        :param batches: Iterable of transformed batches
+        """
         conn = self._create_connection(self.database)
         with conn:
-            try:
-                cur = conn.cursor()
-                cur.execute("DROP TABLE IF EXISTS output")
-                cur.execute(create_sql)
-                cur.execute(insert_sql, first_row)
-                cur.executemany(insert_sql, generator)
+            cur = self._get_cursor(conn)
+            column_kinds = None
+            uncommitted_batches = 0
+            for batch in batches:
+                if batch.empty:
+                    continue
 
-            except Exception as e:
-                raise DBQueryError("Insert/Create Table", e, first_row)
+                try:
+                    if column_kinds is None:
+                        cur.execute(f"DROP TABLE IF EXISTS {self.database['output_table']}")
+                        cur.execute(self._create_table(batch))
+                        column_kinds = {col: dtype.kind for col, dtype in batch.dtypes.items()}
+                    self._bulk_insert(cur, self._cast_to_table(batch, column_kinds))
+
+                except Exception as e:
+                    raise DBQueryError("Insert/Create Table", e, batch.iloc[0].to_dict())
+
+                uncommitted_batches += 1
+                if self.commit_interval and uncommitted_batches >= self.commit_interval:
+                    conn.commit()
+                    uncommitted_batches = 0
 
     def row_to_dict(self, row):
         """
@@ -155,17 +321,7 @@ class BaseDBConnector(BaseConnector):
         """
         return dict(row)
 
-    def extract(self) -> Iterable[Dict[str, Any]]:
-        select_sql = self._get_select_statement()
-        conn = self._create_connection(self.database)
-
-        with conn:
-            cur = self._get_cursor(conn)
-            try:
-                cur.execute(select_sql)
-            except Exception as e:
-                raise DBQueryError(select_sql, e)
-
-            rows = cur.fetchall()
+    def extract(self, batch_size: int = 10000) -> Iterable[Dict[str, Any]]:
+        for _, rows in self._fetch_batches(batch_size):
             for row in rows:
                 yield self.row_to_dict(row)
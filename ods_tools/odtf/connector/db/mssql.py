@@ -1,6 +1,5 @@
 from typing import Dict
 
-import pandas as pd
 import pyodbc
 
 from .base import BaseDBConnector
@@ -14,6 +13,8 @@ class SQLServerConnector(BaseDBConnector):
 
     name = "SQL Server Connector"
     driver = "{ODBC Driver 17 for SQL Server}"
+    sql_column_types = {"i": "BIGINT", "u": "BIGINT", "b": "BIT", "f": "FLOAT"}
+    sql_text_type = "NVARCHAR(MAX)"
 
     def _create_connection(self, database: Dict[str, str]):
         """
@@ -41,18 +42,14 @@ class SQLServerConnector(BaseDBConnector):
 
         return conn
 
-    def fetch_data(self, batch_size: int):
+    def _bulk_insert(self, cur, batch):
         """
-        Fetch data from the database in batches.
+        Insert a batch into the output table with pyodbc `fast_executemany`,
+        which sends the rows in bulk parameter arrays instead of one round
+        trip per row.
 
-        :param batch_size: Number of rows per batch
-
-        :yield: Data batches as pandas DataFrames
+        :param cur: Cursor of the load connection
+        :param batch: The batch to insert
         """
-
-        with open(self.sql_statement_path, 'r') as file:
-            sql_query = file.read()
-
-        with self._create_connection(self.database) as conn:
-            for batch in pd.read_sql(sql_query, conn, chunksize=batch_size):
-                yield batch
+        cur.fast_executemany = True
+        super()._bulk_insert(cur, batch)
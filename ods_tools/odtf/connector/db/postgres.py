@@ -1,6 +1,6 @@
+import io
 from typing import Dict
 
-import pandas as pd
 import psycopg2
 import psycopg2.extras
 
@@ -15,6 +15,7 @@ class PostgresConnector(BaseDBConnector):
 
     name = "Postgres Connector"
     sql_params_output = "pyformat"
+    sql_column_types = {"i": "BIGINT", "u": "BIGINT", "b": "BOOLEAN", "f": "DOUBLE PRECISION"}
 
     def _create_connection(self, database: Dict[str, str]):
         """
@@ -30,18 +31,35 @@ class PostgresConnector(BaseDBConnector):
 
         return conn
 
-    def fetch_data(self, batch_size: int):
+    def _get_server_side_cursor(self, conn, batch_size: int):
         """
-        Fetch data from the database in batches.
+        Named cursor, the rows are kept on the server and fetched
+        `batch_size` at a time instead of the whole result set being sent to
+        the client on execute.
 
-        :param batch_size: Number of rows per batch
+        :param conn: The database connection
+        :param batch_size: Number of rows fetched at a time
 
-        :yield: Data batches as pandas DataFrames
+        :return: Named cursor
         """
+        cur = conn.cursor(name="odtf_extract")
+        cur.itersize = batch_size
+        return cur
 
-        with open(self.sql_statement_path, 'r') as file:
-            sql_query = file.read()
+    def _bulk_insert(self, cur, batch):
+        """
+        Insert a batch into the output table with `COPY FROM STDIN`, the
+        batch is streamed to the server as csv.
+
+        :param cur: Cursor of the load connection
+        :param batch: The batch to insert
+        """
+        buffer = io.StringIO()
+        batch.to_csv(buffer, index=False, header=False, na_rep="\\N")
+        buffer.seek(0)
 
-        with self._create_connection(self.database) as conn:
-            for batch in pd.read_sql(sql_query, conn, chunksize=batch_size):
-                yield batch
+        columns_sql = ", ".join(batch.columns)
+        cur.copy_expert(
+            f"COPY {self.database['output_table']} ({columns_sql}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer,
+        )
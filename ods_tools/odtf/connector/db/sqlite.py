@@ -1,4 +1,3 @@
-import pandas as pd
 import sqlite3
 from sqlite3 import Error
 
@@ -59,18 +58,3 @@ class SQLiteConnector(BaseDBConnector):
 
         conn.row_factory = sqlite3.Row
         return conn
-
-    def fetch_data(self, batch_size):
-        """
-        Fetch data from the database in batches.
-
-        :param batch_size: Number of rows per batch
-
-        :yield: Data batches as pandas DataFrames
-        """
-        with open(self.sql_statement_path, 'r') as file:
-            sql_query = file.read()
-
-        with self._create_connection(self.database) as conn:
-            for batch in pd.read_sql(sql_query, conn, chunksize=batch_size):
-                yield batch
@@ -70,7 +70,7 @@ class Controller:
                 extractor_class: Type[BaseConnector] = self._load_from_module(
                     CONNECTOR_MAPPINGS[extractor_type]
                 )
-            extractor: BaseConnector = extractor_class(self.config, isExtractor=True)
+            extractor: BaseConnector = extractor_class(self.config, isExtractor=True, mapper=mapper)
 
             loader_type = self.config['output'].get("format", "csv")
             if loader_type in CONNECTOR_MAPPINGS:
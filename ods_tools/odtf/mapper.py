@@ -1,6 +1,6 @@
 import yaml
-from ods_tools.odtf.transformers.transform import parse
-from lark import Token
+from ods_tools.odtf.transformers.transform import compile_tree, parse
+from lark import Token, Tree
 from typing import NamedTuple
 from typing import Dict, Set
 
@@ -45,6 +45,27 @@ class Mapper:
 
         return Mapping(transformation_set, self.types, self.null_values)
 
+    def get_input_columns(self):
+        """Returns the input columns the mapping reads, extractors only need
+        to read these columns from the input data
+
+        Returns:
+            Set[str]: Columns referenced by the transformations, when clauses
+            and input validation
+        """
+        columns = set()
+        for _, col_transformation in self.transformations:
+            for individual_transform in col_transformation:
+                if individual_transform.transformation_tree is None or individual_transform.when_tree is None:
+                    individual_transform.parse()
+                columns |= self.referenced_columns(individual_transform.transformation_tree)
+                columns |= self.referenced_columns(individual_transform.when_tree)
+
+        for entry in ((self.validation or {}).get('input') or {}).values():
+            columns.update(entry.get('fields', []))
+            columns.update(entry.get('group_by') or [])
+        return columns
+
     def make_transforms(self, transforms):
         """Converts given file's transform section into transformation entry objects
 
@@ -72,6 +93,26 @@ class Mapper:
         for name, options in types.items():
             self.types[name] = ColumnConversion(options['type'], options.get('nullable', True), null_values)
 
+    @staticmethod
+    def referenced_columns(node):
+        """
+        Recursively collects the columns looked up in a node of the transformation tree.
+
+        Args:
+            node (Union[Tree, Token, int, None]): The node to collect the columns of.
+
+        Returns:
+            Set[str]: The names of the looked up columns.
+        """
+        if node is None or isinstance(node, int):
+            return set()
+        if isinstance(node, Token):
+            return {node.value} if node.type == 'IDENT' else set()
+        if node.data == 'lookup' and isinstance(node.children[0], Tree):
+            # lookup('name') of a column by string
+            return {child.value for child in node.children[0].children if isinstance(child, Token)}
+        return set().union(*(Mapper.referenced_columns(child) for child in node.children))
+
     @staticmethod
     def has_missing_columns(node, missing_columns):
         """
@@ -99,13 +140,29 @@ class TransformationEntry:
         self.transformation_tree = transformation_tree
         self.when = when
         self.when_tree = when_tree
+        self.transformation_plan = None
+        self.when_plan = None
 
     def __eq__(self, other):
         return self.transformation == other.transformation and self.when == other.when
 
+    def __getstate__(self):
+        # compiled plans are closures which can't be pickled, they are
+        # compiled again when the entry is parsed
+        state = self.__dict__.copy()
+        state['transformation_plan'] = None
+        state['when_plan'] = None
+        return state
+
     def parse(self):
+        """
+        Parses the transformation and when clause and compiles the trees
+        into the plans run on each batch
+        """
         self.transformation_tree = parse(self.transformation)
         self.when_tree = parse(self.when)
+        self.transformation_plan = compile_tree(self.transformation_tree)
+        self.when_plan = compile_tree(self.when_tree)
 
 
 class ColumnConversion(NamedTuple):
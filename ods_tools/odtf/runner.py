@@ -1,24 +1,31 @@
 import logging
 import json
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from operator import add, mul, sub, truediv
 from packaging import version
 from .transformers.transform_utils import (
-    AllWrapper, AnyWrapper, StrJoin, StrMatch, StrReplace, StrSearch, ConversionError,
+    AllWrapper, AnyWrapper, StrJoin, StrMatch, StrReplace, StrSearch,
     replace_double, replace_multiple, safe_lookup, logical_and_transformer, logical_or_transformer,
-    logical_not_transformer, not_in_transformer, in_transformer, type_converter
+    logical_not_transformer, not_in_transformer, in_transformer, series_type_converter
 )
 
 import pandas as pd
-from .transformers import run
 from .notset import NotSet, NotSetType
 from .validator import Validator
 
-from ods_tools.oed.common import pd_default_string
-
 if version.parse(pd.__version__) >= version.parse("2.1.9"):
     pd.set_option('future.no_silent_downcasting', True)
 logger = logging.getLogger(__name__)
 
+#: Marks the end of the extracted batches in the read queue
+_END_OF_BATCHES = object()
+
+#: Runner, mapper, validator and transformations of a transform worker process
+_worker_state = None
+
 
 class PandasRunner():
     """
@@ -28,20 +35,40 @@ class PandasRunner():
     name = "Pandas"
 
     row_value_conversions = {
-        "int": lambda col, nullable, null_values: col.astype(pd_default_string).apply(
-            type_converter((lambda v: int(float(v))), nullable, null_values),
-        ),
-        "float": lambda col, nullable, null_values: col.astype(pd_default_string).apply(
-            type_converter(float, nullable, null_values),
-        ),
-        "string": lambda col, nullable, null_values: col.astype(pd_default_string).apply(
-            type_converter(str, nullable, null_values),
-        ),
+        "int": lambda col, nullable, null_values: series_type_converter(col, "int", nullable, null_values),
+        "float": lambda col, nullable, null_values: series_type_converter(col, "float", nullable, null_values),
+        "string": lambda col, nullable, null_values: series_type_converter(col, "string", nullable, null_values),
     }
 
     def __init__(self, config):
         self.config = config
         self.logging = config.get('logging', False)
+        self.transformer_mapping = {
+            "logical_and": logical_and_transformer,
+            "logical_or": logical_or_transformer,
+            "logical_not": logical_not_transformer,
+            "is_in": in_transformer,
+            "not_in": not_in_transformer,
+            "any": lambda r, values: AnyWrapper(values),
+            "all": lambda r, values: AllWrapper(values),
+            "str_replace": StrReplace(),
+            "str_match": StrMatch(),
+            "str_search": StrSearch(),
+            "str_join": StrJoin(),
+            "add": lambda r, lhs, rhs: add(lhs, rhs),
+            "subtract": lambda r, lhs, rhs: sub(lhs, rhs),
+            "multiply": lambda r, lhs, rhs: mul(lhs, rhs),
+            "divide": lambda r, lhs, rhs: truediv(lhs, rhs),
+            "eq": lambda r, lhs, rhs: lhs == rhs,
+            "not_eq": lambda r, lhs, rhs: lhs != rhs,
+            "gt": lambda r, lhs, rhs: lhs > rhs,
+            "gte": lambda r, lhs, rhs: lhs >= rhs,
+            "lt": lambda r, lhs, rhs: lhs < rhs,
+            "lte": lambda r, lhs, rhs: lhs <= rhs,
+            "lookup": safe_lookup,
+            "replace_multiple": replace_multiple,
+            "replace_double": replace_double,
+        }
 
     def run(self, extractor, mapper, loader):
         """
@@ -58,50 +85,130 @@ class PandasRunner():
         Orchestrates the data transformation.
         It receives the data in batches from the extractor, calculates which
         transformations can be applied to it, applies them, and yields the
-        transformed rows.
+        transformed batches.
 
         :param extractor: The data extractor object (e.g., CSV or database connector).
         :param mapping: The mapping object defining transformations.
-        :return: An iterable of dictionaries, each representing a transformed row.
+        :return: An iterable of dataframes, each representing a transformed batch.
         """
-        validator = Validator(mapper.validation)
         batch_size = self.config.get('batch_size', 100000)
+        workers = self.config.get('workers', 1)
         total_rows = 0
-        transformation = None
 
         try:
-            for batch in extractor.fetch_data(batch_size):
-                # Calculates the set of transformations from the columns in the
-                # first batch (to avoid double-querying)
-                if transformation is None:
-                    available_columns = set(batch.columns)
-                    transformation = mapper.get_transform(available_columns=available_columns)
-                    self.log("Running transformation set [{extractor.name}]", "info")
-
-                try:
-                    validation = validator.run(self.coerce_df_types(batch, transformation.types), stage=0)
-                    self.log(validation, "warning")
-                except Exception as e:
-                    self.log(f"Validation failed: {e}", "warning")
-
-                batch = self.apply_transformation_set(batch, transformation)
-
-                try:
-                    validation = validator.run(batch, stage=1)
-                    self.log(validation, "warning")
-                except Exception as e:
-                    self.log(f"Validation failed: {e}", "warning")
+            if workers > 1:
+                transformed_batches = self.parallel_transform_batches(extractor.fetch_data(batch_size), mapper, workers)
+            else:
+                transformed_batches = self.transform_batches(extractor.fetch_data(batch_size), mapper)
 
+            for batch in transformed_batches:
                 # Log the transformation progress
                 total_rows += len(batch)
                 self.log(f"Processed {len(batch)} rows in the current batch (total: {total_rows})", "info")
 
-                yield from (r.to_dict() for idx, r in batch.iterrows())
+                yield batch
         except FileNotFoundError:
             logger.error(f"File not found: {extractor.file_path}")
         except Exception as e:
             logger.error(f"Error processing batch: {e}")
 
+    def transform_batches(self, batches, mapper):
+        """
+        Transforms the batches one after the other in this process.
+
+        :param batches: The batches from the extractor
+        :param mapper: The mapping object defining transformations.
+        :return: An iterable of the transformed batches
+        """
+        validator = Validator(mapper.validation)
+        transformation = None
+
+        for batch in batches:
+            # Calculates the set of transformations from the columns in the
+            # first batch (to avoid double-querying)
+            if transformation is None:
+                transformation = mapper.get_transform(available_columns=set(batch.columns))
+                self.log("Running transformation set", "info")
+
+            yield self.transform_batch(batch, transformation, validator)
+
+    def parallel_transform_batches(self, batches, mapper, workers):
+        """
+        Pipelines the extraction, transformation and loading of the batches.
+        A thread reads batches ahead into a bounded queue, the batches are
+        transformed in a pool of `workers` processes and the results are
+        yielded to the loader in the order the batches were read. At most
+        `2 * workers + 2` batches are held at any time: `workers` being
+        transformed or waiting for the loader, `workers` read ahead in the
+        queue, one read by the reader thread waiting for space in the queue
+        and one taken from the queue waiting to be submitted.
+
+        :param batches: The batches from the extractor
+        :param mapper: The mapping object defining transformations.
+        :param workers: Number of transform worker processes
+        :return: An iterable of the transformed batches
+        """
+        max_pending = workers
+        batches = iter(batches)
+        read_queue = queue.Queue(maxsize=workers)
+        stop_reading = threading.Event()
+        reader = threading.Thread(target=_read_batches, args=(batches, read_queue, stop_reading), daemon=True)
+
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_transform_worker,
+            initargs=(self.config, mapper),
+        )
+        pending = deque()
+        self.log(f"Running transformation set on {workers} workers", "info")
+        try:
+            # the first batch is submitted before the reader thread starts so
+            # that forked workers are started while no other thread is running
+            batch = next(batches, _END_OF_BATCHES)
+            if batch is not _END_OF_BATCHES:
+                pending.append(pool.submit(_transform_batch_in_worker, batch))
+                reader.start()
+                batch = read_queue.get()
+
+            while batch is not _END_OF_BATCHES:
+                if isinstance(batch, Exception):
+                    raise batch
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+                pending.append(pool.submit(_transform_batch_in_worker, batch))
+                batch = read_queue.get()
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            stop_reading.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def transform_batch(self, batch, transformation, validator):
+        """
+        Validates and transforms a single batch.
+
+        :param batch: The batch to transform
+        :param transformation: The transformation set for the batch columns
+        :param validator: The validator for the input and output data
+        :return: The transformed batch
+        """
+        try:
+            validation = validator.run(self.coerce_df_types(batch, transformation.types), stage=0)
+            self.log(validation, "warning")
+        except Exception as e:
+            self.log(f"Validation failed: {e}", "warning")
+
+        batch = self.apply_transformation_set(batch, transformation)
+
+        try:
+            validation = validator.run(batch, stage=1)
+            self.log(validation, "warning")
+        except Exception as e:
+            self.log(f"Validation failed: {e}", "warning")
+
+        return batch
+
     def apply_transformation_set(self, input_df, transformations):
         """
         Applies all the transformations to produce the output
@@ -155,37 +262,11 @@ class PandasRunner():
 
         :return: The transformation result
         """
-        transformer_mapping = {
-            "logical_and": logical_and_transformer,
-            "logical_or": logical_or_transformer,
-            "logical_not": logical_not_transformer,
-            "is_in": in_transformer,
-            "not_in": not_in_transformer,
-            "any": lambda r, values: AnyWrapper(values),
-            "all": lambda r, values: AllWrapper(values),
-            "str_replace": StrReplace(),
-            "str_match": StrMatch(),
-            "str_search": StrSearch(),
-            "str_join": StrJoin(),
-            "add": lambda r, lhs, rhs: add(lhs, rhs),
-            "subtract": lambda r, lhs, rhs: sub(lhs, rhs),
-            "multiply": lambda r, lhs, rhs: mul(lhs, rhs),
-            "divide": lambda r, lhs, rhs: truediv(lhs, rhs),
-            "eq": lambda r, lhs, rhs: lhs == rhs,
-            "not_eq": lambda r, lhs, rhs: lhs != rhs,
-            "gt": lambda r, lhs, rhs: lhs > rhs,
-            "gte": lambda r, lhs, rhs: lhs >= rhs,
-            "lt": lambda r, lhs, rhs: lhs < rhs,
-            "lte": lambda r, lhs, rhs: lhs <= rhs,
-            "lookup": safe_lookup,
-            "replace_multiple": replace_multiple,
-            "replace_double": replace_double,
-        }
+        if entry.when_plan is None or entry.transformation_plan is None:
+            entry.parse()
 
         # process the when clause to get a filter series
-        filter_series = run(
-            input_df, entry.when_tree or entry.when, transformer_mapping
-        )
+        filter_series = entry.when_plan(input_df, self.transformer_mapping)
 
         if isinstance(filter_series, pd.Series):
             # if we have a series treat it as a row mapping
@@ -200,58 +281,54 @@ class PandasRunner():
             self.log(f"A transformer when clause resolves to false in all cases ({entry.when}).", "warning")
             return NotSet
 
-        result = run(
-            filtered_input,
-            entry.transformation_tree or entry.transformation,
-            transformer_mapping,
-        )
+        result = entry.transformation_plan(filtered_input, self.transformer_mapping)
         if isinstance(result, pd.Series):
             return result
         else:
             return pd.Series(result, index=input_df.index)
 
     def coerce_df_types(self, df, conversions):
-        coerced_df = NotSet
+        """
+        Converts the columns of the dataframe to the types of the mapping.
+        Values which fail to convert are passed to `log_type_coercion_error`,
+        which raises by default so the batch is aborted. If it is overridden
+        to return instead, the failing rows are dropped from the result.
+
+        :param df: The dataframe to convert
+        :param conversions: The column conversions from the mapping
+
+        :return: The converted dataframe
+        """
+        coerced_columns = {}
+        bad_rows = pd.Series(False, index=df.index)
 
         for column in df.columns:
             conversion = conversions.get(column)
             if not conversion:
-                coerced_column = df[column]
-                bad_rows = None
-            else:
-                coerced_column = self.row_value_conversions[conversion.type](
-                    df[column],
-                    conversion.nullable,
-                    conversion.null_values,
-                )
-                bad_rows = coerced_column.apply(
-                    lambda v: isinstance(v, ConversionError),
+                coerced_columns[column] = df[column]
+                continue
+
+            coerced_columns[column], errors = self.row_value_conversions[conversion.type](
+                df[column],
+                conversion.nullable,
+                conversion.null_values,
+            )
+
+            # rows which already failed on a previous column aren't reported again
+            errors = errors[~bad_rows[errors.index]]
+            for idx, error in errors.items():
+                self.log_type_coercion_error(
+                    df.loc[idx].to_dict(),
+                    column,
+                    error.value,
+                    conversion.type,
+                    error.reason,
                 )
+            bad_rows[errors.index] = True
 
-                for error, (idx, entry) in zip(
-                    coerced_column[bad_rows], df[bad_rows].iterrows()
-                ):
-                    self.log_type_coercion_error(
-                        entry.to_dict(),
-                        column,
-                        error.value,
-                        conversion.type,
-                        error.reason,
-                    )
-
-                coerced_column = coerced_column[~bad_rows]
-
-            if isinstance(coerced_df, NotSetType):
-                coerced_df = coerced_column.to_frame(column)
-            else:
-                coerced_df[column] = coerced_column
-
-            # remove the bad rows from the input row and the coerced row
-            # so that no bad rows arent processed anymore and bad rows
-            # arent included in the final coerced value
-            if bad_rows is not None and len(bad_rows):
-                df = df[~bad_rows]
-                coerced_df = coerced_df[~bad_rows]  # type: ignore
+        coerced_df = pd.DataFrame(coerced_columns, index=df.index)
+        if bad_rows.any():
+            coerced_df = coerced_df[~bad_rows]
         return coerced_df
 
     def log(self, message, severity):
@@ -275,3 +352,44 @@ class PandasRunner():
             f"Reason: {reason}. Row: {json.dumps(row)}."
         )
         raise Exception
+
+
+def _read_batches(batches, read_queue, stop_reading):
+    """
+    Reads the extracted batches into the bounded read queue until all the
+    batches are read or the pipeline stops. Errors are passed on to the
+    queue to be raised by the pipeline.
+    """
+    def put(item):
+        while not stop_reading.is_set():
+            try:
+                read_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for batch in batches:
+            if not put(batch):
+                return
+    except Exception as e:
+        put(e)
+        return
+    put(_END_OF_BATCHES)
+
+
+def _init_transform_worker(config, mapper):
+    global _worker_state
+    _worker_state = (PandasRunner(config), mapper, Validator(mapper.validation), {})
+
+
+def _transform_batch_in_worker(batch):
+    runner, mapper, validator, transformations = _worker_state
+
+    # transformations depend on the batch columns, resolve them once per column set
+    columns = frozenset(batch.columns)
+    if columns not in transformations:
+        transformations[columns] = mapper.get_transform(available_columns=set(columns))
+
+    return runner.transform_batch(batch, transformations[columns], validator)
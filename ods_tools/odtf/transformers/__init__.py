@@ -1,6 +1,7 @@
-from .transform import run
+from .transform import compile_tree, run
 
 
 __all__ = [
+    "compile_tree",
     "run",
 ]
@@ -1,6 +1,6 @@
 import logging
 import re
-from functools import partial
+from functools import lru_cache, partial
 from typing import Any
 
 from lark import Transformer as _LarkTransformer
@@ -15,6 +15,18 @@ from .grammar import parser
 RowType = Any
 logger = logging.getLogger(__name__)
 
+#: Operations which are delegated to the transformer mapping
+MAPPED_OPERATIONS = {
+    "lookup", "add", "subtract", "multiply", "divide", "eq", "not_eq",
+    "is_in", "not_in", "gt", "gte", "lt", "lte", "logical_not",
+    "logical_or", "logical_and", "any", "all", "str_join", "str_replace",
+    "str_match", "str_search", "replace_multiple", "replace_double",
+}
+
+#: Rules which only depend on the expression so are evaluated once when
+#: the tree is compiled
+LITERAL_RULES = {"string", "regex", "iregex", "boolean", "null", "number"}
+
 
 @v_args(inline=True)
 class BaseTreeTransformer(_LarkTransformer):
@@ -22,6 +34,8 @@ class BaseTreeTransformer(_LarkTransformer):
     Tree transformer class without the transforms added
     """
 
+    string_escape_re = re.compile(r"`([`'])")
+
     def string(self, value=""):
         """
         Parses a string from the transformer language and performs any
@@ -83,9 +97,50 @@ def run(row, expression, transformer_mapping):
     if not isinstance(expression, (str, Tree)):
         return expression
 
-    return transform(
-        row, parse(expression), transformer_mapping=transformer_mapping
-    )
+    return compile_tree(parse(expression))(row, transformer_mapping)
+
+
+_literal_transformer = BaseTreeTransformer()
+
+
+def compile_tree(tree):
+    """
+    Compiles a parsed expression tree into a plan that can be run on any
+    number of rows without walking the tree or creating a transformer class
+    again. Literals (strings, regexes, numbers...) are evaluated once here.
+
+    :param tree: The parsed tree for the expression
+
+    :return: A function taking the row and the transformer mapping and
+        returning the transformation result
+    """
+    if not isinstance(tree, Tree):
+        return lambda row, transformer_mapping: tree
+
+    name = str(tree.data)
+    children = [compile_tree(child) for child in tree.children]
+
+    if name in LITERAL_RULES:
+        # literal children (e.g. the string of a regex) are constant too
+        value = getattr(_literal_transformer, name)(*(child(None, None) for child in children))
+        return lambda row, transformer_mapping: value
+
+    if name == "array":
+        def run_array(row, transformer_mapping):
+            return [child(row, transformer_mapping) for child in children]
+        return run_array
+
+    if name in MAPPED_OPERATIONS:
+        def run_operation(row, transformer_mapping):
+            return transformer_mapping[name](
+                row, *(child(row, transformer_mapping) for child in children)
+            )
+        return run_operation
+
+    # unknown rules are left as trees, as the lark transformer does
+    def run_tree(row, transformer_mapping):
+        return Tree(tree.data, [child(row, transformer_mapping) for child in children])
+    return run_tree
 
 
 def transform(row, tree, transformer_mapping):
@@ -115,6 +170,13 @@ def parse(expression):
     if not isinstance(expression, str):
         return expression
 
+    return _parse_expression(expression)
+
+
+@lru_cache(maxsize=None)
+def _parse_expression(expression):
+    # mappings repeat the same expressions (e.g. when clauses) many times,
+    # parsed trees are never modified so they can be shared
     try:
         return parser.parse(expression)
     except lark_exceptions.UnexpectedCharacters as e:
@@ -162,6 +224,5 @@ def create_transformer_class(row, transformer_mapping):
         replace_multiple = staticmethod(partial(mapped_function, "replace_multiple"))
         replace_double = staticmethod(partial(mapped_function, "replace_double"))
         array = v_args(inline=False)(list)
-        string_escape_re = re.compile(r"`([`'])")
 
     return TreeTransformer
@@ -1,10 +1,13 @@
 from lark import Token
+import numpy as np
 import pandas as pd
 from operator import and_, or_
 import re
-from functools import reduce, total_ordering
+from functools import lru_cache, reduce, total_ordering
 import math
 
+from ods_tools.oed.common import pd_default_string
+
 
 @total_ordering
 class GroupWrapper():
@@ -60,27 +63,53 @@ class AllWrapper(GroupWrapper):
         return reduce(and_, values, True)
 
 
+@lru_cache(maxsize=None)
+def _exact_match_pattern(pattern):
+    return re.compile(f'^{re.escape(pattern)}$')
+
+
+def _apply_distinct(series, fn):
+    """
+    Apply the series function `fn` to the distinct values of `series` and
+    broadcast the result back over the rows.
+    """
+    if series.dtype == object:
+        # equal values of different types, e.g. 1 and 1.0, are different strings,
+        # nulls are kept as nulls rather than becoming 'nan' or 'None'
+        series = series.map(str, na_action="ignore")
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    result = fn(pd.Series(uniques, dtype=series.dtype))
+    return pd.Series(result.to_numpy()[codes], index=series.index, dtype=result.dtype)
+
+
 class StrReplace:
     def __call__(self, row, target, *pattern_repl):
-        result = target
-        patterns = (re.compile(f'^{re.escape(p)}$') for i, p in enumerate(pattern_repl) if i % 2 == 0)
-        repls = (r for i, r in enumerate(pattern_repl) if i % 2 != 0)
+        patterns = [_exact_match_pattern(p) for p in pattern_repl[::2]]
+        repls = pattern_repl[1::2]
 
-        if isinstance(result, pd.Series):
-            result = result.map(str, na_action="ignore")
+        def replace_all(value):
+            for pattern, repl in zip(patterns, repls):
+                value = pattern.sub(repl, value)
+            return value
+
+        if isinstance(target, pd.Series):
+            result = target.map(str, na_action="ignore")
+            if not patterns or result.isna().all():
+                return result
+            if all(isinstance(repl, str) for repl in repls):
+                # the chain of exact match replacements is a single lookup per distinct value
+                return _apply_distinct(result, lambda values: values.map(replace_all, na_action="ignore"))
             for pattern, repl in zip(patterns, repls):
                 result = result.str.replace(pattern, repl, regex=True)
+            return result
         else:
-            for pattern, repl in zip(patterns, repls):
-                result = pattern.sub(repl, str(result))
-
-        return result
+            return replace_all(str(target))
 
 
 class StrMatch:
     def __call__(self, row, target, pattern: re.Pattern):
         if isinstance(target, pd.Series):
-            return target.astype(str).str.match(pattern)
+            return _apply_distinct(target, lambda values: values.astype(str).str.match(pattern))
         else:
             return default_match(row, target, pattern)
 
@@ -88,7 +117,7 @@ class StrMatch:
 class StrSearch:
     def __call__(self, row, target, pattern: re.Pattern):
         if isinstance(target, pd.Series):
-            return target.astype(str).str.contains(pattern)
+            return _apply_distinct(target, lambda values: values.astype(str).str.contains(pattern))
         else:
             return default_search(row, target, pattern)
 
@@ -137,6 +166,9 @@ def replace_multiple(row, target, source_sep, target_sep, *pattern_repl):
     """
     Transform location perils from source to target perils.
 
+    The perils are split, looked up and re-joined once per distinct value
+    of `target` rather than once per row.
+
     Args:
         row (RowType):
         target (_type_): values to be transformed
@@ -146,34 +178,28 @@ def replace_multiple(row, target, source_sep, target_sep, *pattern_repl):
     Returns:
         pd.Series: transformed values
     """
-    if isinstance(target, pd.Series):
-        perils = target.apply(lambda x: [p.strip() for p in str(x).split(source_sep.strip("'"))])
-    else:
+    if not isinstance(target, pd.Series):
         return target
 
-    # Create list of replacements
-    pattern_repl_list = list(zip(pattern_repl[::2], pattern_repl[1::2]))
-
-    def transform_peril(peril_list):
-        result = []
-        for peril in peril_list:
-            for pattern, repl in pattern_repl_list:
-                # Replace if our list of replacements contains the peril
-                if peril == pattern.strip("'"):
-                    result.append(repl.strip("'"))
-                    break
-            else:
-                result.append(peril)
-        return target_sep.strip("'").join(result)
+    # first replacement listed for a peril wins
+    replacements = {}
+    for pattern, repl in zip(pattern_repl[::2], pattern_repl[1::2]):
+        replacements.setdefault(pattern.strip("'"), repl.strip("'"))
 
-    result = perils.apply(transform_peril)
-    return result
+    codes, uniques = pd.factorize(target, use_na_sentinel=False)
+    perils = pd.Series([str(value) for value in uniques], dtype=object).str.split(source_sep.strip("'"), regex=False).explode().str.strip()
+    perils = perils.map(replacements).fillna(perils)
+    joined = perils.groupby(level=0).agg(target_sep.strip("'").join)
+    return pd.Series(joined.to_numpy()[codes], index=target.index, dtype=joined.dtype)
 
 
 def replace_double(row, first_column, second_column, *triplets):
     """
     Transform `target` values using two columns.
 
+    The mapping is looked up once per distinct pair of values rather than
+    once per row.
+
     Args:
         row (RowType): The row of data.
         first_column: A pd.Series column to be transformed.
@@ -182,20 +208,25 @@ def replace_double(row, first_column, second_column, *triplets):
     Returns:
         pd.Series: Transformed values.
     """
-    mappings = list(zip(triplets[::3], triplets[1::3], triplets[2::3]))
+    if not (isinstance(first_column, pd.Series) and isinstance(second_column, pd.Series)):
+        return first_column
+
+    # first mapping listed for a pair of values wins
+    mappings = {}
+    for from_val, via_val, to_val in zip(triplets[::3], triplets[1::3], triplets[2::3]):
+        mappings.setdefault((from_val.strip("'"), via_val.strip("'")), to_val.strip("'"))
 
-    if isinstance(first_column, pd.Series) and isinstance(second_column, pd.Series):
-        def apply_mapping(val, ctx):
-            for from_val, via_val, to_val in mappings:
-                if val == from_val.strip("'") and ctx == via_val.strip("'"):
-                    return to_val.strip("'")
-            return val
-        return pd.Series([
-            apply_mapping(val, ctx)
-            for val, ctx in zip(first_column, second_column)
-        ], index=first_column.index)
+    first_codes, first_uniques = pd.factorize(first_column, use_na_sentinel=False)
+    second_codes, second_uniques = pd.factorize(second_column, use_na_sentinel=False)
+    pair_codes, codes = np.unique(first_codes * len(second_uniques) + second_codes, return_inverse=True)
 
-    return first_column
+    def apply_mapping(pair_code):
+        val = first_uniques[pair_code // len(second_uniques)]
+        ctx = second_uniques[pair_code % len(second_uniques)]
+        return mappings.get((val, ctx), val)
+
+    mapped = pd.Series([apply_mapping(pair_code) for pair_code in pair_codes])
+    return pd.Series(mapped.to_numpy()[codes], index=first_column.index, dtype=mapped.dtype)
 
 
 def safe_lookup(r, name):
@@ -289,3 +320,79 @@ def type_converter(to_type, nullable, null_values):
             return ConversionError(value, e)
 
     return _converter
+
+
+SERIES_TYPE_CONVERTERS = {
+    "int": lambda v: int(float(v)),
+    "float": float,
+    "string": str,
+}
+
+
+def _is_numeric_input(series, null_values):
+    """
+    Whether the column already holds numbers which don't need parsing, i.e.
+    none of the null values could be the string form of one of its values.
+    """
+    if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return False
+    null_strings = pd.Series([v for v in null_values if isinstance(v, str)], dtype=object)
+    return pd.to_numeric(null_strings, errors="coerce").isna().all()
+
+
+def series_type_converter(series, to_type, nullable, null_values):
+    """
+    Vectorised `type_converter` for a whole column. Values are converted from
+    their string form, numbers are parsed with `pd.to_numeric` and only the
+    values it cannot parse are passed to `type_converter` to find the
+    conversion errors. Numeric columns, e.g. read with the types of the
+    mapping, are converted without going through their string form.
+
+    :param series: The column to convert
+    :param to_type: The type to convert to (`int`, `float` or `string`)
+    :param nullable: Whether null values are allowed
+    :param null_values: The values treated as null
+
+    :return: The converted column and a series of `ConversionError` for the
+        rows which failed to convert
+    """
+    numeric_input = to_type != "string" and _is_numeric_input(series, null_values)
+    text = None if numeric_input else series.astype(pd_default_string)
+    if not nullable:
+        null_mask = pd.Series(False, index=series.index)
+    elif numeric_input:
+        null_mask = series.isna()
+    else:
+        null_mask = text.isna() | text.isin(null_values)
+
+    if len(series) and null_mask.all():
+        return pd.Series([None] * len(series), index=series.index, dtype=object), pd.Series([], dtype=object)
+
+    if to_type == "string":
+        coerced = text.astype(str).where(~null_mask)
+        # missing values which aren't null are converted as they are
+        missing = coerced.isna() & ~null_mask
+        if missing.any():
+            coerced[missing] = text[missing].map(str)
+        return coerced, pd.Series([], dtype=object)
+
+    if numeric_input:
+        values = series.astype("float64")
+    else:
+        values = pd.to_numeric(text.where(~null_mask), errors="coerce").astype("float64")
+    unparsed = ~null_mask & values.isna()
+    if to_type == "int":
+        unparsed |= np.isinf(values)
+
+    converter = type_converter(SERIES_TYPE_CONVERTERS[to_type], nullable, null_values)
+    checked = series[unparsed].astype(pd_default_string).map(converter).astype(object)
+    is_error = checked.map(lambda v: isinstance(v, ConversionError)).astype(bool)
+    values[checked.index[~is_error]] = checked[~is_error].astype("float64")
+    values[checked.index[is_error]] = np.nan
+
+    if to_type == "int":
+        values = np.trunc(values)
+        if not null_mask.any() and not is_error.any():
+            values = values.astype("int64")
+
+    return values, checked[is_error]
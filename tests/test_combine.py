@@ -1,10 +1,13 @@
 from pathlib import Path
 import tempfile
+import json
 import pytest
 from collections import namedtuple
 import pandas as pd
 import numpy as np
+import pyarrow.parquet as pq
 from unittest import mock
+from scipy import stats
 
 from pandas.testing import assert_frame_equal
 
@@ -15,12 +18,20 @@ import sys
 sys.path.append(sys.path.pop(0))
 
 from ods_tools.combine.combine import DEFAULT_CONFIG, combine
-from ods_tools.combine.grouping import create_combine_group
-from ods_tools.combine.io import save_output
+from ods_tools.combine.grouping import create_combine_group, prepare_groupset_summaryinfo, prepare_summaryinfo_map
+from ods_tools.combine import io
+from ods_tools.combine.io import (detect_ord_output_format, load_loss_table_paths, load_melt, load_occurrence_index,
+                                  load_qelt, load_selt, read_occurrence_bin, save_output)
+from ods_tools.combine.benchmark import compare_benchmarks, run_benchmark
 from ods_tools.combine.output_generation import generate_alt, generate_ept
-from ods_tools.combine.common import GALT_dtype, GALT_schema, GEPT_dtype, GEPT_schema, GPLT_headers, GPQT_dtype, GPLT_dtype
+from ods_tools.combine.profiling import RUN_REPORT_FILE
+from ods_tools.combine.distributions import PARAMETRIC_DISTRIBUTIONS
+from ods_tools.combine.common import (GALT_dtype, GALT_schema, GEPT_dtype, GEPT_schema, GPLT_headers, GPQT_dtype, GPLT_dtype, GPLT_schema,
+                                      OUTPUTSET_GPLT_dtype)
 from ods_tools.combine.result import load_analysis_dirs
-from ods_tools.combine.sampling import generate_gpqt, generate_group_periods, do_loss_sampling
+from ods_tools.combine.synthetic import SyntheticORDConfig
+from ods_tools.combine.sampling import (OutputsetLossTable, generate_gpqt, generate_group_periods, do_loss_sampling,
+                                        mean_loss_sampling, quantile_loss_sampling, sample_loss_sampling)
 
 example_path = Path(Path(__file__).parent.parent, "ods_tools", "combine", "examples")
 expected_output_path = Path(Path(__file__).parent.parent, 'expected_output')
@@ -35,6 +46,14 @@ def assert_columns_equal(cols1, cols2):
     assert set(cols1) == set(cols2), f'Some columns are not shared: {set(cols1) ^ set(cols2)}'
 
 
+def assert_summaryinfo_map_equal(expected_summaryinfo_map, summaryinfo_map):
+    assert expected_summaryinfo_map.keys() == summaryinfo_map.keys()
+    for key, lookup in summaryinfo_map.items():
+        expected_lookup = np.arange(len(lookup))
+        expected_lookup[list(expected_summaryinfo_map[key].keys())] = list(expected_summaryinfo_map[key].values())
+        np.testing.assert_array_equal(expected_lookup, lookup)
+
+
 def test_combine__outputs_generated():
 
     input_dir = example_path / "inputs"
@@ -72,6 +91,101 @@ def test_combine__outputs_generated():
             assert (Path(tmp_output_dir) / output_path).exists()
 
 
+def test_combine__checkpoint_resume():
+    input_dir = example_path / "inputs"
+    config = DEFAULT_CONFIG | {
+        "analysis_dirs": [str(input_dir / i) for i in ['1', '2']],
+        "group_number_of_periods": TEST_GROUP_PERIODS,
+        "group_mean": True,
+        "group_alt": True,
+        "checkpoint": True
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_output_dir:
+        config['output_dir'] = tmp_output_dir
+        combine(**config)
+        checkpoint_files = sorted(p.name.split('_')[0] for p in (Path(tmp_output_dir) / 'checkpoints').iterdir())
+        assert checkpoint_files == ['gplt', 'gpqt', 'group']
+        expected_alt = pd.read_csv(Path(tmp_output_dir) / '0_galt.csv')
+
+        # output options only, resume from the gplt checkpoint
+        with mock.patch('ods_tools.combine.combine.generate_group_periods') as mock_periods, \
+                mock.patch('ods_tools.combine.combine.generate_gpqt') as mock_gpqt, \
+                mock.patch('ods_tools.combine.combine.do_outputset_loss_sampling') as mock_sampling:
+            combine(**(config | {"group_ept": True}))
+        mock_periods.assert_not_called()
+        mock_gpqt.assert_not_called()
+        mock_sampling.assert_not_called()
+        assert (Path(tmp_output_dir) / '0_gept.csv').exists()
+        assert_frame_equal(expected_alt, pd.read_csv(Path(tmp_output_dir) / '0_galt.csv'))
+
+        # loss sampling config changed, resume from the gpqt checkpoint
+        with mock.patch('ods_tools.combine.combine.generate_group_periods') as mock_periods, \
+                mock.patch('ods_tools.combine.combine.generate_gpqt') as mock_gpqt:
+            combine(**(config | {"group_format_priority": ['M']}))
+        mock_periods.assert_not_called()
+        mock_gpqt.assert_not_called()
+
+
+def test_combine__run_report():
+    input_dir = example_path / "inputs"
+    config = DEFAULT_CONFIG | {
+        "analysis_dirs": [str(input_dir / i) for i in ['1', '2']],
+        "group_number_of_periods": TEST_GROUP_PERIODS,
+        "group_secondary_uncertainty": True,
+        "group_alt": True
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_output_dir:
+        config['output_dir'] = tmp_output_dir
+        combine(**config)
+
+        with open(Path(tmp_output_dir) / RUN_REPORT_FILE) as f:
+            report = json.load(f)
+
+    assert report['status'] == 'complete'
+    steps = {step['name']: step for step in report['steps']}
+    for stage in ['stage_1_grouping', 'stage_2_period_sampling', 'stage_3_quantile_sampling',
+                  'stage_4_loss_sampling', 'stage_5_output_generation']:
+        assert steps[stage]['wall_time'] >= 0 and steps[stage]['cpu_time'] >= 0
+    assert steps['stage_3_quantile_sampling']['rows'] > 0
+    # steps repeated per outputset are recorded under the outputset they run for
+    assert len(steps) == len(report['steps'])
+    assert 'stage_4_loss_sampling/secondary_uncertainty/outputset_0/load_elt' in steps
+    assert 'stage_5_output_generation/groupset_0/write_galt' in steps
+    # the peak RSS of each step is its increase of the process peak, not the running maximum
+    assert all(step['peak_rss_delta_mb'] >= 0 for step in report['steps'])
+    assert sum(step['peak_rss_delta_mb'] for step in report['steps'] if '/' not in step['name']) <= report['peak_rss_mb']
+
+
+def test_combine__benchmark__synthetic_ord():
+    ord_config = SyntheticORDConfig(num_analyses=2, num_events=200, num_periods=100, num_summary_ids=4,
+                                    elt_formats=['MQS', 'Q'], output_format='parquet')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        report = run_benchmark(tmp_dir, ord_config, isolate=False)
+
+        analyses = load_analysis_dirs([Path(tmp_dir) / 'ord' / f'analysis_{i}' for i in [1, 2]])
+        occ_index = load_occurrence_index(analyses[1].path / 'input' / 'occurrence.bin')
+        qelt = load_qelt(analyses[2].path / 'output' / 'gul_S1_qelt.parquet')
+
+    assert occ_index.no_of_periods == 100
+    assert len(occ_index.event_ids) == 200
+    assert (qelt.groupby(['SummaryId', 'EventId']).size() == ord_config.num_quantiles).all()
+
+    assert report['combine_config']['group_mean'] is False
+    for stage in ['stage_2_period_sampling', 'stage_3_quantile_sampling', 'stage_4_loss_sampling']:
+        assert report['stages'][stage]['rows'] > 0
+        assert report['stages'][stage]['rows_per_sec'] > 0
+
+    assert compare_benchmarks(report, report) == []
+    slower = {'ord_config': report['ord_config'],
+              'stages': {'stage_4_loss_sampling': dict(report['stages']['stage_4_loss_sampling'], wall_time=1.0)}}
+    baseline = {'ord_config': report['ord_config'],
+                'stages': {'stage_4_loss_sampling': dict(report['stages']['stage_4_loss_sampling'], wall_time=0.5)}}
+    assert [r['metric'] for r in compare_benchmarks(slower, baseline)] == ['wall_time']
+
+
 def test_combine__load_analysis_dirs():
     parent_path = Path(__file__).parent.parent / 'ods_tools' / 'combine' / 'examples' / 'inputs'
     expected_analyses = {
@@ -95,6 +209,85 @@ def test_combine__load_analysis_dirs():
         assert analysis.path == expected_analysis['path']
 
 
+def test_combine__load_elt__parquet_matches_csv():
+    analyses = load_analysis_dirs([example_path / 'inputs/1'])
+    analysis = analyses[1]
+    csv_paths = load_loss_table_paths(analysis, summary_level_id=1, perspective='gul', output_type='elt')
+
+    assert detect_ord_output_format(Path(analysis.path) / 'output') == 'csv'
+    assert set(csv_paths.keys()) == {'melt', 'qelt', 'selt'}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_output_dir = Path(tmp_dir) / 'output'
+        tmp_output_dir.mkdir()
+        # PLT outputs alone do not make the ELTs parquet
+        pd.DataFrame({'Period': [1]}).to_parquet(tmp_output_dir / 'gul_S1_mplt.parquet', index=False)
+        assert detect_ord_output_format(tmp_output_dir) == 'csv'
+
+        for path in csv_paths.values():
+            pd.read_csv(path).to_parquet(tmp_output_dir / f'{path.stem}.parquet', index=False)
+
+        analysis.path = Path(tmp_dir)
+        parquet_paths = load_loss_table_paths(analysis, summary_level_id=1, perspective='gul', output_type='elt')
+
+        assert detect_ord_output_format(tmp_output_dir) == 'parquet'
+        assert set(parquet_paths.keys()) == {'melt', 'qelt', 'selt'}
+
+        for key, load_func in [('melt', load_melt), ('qelt', load_qelt), ('selt', load_selt)]:
+            assert_frame_equal(load_func(csv_paths[key]), load_func(parquet_paths[key]))
+
+
+def test_combine__load_occurrence_index():
+    occ_path = example_path / 'inputs' / '1' / 'input' / 'occurrence.bin'
+    occ_arr, no_of_periods = read_occurrence_bin(occ_path)
+    expected_pairs = (pd.DataFrame(occ_arr)[['event_id', 'period_no']]
+                      .drop_duplicates()
+                      .sort_values(by=['event_id', 'period_no'], ignore_index=True))
+
+    occ_index = load_occurrence_index(occ_path)
+    event_ids, periods = occ_index.event_period_pairs()
+
+    assert occ_index.no_of_periods == no_of_periods
+    np.testing.assert_array_equal(occ_index.periods, np.unique(occ_arr['period_no']))
+    np.testing.assert_array_equal(event_ids, expected_pairs['event_id'])
+    np.testing.assert_array_equal(periods, expected_pairs['period_no'])
+
+
+def test_combine__occurrence_index__expand_periods():
+    occ_path = example_path / 'inputs' / '1' / 'input' / 'occurrence.bin'
+    occ_index = load_occurrence_index(occ_path)
+    event_ids, periods = occ_index.event_period_pairs()
+    eventid_period = pd.DataFrame({'EventId': event_ids, 'Period': periods})
+
+    query_periods = np.array([3, 1, 1, occ_index.no_of_periods + 10, 0, 999])
+    expected = (pd.DataFrame({'row_idx': np.arange(len(query_periods)), 'Period': query_periods})
+                .merge(eventid_period, on='Period', how='inner')
+                .sort_values(by=['row_idx', 'EventId'], ignore_index=True))
+
+    row_idx, event_ids = occ_index.expand_periods(query_periods)
+
+    np.testing.assert_array_equal(row_idx, expected['row_idx'])
+    np.testing.assert_array_equal(event_ids, expected['EventId'])
+
+
+def test_combine__load_occurrence_index__cached():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        occ_paths = [Path(tmp_dir) / f'occurrence_{i}.bin' for i in range(2)]
+        for occ_path in occ_paths:
+            occ_path.write_bytes((example_path / 'inputs' / '1' / 'input' / 'occurrence.bin').read_bytes())
+
+        with mock.patch.object(io, 'read_occurrence_bin', wraps=io.read_occurrence_bin) as mock_read:
+            first = load_occurrence_index(occ_paths[0])
+            assert load_occurrence_index(occ_paths[0]) is first
+            load_occurrence_index(occ_paths[1])
+            assert mock_read.call_count == 2
+
+            # modified file is parsed again
+            occ_paths[0].write_bytes(occ_paths[0].read_bytes()[:-12])
+            assert load_occurrence_index(occ_paths[0]) is not first
+            assert mock_read.call_count == 3
+
+
 # Grouping tests
 
 @pytest.fixture()
@@ -137,9 +330,7 @@ def test_combine__groupset_and_summaryinfo(prepared_group_example):
 
     summaryinfo_map = prepared_group_example.summaryinfo_map
 
-    assert expected_summaryinfo_map.keys() == summaryinfo_map.keys()
-    for outputset_id, curr_summaryinfo_map in summaryinfo_map.items():
-        assert expected_summaryinfo_map[outputset_id] == curr_summaryinfo_map
+    assert_summaryinfo_map_equal(expected_summaryinfo_map, summaryinfo_map)
 
 
 def test_combine__groupset_and_summaryinfo__group_fill_perspective():
@@ -176,9 +367,49 @@ def test_combine__groupset_and_summaryinfo__group_fill_perspective():
 
     summaryinfo_map = group.summaryinfo_map
 
-    assert expected_summaryinfo_map.keys() == summaryinfo_map.keys()
-    for outputset_id, curr_summaryinfo_map in summaryinfo_map.items():
-        assert expected_summaryinfo_map[outputset_id] == curr_summaryinfo_map
+    assert_summaryinfo_map_equal(expected_summaryinfo_map, summaryinfo_map)
+
+
+def test_combine__groupset_summaryinfo__multi_column_keys():
+    outputset_summaryinfo = {
+        0: pd.DataFrame({'summary_id': [1, 2, 3],
+                         'AccNumber': ['B', 'A', 'A'],
+                         'LocNumber': [1, 2, 1],
+                         'tiv': [1.0, 2.0, 3.0]}),
+        1: pd.DataFrame({'summary_id': [1, 2, 3],
+                         'AccNumber': ['A', 'B', None],
+                         'LocNumber': [1, 1, 3],
+                         'tiv': [10.0, 20.0, 30.0]}),
+    }
+    groupset = {0: {'outputsets': [0, 1]}}
+
+    groupset_summaryinfo = prepare_groupset_summaryinfo(groupset, outputset_summaryinfo)
+
+    # rows with a missing summary field are dropped, SummaryIds follow the sorted summary fields
+    expected_summaryinfo = pd.DataFrame({'SummaryId': [1, 2, 3],
+                                         'AccNumber': ['A', 'A', 'B'],
+                                         'LocNumber': [1, 2, 1],
+                                         'tiv': [13.0, 2.0, 21.0]})
+    assert_frame_equal(groupset_summaryinfo[0], expected_summaryinfo, check_dtype=False)
+
+    summaryinfo_map = prepare_summaryinfo_map(outputset_summaryinfo, groupset_summaryinfo, groupset)
+    assert_summaryinfo_map_equal({(0, 0): {1: 3, 2: 2, 3: 1}, (0, 1): {2: 3}}, summaryinfo_map)
+
+
+def test_combine__groupset_summaryinfo__wide_keys():
+    # enough distinct values across the columns to overflow a single int64 key without re-ranking
+    rng = np.random.default_rng(0)
+    summary_cols = [f'field_{i}' for i in range(8)]
+    summaryinfo = pd.DataFrame({col: rng.integers(0, 300, size=400) for col in summary_cols})
+    summaryinfo = pd.concat([summaryinfo, summaryinfo.iloc[:100]], ignore_index=True)
+    summaryinfo.insert(0, 'summary_id', np.arange(1, len(summaryinfo) + 1))
+    summaryinfo['tiv'] = 1.0
+
+    groupset_summaryinfo = prepare_groupset_summaryinfo({0: {'outputsets': [0]}}, {0: summaryinfo})
+
+    expected_keys = summaryinfo[summary_cols].drop_duplicates().sort_values(summary_cols).reset_index(drop=True)
+    assert_frame_equal(groupset_summaryinfo[0][summary_cols], expected_keys, check_dtype=False)
+    assert groupset_summaryinfo[0]['SummaryId'].tolist() == list(range(1, len(expected_keys) + 1))
 
 
 def test_combine__groupeventset(prepared_group_example):
@@ -237,6 +468,23 @@ def test_combine__generate_gpqt(prepared_group_example,
     assert_columns_equal(expected_gpqt.columns, gpqt.columns)
 
 
+@pytest.mark.parametrize('correlation', [None, 0.5, 1.0])
+def test_combine__generate_gpqt__correlation(prepared_group_example, correlation):
+    group_period = pd.read_csv(validation_path / 'group_periods.csv')
+    expected_gpqt = pd.read_csv(validation_path / 'gpqt.csv', dtype=GPQT_dtype)
+
+    gpqt = generate_gpqt(group_period, prepared_group_example, correlation=correlation)
+
+    assert expected_gpqt.shape == gpqt.shape
+    assert gpqt['Quantile'].between(0, 1).all()
+
+    n_quantiles = gpqt.groupby(['groupeventset_id', 'GroupPeriod', 'EventId'], observed=True)['Quantile'].nunique()
+    if correlation == 1.0:
+        assert (n_quantiles == 1).all()
+    else:
+        assert (n_quantiles > 1).any()
+
+
 def test_combine__loss_sampling(prepared_group_example,
                                 keep_output):
     gpqt = pd.read_csv(validation_path / 'gpqt.csv').astype(dtype=GPQT_dtype)
@@ -255,6 +503,225 @@ def test_combine__loss_sampling(prepared_group_example,
     assert_frame_equal(expected_gplt[GPLT_headers], gplt[GPLT_headers], check_categorical=False)
 
 
+def test_combine__mean_loss_sampling():
+    melt = pd.DataFrame({
+        'SummaryId': [1, 1, 2, 2, 1],
+        'EventId': [5, 7, 5, 7, 9],
+        'SampleType': [2, 2, 2, 1, 2],
+        'MeanLoss': [20., 10., 5., 50., 1.],
+        'SDLoss': [10., 0., 2., 5., 1.],
+        'MaxLoss': [100., 50., 0., 100., 10.]
+    }).astype({'MeanLoss': 'f4', 'SDLoss': 'f4', 'MaxLoss': 'f4'})
+    gpqt = pd.DataFrame({
+        'GroupPeriod': [1, 2, 3],
+        'EventId': [5, 7, 5],
+        'Quantile': [0.25, 0.5, 0.75]
+    }).astype({'Quantile': 'f4'})
+
+    gplt, skip_records = mean_loss_sampling(gpqt, melt)
+    gplt = gplt.sort_values(by=['SummaryId', 'GroupPeriod'], ignore_index=True)
+
+    mu, sigma = np.float32(0.2), np.float32(0.1)
+    alpha = mu * (mu * (1 - mu) / sigma ** 2 - 1)
+    beta = alpha * (1 / mu - 1)
+    expected_loss = 100 * stats.beta.ppf([0.25, 0.75], alpha, beta)
+
+    assert gplt[['GroupPeriod', 'EventId', 'SummaryId']].values.tolist() == [[1, 5, 1], [2, 7, 1], [3, 5, 1], [1, 5, 2], [3, 5, 2]]
+    np.testing.assert_allclose(gplt['Loss'].iloc[[0, 2]], expected_loss, rtol=1e-5)
+    assert gplt['Loss'].iloc[1] == 10.  # zero SDLoss defaults to MeanLoss
+    assert (gplt['Loss'].iloc[3:] == 5.).all()  # zero MaxLoss defaults to MeanLoss
+    assert (gplt['LossType'] == 2).all()
+    assert len(skip_records) == 3
+
+
+@pytest.mark.parametrize("distribution", ['beta', 'gamma', 'lognormal', 'truncated_normal'])
+def test_combine__parametric_distributions(distribution):
+    quantile = np.array([0.1, 0.5, 0.9, 0.999, 0.5, 0.5])
+    mean_loss = np.array([20., 20., 20., 20., 5., 0.])
+    sd_loss = np.array([10., 10., 10., 10., 0., 0.])
+    max_loss = np.array([100., 100., 100., 40., 100., 100.])
+
+    loss = PARAMETRIC_DISTRIBUTIONS[distribution](quantile, mean_loss, sd_loss, max_loss)
+
+    mu, sigma = mean_loss[0], sd_loss[0]
+    if distribution == 'beta':
+        a = (mu / 100) * ((mu / 100) * (1 - mu / 100) / (sigma / 100) ** 2 - 1)
+        expected = 100 * stats.beta.ppf(quantile[:3], a, a * (100 / mu - 1))
+    elif distribution == 'gamma':
+        expected = stats.gamma.ppf(quantile[:3], (mu / sigma) ** 2, scale=sigma ** 2 / mu)
+    elif distribution == 'lognormal':
+        s = np.sqrt(np.log1p((sigma / mu) ** 2))
+        expected = stats.lognorm.ppf(quantile[:3], s, scale=mu * np.exp(-s ** 2 / 2))
+    else:
+        expected = stats.truncnorm.ppf(quantile[:3], -mu / sigma, (100 - mu) / sigma, loc=mu, scale=sigma)
+
+    np.testing.assert_allclose(loss[:3], expected, rtol=1e-6)
+    assert 0 <= loss[3] <= 40  # bounded by MaxLoss
+    assert loss[4] == 5. and loss[5] == 0.  # default to MeanLoss without uncertainty
+
+
+@pytest.mark.parametrize("distribution", ['beta', 'gamma', 'lognormal', 'truncated_normal'])
+def test_combine__parametric_distributions__interleaved_invalid_rows(distribution):
+    # rows without uncertainty between sampled rows, scipy 1.17 gammaincinv and ndtr ignore `where=` masks
+    quantile = np.array([0.1, 0.5, 0.3, 0.9, 0.5, 0.7, 0.2])
+    mean_loss = np.array([20., 5., 30., 25., 0., 10., 7.])
+    sd_loss = np.array([10., 0., 12., 5., 0., 4., np.nan])
+    max_loss = np.full(len(quantile), 100.)
+    valid = np.array([True, False, True, True, False, True, False])
+
+    loss = PARAMETRIC_DISTRIBUTIONS[distribution](quantile, mean_loss, sd_loss, max_loss)
+    valid_loss = PARAMETRIC_DISTRIBUTIONS[distribution](quantile[valid], mean_loss[valid], sd_loss[valid], max_loss[valid])
+
+    np.testing.assert_array_equal(loss[valid], valid_loss)
+    np.testing.assert_array_equal(loss[~valid], mean_loss[~valid])
+
+
+def test_combine__quantile_loss_sampling():
+    qelt = pd.DataFrame({
+        'SummaryId': [2, 2, 2, 1, 1, 1, 1, 1, 1],
+        'EventId': [5, 5, 5, 5, 5, 5, 7, 7, 7],
+        'LTQuantile': [0.0, 0.5, 1.0, 1.0, 0.0, 0.5, 0.0, 0.5, 1.0],
+        'QuantileLoss': [0., 10., 30., 200., 0., 100., 0., 40., 50.]
+    }).astype({'LTQuantile': 'f4', 'QuantileLoss': 'f4'})
+    gpqt = pd.DataFrame({
+        'GroupPeriod': [1, 2, 3, 4],
+        'EventId': [5, 7, 5, 9],
+        'Quantile': [0.25, 0.75, 0.75, 0.5]
+    }).astype({'Quantile': 'f4'})
+
+    gplt, skip_records = quantile_loss_sampling(gpqt, qelt)
+    gplt = gplt.sort_values(by=['SummaryId', 'GroupPeriod'], ignore_index=True)
+
+    expected_gplt = pd.DataFrame({
+        'GroupPeriod': [1, 2, 3, 1, 3],
+        'EventId': [5, 7, 5, 5, 5],
+        'SummaryId': [1, 1, 1, 2, 2],
+        'Loss': [50., 45., 150., 5., 20.]
+    })
+
+    assert_frame_equal(expected_gplt, gplt[['GroupPeriod', 'EventId', 'SummaryId', 'Loss']], check_dtype=False)
+    assert (gplt['LossType'] == 2).all()
+    assert len(skip_records) == 3
+
+
+def test_combine__sample_loss_sampling():
+    selt = pd.DataFrame({
+        'SummaryId': [1, 1, 1, 1, 2, 2],
+        'EventId': [5, 5, 5, 7, 5, 5],
+        'SampleId': [1, 2, 4, 3, 1, 2],
+        'SampleLoss': [30., 10., 20., 5., 2., 1.]
+    }).astype({'SampleLoss': 'f4'})
+    gpqt = pd.DataFrame({
+        'GroupPeriod': [1, 2, 3, 4],
+        'EventId': [5, 7, 5, 9],
+        'Quantile': [0.05, 0.95, 0.55, 0.5]
+    }).astype({'Quantile': 'f4'})
+
+    gplt, skip_records = sample_loss_sampling(gpqt, selt, number_of_samples=4)
+    gplt = gplt.sort_values(by=['SummaryId', 'GroupPeriod'], ignore_index=True)
+
+    # with 4 samples, missing samples are zero losses ranked first
+    expected_gplt = pd.DataFrame({
+        'GroupPeriod': [1, 2, 3, 1, 3],
+        'EventId': [5, 7, 5, 5, 5],
+        'SummaryId': [1, 1, 1, 2, 2],
+        'Loss': [0., 5., 20., 0., 1.]
+    })
+
+    assert_frame_equal(expected_gplt, gplt[['GroupPeriod', 'EventId', 'SummaryId', 'Loss']], check_dtype=False)
+    assert len(skip_records) == 3
+
+
+def test_combine__loss_sampling__format_fallback_skips_sampled_records():
+    gpqt = pd.DataFrame({
+        'GroupPeriod': [1, 2],
+        'EventId': [5, 7],
+        'Quantile': [0.5, 0.5]
+    }).astype({'Quantile': 'f4'})
+    qelt = pd.DataFrame({
+        'SummaryId': [1, 1, 2, 2],
+        'EventId': [5, 5, 7, 7],
+        'LTQuantile': [0.0, 1.0, 0.0, 1.0],
+        'QuantileLoss': [0., 10., 0., 20.]
+    }).astype({'LTQuantile': 'f4', 'QuantileLoss': 'f4'})
+    selt = pd.DataFrame({
+        'SummaryId': [1, 2, 2, 3],
+        'EventId': [5, 7, 7, 5],
+        'SampleId': [1, 1, 2, 1],
+        'SampleLoss': [100., 100., 200., 300.]
+    }).astype({'SampleLoss': 'f4'})
+
+    q_gplt, skip_records = quantile_loss_sampling(gpqt, qelt)
+    s_gplt, skip_records = sample_loss_sampling(gpqt, selt, skip_records, number_of_samples=1)
+
+    assert q_gplt['Loss'].tolist() == [5., 10.]
+    assert s_gplt[['SummaryId', 'EventId', 'Loss']].values.tolist() == [[3, 5, 300.]]
+    assert len(skip_records) == 3
+
+    # all records already sampled
+    assert sample_loss_sampling(gpqt, selt, skip_records, number_of_samples=1) == (None, skip_records)
+
+
+def test_combine__outputset_loss_table__groupset_views():
+    analyses = load_analysis_dirs([example_path / 'inputs/1', example_path / 'inputs/2',
+                                   example_path / 'inputs/3'])
+    group, _ = create_combine_group(analyses, group_fill_perspectives=True,
+                                    groupeventset_fields=DEFAULT_CONFIG['group_event_set_fields'])
+
+    # outputsets 1 and 3 are in groupsets 1 and 3, outputset 3 summary ids are realigned
+    compact_gplt = pd.DataFrame({
+        'outputset_id': [1, 3, 3, 0],
+        'groupeventset_id': 0,
+        'GroupPeriod': [1, 2, 3, 4],
+        'SummaryId': [2, 1, 5, 1],
+        'EventId': [10, 11, 12, 13],
+        'LossType': 1,
+        'Loss': [1., 2., 3., 4.]
+    }).astype(OUTPUTSET_GPLT_dtype)
+    gplt = OutputsetLossTable(compact_gplt, group)
+
+    full_gplt = gplt.to_frame()
+    assert full_gplt['groupset_id'].tolist() == [1, 3, 1, 3, 1, 3, 0, 2]
+    assert full_gplt['SummaryId'].tolist() == [3, 3, 2, 2, 8, 8, 1, 1]
+
+    for groupset_id in gplt.groupset_ids:
+        expected = full_gplt[full_gplt['groupset_id'] == groupset_id].reset_index(drop=True)
+        assert_frame_equal(expected, gplt.get_groupset(groupset_id), check_categorical=False)
+
+
+def test_combine__save_output__partitions():
+    gplt = pd.read_csv(validation_path / 'gplt.csv').astype(dtype=GPLT_dtype)[GPLT_headers]
+    shuffled_gplt = gplt.sample(frac=1, random_state=1).reset_index(drop=True)
+
+    with tempfile.TemporaryDirectory() as tmp_output_dir:
+        tmp_output_dir = Path(tmp_output_dir)
+        save_output(shuffled_gplt, tmp_output_dir, 'gplt', output_type='csv', schema=GPLT_schema)
+        save_output(shuffled_gplt, tmp_output_dir, 'gplt', output_type='parquet', row_group_size=1000)
+
+        for groupset_id in [0, 1]:
+            expected = shuffled_gplt[shuffled_gplt['groupset_id'] == groupset_id].reset_index(drop=True)
+            csv_gplt = pd.read_csv(tmp_output_dir / f'{groupset_id}_gplt.csv').astype(GPLT_dtype)
+            assert_frame_equal(expected, csv_gplt, check_categorical=False)
+
+            partition_path = tmp_output_dir / 'gplt' / f'groupset_id={groupset_id}' / 'part-0.parquet'
+            parquet_file = pq.ParquetFile(partition_path)
+            assert parquet_file.metadata.num_row_groups == -(-len(expected) // 1000)
+            parquet_gplt = parquet_file.read().to_pandas()
+            # integer categoricals are read back as integers
+            expected = expected.drop(columns='groupset_id').astype({'groupeventset_id': 'int64', 'LossType': 'int64'})
+            assert_frame_equal(expected, parquet_gplt, check_dtype=False)
+
+        dataset_gplt = pd.read_parquet(tmp_output_dir / 'gplt')
+        assert len(dataset_gplt) == len(gplt)
+        assert set(dataset_gplt['groupset_id'].astype(int)) == {0, 1}
+
+        # a rerun replaces the partitions of the earlier run, appended partitions are added to them
+        save_output(gplt[gplt['groupset_id'] == 1], tmp_output_dir, 'gplt', output_type='parquet')
+        assert set(pd.read_parquet(tmp_output_dir / 'gplt')['groupset_id'].astype(int)) == {1}
+        save_output(gplt[gplt['groupset_id'] == 0], tmp_output_dir, 'gplt', output_type='parquet', append=True)
+        assert len(pd.read_parquet(tmp_output_dir / 'gplt')) == len(gplt)
+
+
 def test_combine__output_generation(keep_output):
     gplt = pd.read_csv(validation_path / 'gplt.csv').astype(dtype=GPLT_dtype)
     groupset_ids = [0, 1]
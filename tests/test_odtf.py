@@ -3,12 +3,21 @@ import numpy as np
 import pandas as pd
 import pandas.testing as pdt
 import pathlib
+import re
 import yaml
 import pytest
 import os
 import sqlite3
+from unittest import mock
 
 from ods_tools.odtf.controller import transform_format
+from ods_tools.odtf.errors import ConverterError
+from ods_tools.odtf.connector import CsvConnector
+from ods_tools.odtf.connector.db import PostgresConnector, SQLiteConnector
+from ods_tools.odtf.mapper import ColumnConversion, Mapper
+from ods_tools.odtf.runner import PandasRunner
+from ods_tools.odtf.transformers.transform import compile_tree, parse, transform
+from ods_tools.odtf.transformers.transform_utils import StrMatch, StrReplace, replace_double, replace_multiple
 
 base_test_path = pathlib.Path(__file__).parent
 example_path = pathlib.Path(pathlib.Path(__file__).parent.parent, "ods_tools", "odtf", "examples")
@@ -125,3 +134,360 @@ def test_simple_transform_no_config():
 
     pd.testing.assert_frame_equal(output_df, expected_output_df)
     os.remove(output_file_path)
+
+
+@pytest.mark.parametrize("quoting", ["minimal", "all"])
+def test_csv_loader_writes_batches(quoting):
+    batches = [
+        pd.DataFrame({"AccNumber": ["A1", "A2"], "LocPerilsCovered": ["WTC;WSS", "QQ1"], "BuildingTIV": [1.5, 2.0]}),
+        pd.DataFrame({"AccNumber": ["A3"], "LocPerilsCovered": ["WW1, WW2"], "BuildingTIV": [3.25]}),
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = pathlib.Path(tmp_dir, "output.csv")
+        loader = CsvConnector({"output": {"path": str(output_path), "quoting": quoting}}, isExtractor=False)
+        loader.load(iter(batches))
+
+        with open(output_path) as f:
+            lines = f.read().splitlines()
+        output_df = pd.read_csv(output_path)
+
+    assert len(lines) == 4
+    if quoting == "all":
+        assert lines[0] == '"AccNumber","LocPerilsCovered","BuildingTIV"'
+    else:
+        assert lines[0] == 'AccNumber,LocPerilsCovered,BuildingTIV'
+        assert lines[3] == 'A3,"WW1, WW2",3.25'
+    pd.testing.assert_frame_equal(output_df, pd.concat(batches, ignore_index=True))
+
+
+@pytest.mark.parametrize("expression", [
+    "Input_int_1 + 100",
+    "Input_int_1 * 2 - Input_int_2 / 3",
+    "Input_string_1 is in ['A', 'B', 'Null'] and Input_int_1 gt 10",
+    "not Input_int_1 is 20",
+    "join('-', Input_string_1, Input_int_1)",
+    "replace(Input_string_1, 'A', 'B', 'C', 'D')",
+    "match(Input_string_1, re'[a-c]')",
+    "search(Input_string_1, ire'B')",
+    "any [Input_int_1, Input_int_2] is 10",
+    "True",
+    "''",
+])
+def test_compiled_transformation_matches_tree_transform(expression):
+    input_df = pd.DataFrame({
+        "Input_int_1": [10, 20, 30],
+        "Input_int_2": [1, 2, 3],
+        "Input_string_1": ["A", "b'c", "Null"],
+    })
+    transformer_mapping = PandasRunner({}).transformer_mapping
+    tree = parse(expression)
+
+    expected = transform(input_df, tree, transformer_mapping)
+    result = compile_tree(tree)(input_df, transformer_mapping)
+
+    if isinstance(expected, pd.Series):
+        pd.testing.assert_series_equal(result, expected)
+    else:
+        assert result == expected
+
+
+def test_replace_multiple_and_double_map_repeated_values():
+    perils = pd.Series(["WTC;WSS", " WTC ; ORF", np.nan, "WTC;WSS", "EQ"], index=[5, 6, 7, 8, 9])
+    result = replace_multiple(None, perils, "';'", "','", "'WTC'", "'WW1'", "'WSS'", "'WW2'", "'WTC'", "'ZZ1'")
+    pd.testing.assert_series_equal(
+        result, pd.Series(["WW1,WW2", "WW1,ORF", "nan", "WW1,WW2", "EQ"], index=perils.index), check_dtype=False)
+
+    # multi-character separators are literal, not regular expressions
+    result = replace_multiple(None, pd.Series(["A||B", "A. B"]), "'||'", "';'", "'A'", "'X'")
+    pd.testing.assert_series_equal(result, pd.Series(["X;B", "A. B"]), check_dtype=False)
+    result = replace_multiple(None, pd.Series(["A. B", "AxB"]), "'. '", "';'", "'A'", "'X'")
+    pd.testing.assert_series_equal(result, pd.Series(["X;B", "AxB"]), check_dtype=False)
+
+    values = pd.Series(["1", "1", "2", "2", np.nan])
+    contexts = pd.Series(["A", "B", "B", "B", "A"])
+    result = replace_double(None, values, contexts, "'1'", "'A'", "'10'", "'2'", "'B'", "'20'", "'1'", "'A'", "'99'")
+    pd.testing.assert_series_equal(result, pd.Series(["10", "1", "20", "20", np.nan]), check_dtype=False)
+
+
+def test_str_replace_and_match_over_repeated_values():
+    target = pd.Series([1, 2, 3, 1, np.nan, 2], index=[4, 5, 6, 7, 8, 9])
+    # replacements are applied in order, so 1 -> 2 -> 3
+    result = StrReplace()(None, target, "1.0", "2.0", "2.0", "3.0", "A", "B")
+    pd.testing.assert_series_equal(
+        result, pd.Series(["3.0", "3.0", "3.0", "3.0", np.nan, "3.0"], index=target.index), check_dtype=False)
+    # nulls stay null so a following transformation entry is used for them
+    result = StrReplace()(None, pd.Series(["A", None, "B", np.nan], dtype=object), "A", "X")
+    assert result.tolist()[::2] == ["X", "B"] and result.isna().tolist() == [False, True, False, True]
+
+    mixed = pd.Series(["5", 5, 5.0, None, "5"], dtype=object)
+    result = StrMatch()(None, mixed, re.compile("5$"))
+    pd.testing.assert_series_equal(result, pd.Series([True, True, False, False, True]))
+
+
+def test_coerce_df_types_reports_failing_rows():
+    input_df = pd.DataFrame({
+        "Input_int": ["1", "2.7", "x", "NULL", "4"],
+        "Input_float": ["1.5", "", "2", "3", "y"],
+        "Input_string": [1, 2, 3, 4, np.nan],
+    })
+    conversions = {
+        "Input_int": ColumnConversion("int", True, ["", "NULL"]),
+        "Input_float": ColumnConversion("float", True, ["", "NULL"]),
+        "Input_string": ColumnConversion("string", True, ["", "NULL"]),
+    }
+
+    with mock.patch.object(PandasRunner, "log_type_coercion_error") as log_error:
+        coerced_df = PandasRunner({}).coerce_df_types(input_df, conversions)
+
+    assert [(c.args[1], c.args[2]) for c in log_error.call_args_list] == [("Input_int", "x"), ("Input_float", "y")]
+    assert log_error.call_args_list[0].args[0] == input_df.loc[2].to_dict()
+
+    expected_df = pd.DataFrame({
+        "Input_int": [1.0, 2.0, np.nan],
+        "Input_float": [1.5, np.nan, 3.0],
+        "Input_string": ["1.0", "2.0", "4.0"],
+    }, index=[0, 1, 3])
+    pd.testing.assert_frame_equal(coerced_df, expected_df, check_dtype=False)
+
+    # by default the first failing value aborts the batch
+    with pytest.raises(Exception):
+        PandasRunner({}).coerce_df_types(input_df, conversions)
+
+
+def test_parallel_transform_matches_sequential():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_paths = {}
+        for workers in [1, 2]:
+            config_file_path = pathlib.Path(tmp_dir, f'config_{workers}.yaml')
+            with open(config_file_path, 'w') as config_file:
+                yaml.dump({
+                    "input": {"path": str(pathlib.Path(base_test_path, 't_input.csv'))},
+                    "output": {"path": str(pathlib.Path(tmp_dir, f't_output_{workers}.csv'))},
+                    "mapping": {"path": str(pathlib.Path(base_test_path, 'mapping_test.yaml'))},
+                    "batch_size": 3,
+                    "workers": workers,
+                }, config_file)
+            output_paths[workers] = transform_format(str(config_file_path))
+
+        with open(output_paths[1]) as sequential, open(output_paths[2]) as parallel:
+            sequential_output = sequential.read()
+            assert len(sequential_output.splitlines()) == 11
+            assert parallel.read() == sequential_output
+
+
+def test_parallel_transform_bounds_batches_held():
+    workers = 2
+    mapper = Mapper(pathlib.Path(base_test_path, 'mapping_test.yaml'))
+    input_df = pd.read_csv(pathlib.Path(base_test_path, 't_input.csv'))
+    read_count = 0
+
+    def batches():
+        nonlocal read_count
+        for _ in range(20):
+            read_count += 1
+            yield input_df
+
+    held = []
+    for yielded, _ in enumerate(PandasRunner({}).parallel_transform_batches(batches(), mapper, workers)):
+        held.append(read_count - yielded)
+
+    assert len(held) == 20
+    assert max(held) <= 2 * workers + 2
+
+
+def test_pyarrow_csv_engine_matches_pandas():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_paths = {}
+        for engine in ["pandas", "pyarrow"]:
+            config_file_path = pathlib.Path(tmp_dir, f'config_{engine}.yaml')
+            with open(config_file_path, 'w') as config_file:
+                yaml.dump({
+                    "input": {"path": str(pathlib.Path(base_test_path, 't_input.csv')), "engine": engine},
+                    "output": {"path": str(pathlib.Path(tmp_dir, f't_output_{engine}.csv'))},
+                    "mapping": {"path": str(pathlib.Path(base_test_path, 'mapping_test.yaml'))},
+                    "batch_size": 4,
+                }, config_file)
+            output_paths[engine] = transform_format(str(config_file_path))
+
+        with open(output_paths["pandas"]) as pandas_output, open(output_paths["pyarrow"]) as pyarrow_output:
+            expected_output = pandas_output.read()
+            assert len(expected_output.splitlines()) == 11
+            assert pyarrow_output.read() == expected_output
+
+
+def test_pyarrow_csv_engine_reads_mapping_types():
+    mapper = Mapper(pathlib.Path(base_test_path, 'mapping_test.yaml'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = pathlib.Path(tmp_dir, 'input.csv')
+        input_path.write_text("Input_int_1,Input_string_1,Unmapped\n1,NULL,2024-01-01\n,7,x\n3,a,\n<NA>,None,\n")
+        extractor = CsvConnector({"input": {"path": str(input_path), "engine": "pyarrow"}}, isExtractor=True, mapper=mapper)
+
+        batches = list(extractor.fetch_data(2))
+
+        # a value which isn't a number names the column and file it was read from
+        input_path.write_text("Input_int_1,Input_string_1\n1,a\nx,b\n")
+        with pytest.raises(ConverterError, match=f"Input_int_1 of {re.escape(str(input_path))}"):
+            list(extractor.fetch_data(2))
+
+    assert [len(batch) for batch in batches] == [2, 2]
+    assert list(batches[1].index) == [2, 3]
+    data = pd.concat(batches)
+    assert data["Input_int_1"].dtype == np.float64
+    assert data["Input_int_1"].isna().tolist() == [False, True, False, True]
+    assert data["Input_string_1"].tolist()[1:3] == ["7", "a"]
+    # the null values pandas reads by default are null for both engines
+    assert data["Input_string_1"].isna().tolist() == [True, False, False, True]
+    # columns the mapping doesn't read aren't extracted
+    assert "Unmapped" not in data
+
+
+def test_db_extractor_fetches_batches():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = pathlib.Path(tmp_dir, 'input.db')
+        sql_path = pathlib.Path(tmp_dir, 'select.sql')
+        sql_path.write_text("SELECT * FROM location")
+        input_df = pd.DataFrame({"LocNumber": [1, 2, 3, 4, 5], "CountryCode": ["GB", None, "US", "FR", "DE"]})
+        with sqlite3.connect(input_path) as conn:
+            input_df.to_sql("location", conn, index=False)
+
+        extractor = SQLiteConnector({
+            "input": {"path": str(input_path)},
+            "database": {"output_table": None, "sql_statement_path": str(sql_path)},
+        }, isExtractor=True)
+        batches = list(extractor.fetch_data(2))
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    pd.testing.assert_frame_equal(pd.concat(batches, ignore_index=True), input_df)
+
+
+def test_postgres_extractor_streams_from_named_cursor():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sql_path = pathlib.Path(tmp_dir, 'select.sql')
+        sql_path.write_text("SELECT * FROM location")
+        extractor = PostgresConnector({"database": {"output_table": None, "sql_statement_path": str(sql_path)}}, isExtractor=True)
+
+        conn = mock.MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.description = [("LocNumber",), ("CountryCode",)]
+        cursor.fetchmany.side_effect = [[(1, "GB"), (2, "US")], [(3, "FR")], []]
+        with mock.patch.object(PostgresConnector, "_create_connection", return_value=conn):
+            batches = list(extractor.fetch_data(2))
+
+    conn.cursor.assert_called_once_with(name="odtf_extract")
+    assert cursor.itersize == 2
+    assert [c.args for c in cursor.fetchmany.call_args_list] == [(2,), (2,), (2,)]
+    assert [batch["LocNumber"].tolist() for batch in batches] == [[1, 2], [3]]
+    conn.close.assert_called_once()
+
+
+def test_db_loader_creates_table_from_batch_dtypes():
+    batches = [
+        pd.DataFrame({"LocNumber": [1, 2], "BuildingTIV": [1.5, np.nan], "CountryCode": ["GB", None]}),
+        pd.DataFrame({"LocNumber": pd.Series([], dtype="int64"), "BuildingTIV": [], "CountryCode": []}),
+        pd.DataFrame({"LocNumber": [3], "BuildingTIV": [2.0], "CountryCode": ["US"]}),
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = pathlib.Path(tmp_dir, 'output.db')
+        loader = SQLiteConnector({
+            "output": {"path": str(output_path)},
+            "database": {"output_table": "location", "sql_statement_path": None, "commit_interval": 1},
+        }, isExtractor=False)
+        loader.load(batches)
+
+        with sqlite3.connect(output_path) as conn:
+            columns = conn.execute("PRAGMA table_info(location)").fetchall()
+            rows = conn.execute("SELECT * FROM location").fetchall()
+
+    assert [(col[1], col[2]) for col in columns] == [("LocNumber", "INTEGER"), ("BuildingTIV", "REAL"), ("CountryCode", "TEXT")]
+    assert rows == [(1, 1.5, "GB"), (2, None, None), (3, 2.0, "US")]
+
+
+def test_postgres_loader_copies_batches():
+    loader = PostgresConnector({"database": {"output_table": None, "sql_statement_path": None}}, isExtractor=False)
+    batch = pd.DataFrame({"LocNumber": [1, 2], "BuildingTIV": [1.5, np.nan], "CountryCode": ["GB", None]})
+
+    conn = mock.MagicMock()
+    cursor = conn.cursor.return_value
+    copied = []
+    cursor.copy_expert.side_effect = lambda sql, buffer: copied.append((sql, buffer.read()))
+    with mock.patch.object(PostgresConnector, "_create_connection", return_value=conn):
+        loader.load([batch])
+
+    assert cursor.execute.call_args_list[1].args[0] == (
+        "CREATE TABLE IF NOT EXISTS output (LocNumber BIGINT, BuildingTIV DOUBLE PRECISION, CountryCode TEXT);"
+    )
+    assert copied == [(
+        "COPY output (LocNumber, BuildingTIV, CountryCode) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        "1,1.5,GB\n2,\\N,\\N\n",
+    )]
+
+
+def test_db_loaders_cast_later_batches_to_table_types():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        mapping_path = pathlib.Path(tmp_dir, 'mapping.yaml')
+        with open(mapping_path, 'w') as mapping_file:
+            yaml.dump({
+                "types": {"TIV": {"type": "float"}, "N": {"type": "int"}, "Name": {"type": "string"}},
+                "null_values": ["''", "Null", "NULL"],
+                "transform": {column: [{"transformation": column}] for column in ["TIV", "N", "Name"]},
+            }, mapping_file)
+        mapper = Mapper(mapping_path)
+
+        # the table is created from the first batch, the nulls of the later batch are filled by the runner
+        input_batches = [
+            pd.DataFrame({"TIV": [1.5, 2.0], "N": [1, 2], "Name": ["a", "b"]}),
+            pd.DataFrame({"TIV": [np.nan, 3.0], "N": [3, np.nan], "Name": ["c", "d"]}),
+        ]
+        batches = list(PandasRunner({}).transform_batches(iter(input_batches), mapper))
+
+        output_path = pathlib.Path(tmp_dir, 'output.db')
+        SQLiteConnector({
+            "output": {"path": str(output_path)},
+            "database": {"output_table": "location", "sql_statement_path": None},
+        }, isExtractor=False).load(batches)
+        with sqlite3.connect(output_path) as conn:
+            rows = conn.execute("SELECT TIV, N, Name, typeof(TIV), typeof(N) FROM location").fetchall()
+
+    assert rows == [
+        (1.5, 1, "a", "real", "integer"),
+        (2.0, 2, "b", "real", "integer"),
+        (None, 3, "c", "null", "integer"),
+        (3.0, None, "d", "real", "null"),
+    ]
+
+    conn = mock.MagicMock()
+    copied = []
+    conn.cursor.return_value.copy_expert.side_effect = lambda sql, buffer: copied.append(buffer.read())
+    loader = PostgresConnector({"database": {"output_table": None, "sql_statement_path": None}}, isExtractor=False)
+    with mock.patch.object(PostgresConnector, "_create_connection", return_value=conn):
+        loader.load(batches)
+
+    assert copied == ["1,a,1.5\n2,b,2.0\n", "3,c,\\N\n\\N,d,3.0\n"]
+
+
+@pytest.mark.parametrize("input_format", ["pandas", "pyarrow", "sqlite"])
+def test_extractors_read_only_mapping_columns(input_format):
+    mapper = Mapper(pathlib.Path(base_test_path, 'mapping_test.yaml'))
+    input_df = pd.read_csv(pathlib.Path(base_test_path, 't_input.csv'))
+    input_df.insert(2, "Unused", "x")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if input_format == "sqlite":
+            input_path = pathlib.Path(tmp_dir, 'input.db')
+            sql_path = pathlib.Path(tmp_dir, 'select.sql')
+            sql_path.write_text("SELECT * FROM location;\n")
+            with sqlite3.connect(input_path) as conn:
+                input_df.to_sql("location", conn, index=False)
+            extractor = SQLiteConnector({
+                "input": {"path": str(input_path)},
+                "database": {"output_table": None, "sql_statement_path": str(sql_path)},
+            }, isExtractor=True, mapper=mapper)
+        else:
+            input_path = pathlib.Path(tmp_dir, 'input.csv')
+            input_df.to_csv(input_path, index=False)
+            extractor = CsvConnector({"input": {"path": str(input_path), "engine": input_format}}, isExtractor=True, mapper=mapper)
+
+        batches = list(extractor.fetch_data(100))
+
+    assert list(batches[0].columns) == [column for column in input_df.columns if column != "Unused"]
+    assert len(batches[0]) == len(input_df)